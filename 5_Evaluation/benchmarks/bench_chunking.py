@@ -0,0 +1,68 @@
+"""
+Benchmark of the chunking stage: character heuristic vs exact token counting.
+
+Reports chunking throughput with the `len(text) // 4` heuristic and with tiktoken
+(cold and warm token cache), and how far the heuristic chunks overshoot CHUNK_SIZE
+in real tokens.
+
+    uv run python 5_Evaluation/benchmarks/bench_chunking.py
+"""
+
+import json
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.ingestion import CHUNK_SIZE, create_splitter, faq_to_document  # noqa: E402
+from utils.tokens import ENCODING_NAME, count_tokens, get_encoding  # noqa: E402
+
+PATH_DATA = Path(__file__).parent.parent / "data" / "faq_en.json"
+
+
+def time_chunking(splitter, documents) -> tuple[float, list]:
+    start_time = perf_counter()
+    chunks = splitter.split_documents(documents)
+    return perf_counter() - start_time, chunks
+
+
+def describe(chunks) -> str:
+    # Measured without the memoized function so the statistics do not warm its cache
+    encoding = get_encoding(ENCODING_NAME)
+    sizes = sorted(len(encoding.encode(chunk.page_content)) for chunk in chunks)
+    over = sum(size > CHUNK_SIZE for size in sizes)
+    return (
+        f"{len(chunks)} chunks, real tokens max {sizes[-1]} / median {sizes[len(sizes) // 2]}, "
+        f"{over} over {CHUNK_SIZE}"
+    )
+
+
+def main():
+    with open(PATH_DATA, "r") as f:
+        documents = [faq_to_document(faq) for faq in json.load(f)]
+    get_encoding(
+        ENCODING_NAME
+    )  # Encoder loading is a one-off cost, keep it out of the timings
+
+    approx_time, approx_chunks = time_chunking(create_splitter(), documents)
+    token_splitter = create_splitter(encoding_name=ENCODING_NAME)
+    count_tokens.cache_clear()
+    cold_time, token_chunks = time_chunking(token_splitter, documents)
+    warm_time, _ = time_chunking(token_splitter, documents)
+
+    print(
+        f"approx (len // 4)     {len(documents) / approx_time:8.0f} docs/s  {describe(approx_chunks)}"
+    )
+    print(
+        f"tiktoken (cold cache) {len(documents) / cold_time:8.0f} docs/s  x{cold_time / approx_time:.2f} slower  "
+        f"{describe(token_chunks)}"
+    )
+    print(
+        f"tiktoken (warm cache) {len(documents) / warm_time:8.0f} docs/s  x{warm_time / approx_time:.2f} slower"
+    )
+    print(f"token cache: {count_tokens.cache_info()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of the text cleaning stage.
+
+Checks that `clean_text` gives exactly the same output as the original three-pass
+cleaning on the FAQ corpus (and on tricky markdown), then compares their speed.
+
+    uv run python 5_Evaluation/benchmarks/bench_cleaning.py
+"""
+
+import json
+import sys
+from pathlib import Path
+from timeit import repeat
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.cleaning import clean_text, clean_text_reference, clean_texts  # noqa: E402
+
+PATH_DATA = Path(__file__).parent.parent / "data" / "faq_en.json"
+CORPUS_REPEAT = 20
+N_REPEAT = 5
+
+EDGE_CASES = [
+    "",
+    "no markdown at all",
+    "**bold** and *italic* and ***both***",
+    "[link](https://example.com) and ![image](https://example.com/a.png)",
+    "[**bold link**](https://example.com/*path*)",
+    "[see ![img](u)](url)",
+    "[a]![i](u)(b)",
+    "[x](y![i](u)",
+    "![a ![b](c)](d)",
+    "[[a](b)](c)",
+    "[a]*(b)",
+    "[unclosed link](https://example.com",
+    "multi\n[line](link)\n*text*",
+]
+
+
+def check_identical(texts: list[str]):
+    for text in texts:
+        expected = clean_text_reference(text)
+        assert clean_text(text) == expected, f"Different output for {text!r}"
+
+
+def best_of(func, texts: list[str]) -> float:
+    return min(repeat(lambda: func(texts), number=1, repeat=N_REPEAT))
+
+
+def main():
+    with open(PATH_DATA, "r") as f:
+        faq_bodies = [faq["faq_body"] for faq in json.load(f)]
+
+    check_identical(faq_bodies + EDGE_CASES)
+    print(
+        f"Identical output on {len(faq_bodies)} FAQs and {len(EDGE_CASES)} edge cases"
+    )
+
+    corpus = faq_bodies * CORPUS_REPEAT
+    n_chars = sum(len(text) for text in corpus)
+    timings = {
+        "reference (3 passes)": best_of(
+            lambda texts: [clean_text_reference(t) for t in texts], corpus
+        ),
+        "clean_text (fast path)": best_of(
+            lambda texts: [clean_text(t) for t in texts], corpus
+        ),
+        "clean_texts (4 processes)": best_of(
+            lambda texts: clean_texts(texts, processes=4), corpus
+        ),
+    }
+    reference_time = timings["reference (3 passes)"]
+    print(f"Corpus: {len(corpus)} texts, {n_chars / 1e6:.1f}M characters")
+    for name, seconds in timings.items():
+        print(
+            f"{name:<28} {seconds * 1000:8.1f} ms  {n_chars / seconds / 1e6:7.1f} Mchar/s  "
+            f"x{reference_time / seconds:.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
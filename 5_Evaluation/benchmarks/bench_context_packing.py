@@ -0,0 +1,176 @@
+"""
+Benchmark of the context packer against `format_docs_alternative`.
+
+The FAQs are indexed in a temporary store with the hash embeddings of fakes.py, and the
+questions of items_eval_en.json are answered once with the unpacked context (the full FAQ
+for every chunk) and once with `pack_context`. It reports the prompt tokens, the tokens
+saved, the formatting time and the `generate_response` latency of a fake LLM whose time
+to first token grows with the prompt size, and checks that packing keeps every expected
+FAQ the unpacked context had.
+
+    uv run python 5_Evaluation/benchmarks/bench_context_packing.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+os.environ.update(
+    {
+        "LANGFUSE_TRACING_ENABLED": "false",
+        "LANGFUSE_PUBLIC_KEY": "pk-bench",
+        "LANGFUSE_SECRET_KEY": "sk-bench",
+        "QDRANT_URL": "",
+    }
+)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fakes import (  # noqa: E402
+    FakeChatModel,
+    HashEmbeddings,
+    HashSparseEmbeddings,
+    use_offline_encoding,
+)
+from index_faq import PATH_DATA, open_vector_store  # noqa: E402
+from ingest_faq import stream_ingest  # noqa: E402
+from run_evaluation import (  # noqa: E402
+    K_RETRIEVAL,
+    PROMPT_TEMPLATE,
+    RagConversation,
+    format_docs_alternative,
+)
+from utils.context import CONTEXT_MAX_TOKENS, pack_context  # noqa: E402
+from utils.resources import get_langfuse_client  # noqa: E402
+from utils.tokens import ENCODING_NAME, count_tokens  # noqa: E402
+
+PATH_EVAL_DATA = Path(__file__).parent.parent / "data" / "items_eval_en.json"
+ENCODING = (
+    ENCODING_NAME  # None for the 4 characters per token estimate, without tiktoken
+)
+# Prompt processing rate of the fake LLM, so that the prompt size shows in the latency
+PREFILL_TOKENS_PER_SECOND = 5_000
+N_REPEATS = 5
+
+
+def retrieve(questions: list[str], tmp_dir: str) -> tuple[list[list], RagConversation]:
+    with open(PATH_DATA, "r") as f:
+        faq_data = json.load(f)
+    vector_store = open_vector_store(
+        HashEmbeddings(), HashSparseEmbeddings(), Path(tmp_dir), force_recreate=True
+    )
+    stream_ingest(faq_data, vector_store)
+    retrieved = [
+        vector_store.similarity_search_with_relevance_scores(question, k=K_RETRIEVAL)
+        for question in questions
+    ]
+    llm = FakeChatModel(
+        latency_seconds=0.0,
+        tokens_per_second=1e9,
+        prefill_tokens_per_second=PREFILL_TOKENS_PER_SECOND,
+    )
+    return retrieved, RagConversation(vector_store, llm)
+
+
+def time_per_call(func, args_list: list[tuple]) -> float:
+    start_time = perf_counter()
+    for _ in range(N_REPEATS):
+        for args in args_list:
+            func(*args)
+    return (perf_counter() - start_time) / (N_REPEATS * len(args_list))
+
+
+def main():
+    with open(PATH_EVAL_DATA, "r") as f:
+        eval_data = json.load(f)
+    questions = [item["input"] for item in eval_data]
+    get_langfuse_client()
+    if ENCODING:
+        print(f"Token counts: {use_offline_encoding(ENCODING)}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        retrieved, rag_conversation = retrieve(questions, tmp_dir)
+        docs_list = [
+            [doc for doc, _ in docs_and_scores] for docs_and_scores in retrieved
+        ]
+        scores_list = [
+            [score for _, score in docs_and_scores] for docs_and_scores in retrieved
+        ]
+
+        unpacked = [format_docs_alternative(docs) for docs in docs_list]
+        packed = [
+            pack_context(
+                docs, scores, max_tokens=CONTEXT_MAX_TOKENS, encoding_name=ENCODING
+            )
+            for docs, scores in zip(docs_list, scores_list)
+        ]
+
+        def prompt_tokens(context: str, question: str) -> int:
+            prompt = PROMPT_TEMPLATE.format(context=context, question=question)
+            return count_tokens(prompt, ENCODING) if ENCODING else len(prompt) // 4
+
+        unpacked_tokens = np.array(
+            [prompt_tokens(c, q) for c, q in zip(unpacked, questions)]
+        )
+        packed_tokens = np.array(
+            [prompt_tokens(c, q) for (c, _), q in zip(packed, questions)]
+        )
+        saved = np.array([stats["tokens_saved"] for _, stats in packed])
+        duplicated = sum(stats["faqs"] < stats["chunks"] for _, stats in packed)
+        print(
+            f"{len(questions)} questions, k={K_RETRIEVAL}, budget {CONTEXT_MAX_TOKENS} tokens: "
+            f"{duplicated} with several chunks of one FAQ, "
+            f"{sum(stats['chunks_only'] for _, stats in packed)} FAQs cut to their chunks"
+        )
+        print(
+            f"prompt tokens   unpacked mean {unpacked_tokens.mean():7.0f}  max {unpacked_tokens.max():6d}"
+            f"   packed mean {packed_tokens.mean():7.0f}  max {packed_tokens.max():6d}"
+            f"   ({1 - packed_tokens.sum() / unpacked_tokens.sum():.0%} fewer)"
+        )
+        print(
+            f"tokens saved    per request mean {saved.mean():.0f}, p95 {np.percentile(saved, 95):.0f}"
+        )
+
+        # Packing must not drop an expected FAQ that the unpacked context had
+        for item, docs, (context, _) in zip(eval_data, docs_list, packed):
+            for faq_id in {doc.metadata["faq_id"] for doc in docs}:
+                if faq_id in item["metadata"]["faq_ids"]:
+                    assert f"Source: {faq_id}" in context, (item["input"], faq_id)
+
+        format_time = time_per_call(format_docs_alternative, [(d,) for d in docs_list])
+        pack_time = time_per_call(
+            lambda docs, scores: pack_context(
+                docs, scores, max_tokens=CONTEXT_MAX_TOKENS, encoding_name=ENCODING
+            ),
+            list(zip(docs_list, scores_list)),
+        )
+        print(
+            f"formatting      unpacked {format_time * 1e6:7.1f} us   packed {pack_time * 1e6:7.1f} us"
+        )
+
+        latencies = {}
+        for name, max_tokens in [("unpacked", None), ("packed", CONTEXT_MAX_TOKENS)]:
+            rag_conversation.context_max_tokens = max_tokens
+            latencies[name] = []
+            for question, docs in zip(questions, docs_list):
+                start_time = perf_counter()
+                rag_conversation.generate_response(question, docs)
+                latencies[name].append(perf_counter() - start_time)
+        print(
+            "generate_response "
+            + "   ".join(
+                f"{name} p50 {np.percentile(values, 50) * 1000:6.1f} ms "
+                f"p95 {np.percentile(values, 95) * 1000:6.1f} ms"
+                for name, values in latencies.items()
+            )
+            + f"   (fake LLM prefill at {PREFILL_TOKENS_PER_SECOND} tokens/s)"
+        )
+        rag_conversation.vector_store.client.close()
+
+
+if __name__ == "__main__":
+    main()
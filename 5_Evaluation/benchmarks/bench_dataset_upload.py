@@ -0,0 +1,187 @@
+"""
+Benchmark of the Langfuse dataset upload against a local mock of the Langfuse HTTP API.
+
+The mock runs in its own process and answers the dataset endpoints with a fixed latency,
+randomly throttling or failing a share of the item uploads. It compares the one-by-one `populate_dataset` with
+`bulk_populate_dataset` (first upload, then a rerun that must skip every item, then a
+rerun with edited items whose old versions must be archived), and checks that the
+dataset holds no duplicates.
+
+    uv run python 5_Evaluation/benchmarks/bench_dataset_upload.py
+"""
+
+import json
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Process, Queue
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+from uuid import uuid4
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from create_langfuse_dataset import (  # noqa: E402
+    PATH_DATA,
+    bulk_populate_dataset,
+    existing_item_ids,
+    populate_dataset,
+)
+from langfuse import Langfuse  # noqa: E402
+
+N_ITEMS = 500
+N_EDITED = 10
+LATENCY_SECONDS = 0.01
+FAILURE_RATE = 0.05
+NOW = "2025-01-01T00:00:00.000Z"
+
+
+class MockLangfuseServer(ThreadingHTTPServer):
+    # The default backlog of 5 connections refuses most of a concurrent upload
+    request_queue_size = 128
+
+
+class MockLangfuseHandler(BaseHTTPRequestHandler):
+    items: dict = {}
+    lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        path = urlparse(self.path).path
+        if path == "/api/public/v2/datasets":
+            return self._send(
+                200,
+                {
+                    **body,
+                    "id": "dataset",
+                    "projectId": "project",
+                    "createdAt": NOW,
+                    "updatedAt": NOW,
+                },
+            )
+        if path != "/api/public/dataset-items":
+            return self._send(404, {"message": path})
+
+        time.sleep(LATENCY_SECONDS)
+        # Only the uploads to the "flaky" dataset are throttled or failed
+        if body["datasetName"] == "flaky" and random.random() < FAILURE_RATE:
+            return self._send(random.choice([429, 503]), {"message": "try again later"})
+        item = {
+            "id": body.get("id") or str(uuid4()),
+            "status": body.get("status") or "ACTIVE",
+            "input": body.get("input"),
+            "expectedOutput": body.get("expectedOutput"),
+            "metadata": body.get("metadata"),
+            "datasetId": "dataset",
+            "datasetName": body["datasetName"],
+            "createdAt": NOW,
+            "updatedAt": NOW,
+        }
+        with self.lock:
+            self.items[item["id"]] = item
+        self._send(200, item)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path != "/api/public/dataset-items":
+            return self._send(404, {"message": url.path})
+        query = parse_qs(url.query)
+        page, limit = int(query["page"][0]), int(query["limit"][0])
+        with self.lock:
+            items = [
+                item
+                for item in self.items.values()
+                if item["datasetName"] == query["datasetName"][0]
+            ]
+        self._send(
+            200,
+            {
+                "data": items[(page - 1) * limit : page * limit],
+                "meta": {
+                    "page": page,
+                    "limit": limit,
+                    "totalItems": len(items),
+                    "totalPages": max(1, -(-len(items) // limit)),
+                },
+            },
+        )
+
+
+def make_data(n_items: int = N_ITEMS) -> list[dict]:
+    with open(PATH_DATA, "r") as f:
+        items = json.load(f)
+    return [
+        {**items[i % len(items)], "input": f"{items[i % len(items)]['input']} ({i})"}
+        for i in range(n_items)
+    ]
+
+
+def serve(port_queue: Queue):
+    server = MockLangfuseServer(("127.0.0.1", 0), MockLangfuseHandler)
+    port_queue.put(server.server_port)
+    server.serve_forever()
+
+
+def main():
+    # In its own process, so the mock does not compete with the uploader for the GIL
+    port_queue = Queue()
+    server = Process(target=serve, args=(port_queue,), daemon=True)
+    server.start()
+    langfuse_client = Langfuse(
+        public_key="pk-mock",
+        secret_key="sk-mock",
+        host=f"http://127.0.0.1:{port_queue.get()}",
+        tracing_enabled=False,
+    )
+    data = make_data()
+    print(f"{len(data)} items, {LATENCY_SECONDS * 1000:.0f} ms per upload")
+
+    start_time = time.perf_counter()
+    populate_dataset("sequential", data, langfuse_client)
+    sequential_time = time.perf_counter() - start_time
+    print(f"populate_dataset       {len(data) / sequential_time:8.1f} items/sec")
+
+    edited = [
+        {**example, "expected_output": f"{example['expected_output']} (edited)"}
+        for example in data[:N_EDITED]
+    ] + data[N_EDITED:]
+    for dataset_name, items, run in [
+        ("bulk", data, "first run"),
+        ("bulk", data, "rerun"),
+        ("bulk", edited, f"{N_EDITED} items edited"),
+        ("flaky", data, f"{FAILURE_RATE:.0%} throttled or failed"),
+        ("flaky", data, "rerun"),
+    ]:
+        stats = bulk_populate_dataset(dataset_name, items, langfuse_client)
+        print(
+            f"bulk_populate_dataset  {stats['items_per_second']:8.1f} items/sec  {run}: "
+            f"{stats['uploaded']} uploaded, {stats['skipped']} skipped, "
+            f"{stats['archived']} archived, {stats['retries']} retries, "
+            f"{stats['seconds']:.2f} seconds"
+        )
+    for dataset_name in ("bulk", "flaky"):
+        # The mock keeps one item per id, a duplicate or a stale item would show up as an
+        # extra active item
+        n_items = len(existing_item_ids(dataset_name, langfuse_client))
+        assert n_items == len(data), (
+            f"{n_items} items in {dataset_name}, {len(data)} expected"
+        )
+    print(f"Datasets hold {len(data)} items each, no duplicates")
+    server.terminate()
+
+
+if __name__ == "__main__":
+    main()
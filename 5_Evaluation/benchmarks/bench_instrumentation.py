@@ -0,0 +1,99 @@
+"""
+Overhead of the pipeline metrics of utils/instrumentation.py.
+
+Measures the cost of one `timer` block and one `record_tokens` call, from 1 and 8 threads
+at once, then the time of `RagConversation.generate_response` on an instant fake LLM with
+the metrics enabled and disabled, and prints the Prometheus export of the run.
+
+    uv run python 5_Evaluation/benchmarks/bench_instrumentation.py
+"""
+
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+
+# Only the metrics are measured, the @observe spans are no-ops
+os.environ.update(
+    {
+        "LANGFUSE_TRACING_ENABLED": "false",
+        "LANGFUSE_PUBLIC_KEY": "pk-bench",
+        "LANGFUSE_SECRET_KEY": "sk-bench",
+    }
+)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fakes import FakeChatModel  # noqa: E402
+from langchain_core.documents import Document  # noqa: E402
+from run_evaluation import RagConversation  # noqa: E402
+from utils.instrumentation import PIPELINE_METRICS, PipelineMetrics  # noqa: E402
+from utils.resources import get_langfuse_client  # noqa: E402
+
+N_CALLS = 200_000
+N_RESPONSES = 2_000
+USAGE_METADATA = {"input_tokens": 850, "output_tokens": 120, "total_tokens": 970}
+
+
+def time_timer(metrics: PipelineMetrics, n_calls: int) -> float:
+    start_time = perf_counter()
+    for _ in range(n_calls):
+        with metrics.timer("stage"):
+            pass
+    return perf_counter() - start_time
+
+
+def time_record_tokens(metrics: PipelineMetrics, n_calls: int) -> float:
+    start_time = perf_counter()
+    for _ in range(n_calls):
+        metrics.record_tokens(USAGE_METADATA)
+    return perf_counter() - start_time
+
+
+def main():
+    for name, func in [("timer", time_timer), ("record_tokens", time_record_tokens)]:
+        for n_threads in (1, 8):
+            metrics = PipelineMetrics()
+            with ThreadPoolExecutor(max_workers=n_threads) as executor:
+                start_time = perf_counter()
+                list(
+                    executor.map(
+                        func, [metrics] * n_threads, [N_CALLS // n_threads] * n_threads
+                    )
+                )
+                elapsed = perf_counter() - start_time
+            print(
+                f"{name:<14} {n_threads} threads  {elapsed / N_CALLS * 1e6:6.2f} us/call"
+            )
+        disabled = PipelineMetrics(enabled=False)
+        print(
+            f"{name:<14} disabled   {func(disabled, N_CALLS) / N_CALLS * 1e6:6.2f} us/call"
+        )
+
+    get_langfuse_client()
+    rag_conversation = RagConversation(
+        None, FakeChatModel(latency_seconds=0.0, tokens_per_second=1e12)
+    )
+    docs = [
+        Document(
+            page_content="content",
+            metadata={"faq_id": i, "faq_body": f"Answer of the FAQ {i}"},
+        )
+        for i in range(4)
+    ]
+    timings = {}
+    for enabled in (False, True, False, True):
+        PIPELINE_METRICS.enabled = enabled
+        start_time = perf_counter()
+        for i in range(N_RESPONSES):
+            rag_conversation.generate_response(f"Question {i}?", docs)
+        timings[enabled] = (perf_counter() - start_time) / N_RESPONSES
+    print(
+        f"generate_response  {timings[False] * 1e6:8.1f} us without metrics, "
+        f"{timings[True] * 1e6:8.1f} us with ({timings[True] / timings[False] - 1:+.1%})"
+    )
+    print(PIPELINE_METRICS.to_prometheus())
+
+
+if __name__ == "__main__":
+    main()
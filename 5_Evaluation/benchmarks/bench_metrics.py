@@ -0,0 +1,64 @@
+"""
+Benchmark of the retrieval metrics.
+
+Checks that the vectorized hitrate@k gives exactly the same values as `hitrate` applied
+to each item (both-empty and no-expected cases included), then compares the per-item
+loop computing hitrate at every k with the batch computation of all the metrics.
+
+    uv run python 5_Evaluation/benchmarks/bench_metrics.py
+"""
+
+import random
+import sys
+from pathlib import Path
+from time import perf_counter
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from utils.metrics import hitrate  # noqa: E402
+from utils.retrieval_metrics import batch_retrieval_metrics  # noqa: E402
+
+N_ITEMS = 100_000
+N_FAQS = 2_000
+KS = list(range(1, 11))
+
+
+def random_run(n_items: int = N_ITEMS, seed: int = 0) -> tuple[list, list]:
+    rng = random.Random(seed)
+    expected, output = [], []
+    for _ in range(n_items):
+        expected.append(
+            [rng.randrange(N_FAQS) for _ in range(rng.choice([0, 1, 1, 2, 3]))]
+        )
+        # Small vocabulary so that duplicates and hits are frequent
+        output.append(
+            [rng.randrange(N_FAQS // 100) for _ in range(rng.choice([0, 4, 8, 10]))]
+        )
+    return expected, output
+
+
+def main():
+    expected, output = random_run()
+
+    start_time = perf_counter()
+    metrics = batch_retrieval_metrics(expected, output, KS)
+    batch_time = perf_counter() - start_time
+
+    start_time = perf_counter()
+    loop_scores = [[hitrate(e, o[:k]) for e, o in zip(expected, output)] for k in KS]
+    loop_time = perf_counter() - start_time
+
+    for j, k in enumerate(KS):
+        assert metrics["hitrate"][:, j].tolist() == loop_scores[j], (
+            f"hitrate@{k} differs from hitrate"
+        )
+    print(f"hitrate@k identical to hitrate on {len(expected)} items for k in {KS}")
+
+    print(f"loop  (hitrate)                 {loop_time * 1000:8.1f} ms")
+    print(
+        f"batch (hitrate, recall, MRR, nDCG) {batch_time * 1000:5.1f} ms  x{loop_time / batch_time:.1f}"
+    )
+
+
+if __name__ == "__main__":
+    main()
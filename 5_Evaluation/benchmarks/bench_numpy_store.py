@@ -0,0 +1,165 @@
+"""
+Latency of the NumPy exact-search store against the Qdrant local mode.
+
+The FAQs are indexed in a temporary embedded Qdrant store with the hash embeddings of
+fakes.py, copied into a `NumpyVectorStore`, saved and memory-mapped back. The questions
+of items_eval_en.json are then searched one at a time and in one batch by the hybrid
+search of `QdrantVectorStore`, by `ParallelHybridRetriever` and by the NumPy store, with
+and without a metadata filter. It reports the p50/p95 latency per query, the search time
+alone (without the query embeddings) and the batch throughput, and checks that the
+NumPy store returns the same chunks as Qdrant.
+
+    uv run python 5_Evaluation/benchmarks/bench_numpy_store.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+os.environ.update(
+    {
+        "LANGFUSE_TRACING_ENABLED": "false",
+        "LANGFUSE_PUBLIC_KEY": "pk-bench",
+        "LANGFUSE_SECRET_KEY": "sk-bench",
+        "QDRANT_URL": "",
+    }
+)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fakes import HashEmbeddings, HashSparseEmbeddings  # noqa: E402
+from index_faq import PATH_DATA, open_vector_store  # noqa: E402
+from ingest_faq import stream_ingest  # noqa: E402
+from qdrant_client import models  # noqa: E402
+from run_evaluation import K_RETRIEVAL  # noqa: E402
+from utils.numpy_store import NumpyVectorStore  # noqa: E402
+from utils.resources import get_langfuse_client  # noqa: E402
+from utils.retrieval import ParallelHybridRetriever  # noqa: E402
+
+PATH_EVAL_DATA = Path(__file__).parent.parent / "data" / "items_eval_en.json"
+N_REPEATS = 10
+N_FILTER_FAQS = 50
+
+
+def time_queries(search, questions: list[str]) -> tuple[list, np.ndarray]:
+    """Results of the last round and the latency of every call, in ms."""
+    search(questions[0])  # Warm up
+    latencies = []
+    for _ in range(N_REPEATS):
+        results = []
+        for question in questions:
+            start_time = perf_counter()
+            results.append(search(question))
+            latencies.append(perf_counter() - start_time)
+    return results, np.array(latencies) * 1000
+
+
+def time_batch(search, questions: list[str]) -> float:
+    """Queries per second of batch searches."""
+    search(questions)
+    start_time = perf_counter()
+    for _ in range(N_REPEATS):
+        search(questions)
+    return N_REPEATS * len(questions) / (perf_counter() - start_time)
+
+
+def chunk_ids(results: list[list]) -> list[list[str]]:
+    return [[doc.id or doc.metadata["_id"] for doc, _ in docs] for docs in results]
+
+
+def main():
+    with open(PATH_DATA, "r") as f:
+        faq_data = json.load(f)
+    with open(PATH_EVAL_DATA, "r") as f:
+        eval_data = json.load(f)
+    questions = [item["input"] for item in eval_data]
+    get_langfuse_client()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vector_store = open_vector_store(
+            HashEmbeddings(),
+            HashSparseEmbeddings(),
+            Path(tmp_dir) / "vector_store",
+            force_recreate=True,
+        )
+        stream_ingest(faq_data, vector_store)
+        start_time = perf_counter()
+        NumpyVectorStore.from_qdrant(vector_store).save(Path(tmp_dir) / "numpy_store")
+        export_time = perf_counter() - start_time
+        start_time = perf_counter()
+        numpy_store = NumpyVectorStore.load(
+            Path(tmp_dir) / "numpy_store", HashEmbeddings(), HashSparseEmbeddings()
+        )
+        load_time = perf_counter() - start_time
+        retriever = ParallelHybridRetriever(vector_store)
+        print(
+            f"{len(numpy_store)} chunks, {len(questions)} questions, k={K_RETRIEVAL}: "
+            f"exported from Qdrant in {export_time * 1000:.0f} ms, "
+            f"memory-mapped in {load_time * 1000:.1f} ms"
+        )
+
+        faq_ids = [faq["faq_id"] for faq in faq_data[:N_FILTER_FAQS]]
+        filters = {
+            "qdrant": models.Filter(
+                must=[
+                    models.FieldCondition(
+                        key="metadata.faq_id", match=models.MatchAny(any=faq_ids)
+                    )
+                ]
+            ),
+            "numpy": {"faq_id": faq_ids},
+        }
+        backends = [
+            ("qdrant local", vector_store, None, "qdrant"),
+            ("parallel hybrid", retriever, retriever, "qdrant"),
+            ("numpy store", numpy_store, numpy_store, "numpy"),
+        ]
+        expected = {}
+        for filtered in (False, True):
+            print(
+                f"filtered on {N_FILTER_FAQS} of {len(faq_data)} FAQs"
+                if filtered
+                else "no filter"
+            )
+            for name, store, timed, filter_kind in backends:
+                kwargs = {"filter": filters[filter_kind]} if filtered else {}
+                search_times = []
+
+                def search(question):
+                    docs_and_scores = store.similarity_search_with_relevance_scores(
+                        question, k=K_RETRIEVAL, **kwargs
+                    )
+                    if timed is not None:
+                        search_times.append(timed.last_timings["search"])
+                    return docs_and_scores
+
+                results, latencies = time_queries(search, questions)
+                expected.setdefault(filtered, chunk_ids(results))
+                assert chunk_ids(results) == expected[filtered], name
+                search_ms = (
+                    f"search p50 {np.percentile(search_times, 50) * 1000:6.3f} ms"
+                    if search_times
+                    else " " * 22
+                )
+                batch_qps = ""
+                if timed is not None:
+                    qps = time_batch(
+                        lambda batch: timed.batch_similarity_search_with_score(
+                            batch, k=K_RETRIEVAL, **kwargs
+                        ),
+                        questions,
+                    )
+                    batch_qps = f"batch {qps:8.0f} queries/s"
+                print(
+                    f"  {name:<16} p50 {np.percentile(latencies, 50):6.3f} ms  "
+                    f"p95 {np.percentile(latencies, 95):6.3f} ms  {search_ms}  {batch_qps}"
+                )
+        vector_store.client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+"""
+End-to-end performance benchmark of the RAG pipeline, fully offline.
+
+OpenAI and Langfuse are replaced by the deterministic stand-ins of fakes.py: a chat model
+with a fixed time to first token and token rate, 1536-dimensional hash embeddings and an
+in-process Langfuse sink receiving the traces and scores. Each stage of the app runs on
+the real code (ingestion, hybrid retrieval, `RagConversation.get_response`, the
+evaluation loop and the agent) and reports its p50/p95 latency, throughput and the peak
+RSS of the process so far. Since the fake backends always take the same time, a change
+in these numbers comes from the app code.
+
+    uv run python 5_Evaluation/benchmarks/bench_pipeline.py
+"""
+
+import asyncio
+import json
+import os
+import resource
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+from unittest import mock
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fakes import (  # noqa: E402
+    FakeChatModel,
+    FakeGroundednessScorer,
+    HashEmbeddings,
+    HashSparseEmbeddings,
+    LangfuseSink,
+    use_offline_encoding,
+)
+from index_faq import PATH_DATA, open_vector_store  # noqa: E402
+from ingest_faq import AdaptiveBatchSize, stream_ingest  # noqa: E402
+from run_evaluation import (  # noqa: E402
+    K_RETRIEVAL,
+    PROMPT_TEMPLATE,
+    RagConversation,
+    async_run_evaluation,
+    format_docs_alternative,
+)
+from utils.judge import CachedJudge, UsageMeter  # noqa: E402
+from utils.metrics import JUDGE_MODEL_NAME  # noqa: E402
+from utils.resources import get_langfuse_client  # noqa: E402
+from utils.retrieval import ParallelHybridRetriever  # noqa: E402
+from utils.tokens import ENCODING_NAME  # noqa: E402
+
+PATH_EVAL_DATA = Path(__file__).parent.parent / "data" / "items_eval_en.json"
+DATASET_NAME = "bench-dataset"
+N_QUESTIONS = 100
+LLM_LATENCY_SECONDS = 0.05
+LLM_TOKENS_PER_SECOND = 1000.0
+LLM_OUTPUT_TOKENS = 50
+EMBEDDING_LATENCY_SECONDS = 0.01
+JUDGE_LATENCY_SECONDS = 0.05
+# High enough for the rate limiter of the judge not to set the pace of the evaluation
+JUDGE_REQUESTS_PER_MINUTE = 60_000
+MAX_CONCURRENCY = 8
+
+
+class RecordingBatchSize(AdaptiveBatchSize):
+    """Adaptive batch size keeping the latency of every ingested batch."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+
+    def update(self, batch_seconds: float):
+        self.latencies.append(batch_seconds)
+        super().update(batch_seconds)
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is in kilobytes on Linux, in bytes on macOS
+    scale = 1 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale / 2**20
+
+
+def report(stage: str, latencies: list[float], n_items: int, seconds: float, unit: str):
+    latencies = np.asarray(latencies) * 1000
+    print(
+        f"{stage:<14} p50 {np.percentile(latencies, 50):8.2f} ms  "
+        f"p95 {np.percentile(latencies, 95):8.2f} ms  "
+        f"{n_items / seconds:8.1f} {unit}/s  peak RSS {peak_rss_mb():7.1f} MB"
+    )
+
+
+def timed_calls(func, inputs: list) -> tuple[list, list[float], float]:
+    """Call `func` on each input in turn, return the results, latencies and total time."""
+    results, latencies = [], []
+    start_time = perf_counter()
+    for value in inputs:
+        call_start = perf_counter()
+        results.append(func(value))
+        latencies.append(perf_counter() - call_start)
+    return results, latencies, perf_counter() - start_time
+
+
+def make_questions(n_questions: int = N_QUESTIONS) -> list[dict]:
+    with open(PATH_EVAL_DATA, "r") as f:
+        items = json.load(f)
+    # Distinct questions, so that no cache of the app answers a repeated one
+    return [
+        {**items[i % len(items)], "input": f"{items[i % len(items)]['input']} ({i})"}
+        for i in range(n_questions)
+    ]
+
+
+def bench_ingestion(path_to_vector_store: Path):
+    with open(PATH_DATA, "r") as f:
+        faq_data = json.load(f)
+    vector_store = open_vector_store(
+        HashEmbeddings(latency_seconds=EMBEDDING_LATENCY_SECONDS),
+        HashSparseEmbeddings(),
+        path_to_vector_store,
+        force_recreate=True,
+    )
+    batch_size = RecordingBatchSize()
+    stats = stream_ingest(faq_data, vector_store, batch_size=batch_size)
+    report(
+        "ingestion",
+        batch_size.latencies,
+        stats["chunks"],
+        stats["seconds"],
+        "chunks",
+    )
+    return vector_store
+
+
+def bench_agent(vector_store, questions: list[str]):
+    try:
+        from langchain.agents import create_agent
+        from langchain.tools import tool
+    except (ImportError, TypeError) as e:
+        # langchain agents fail to import with a mismatched langgraph install
+        print(f"{'agent':<14} skipped, langchain agents unavailable: {e!r}")
+        return
+
+    @tool(response_format="content_and_artifact")
+    def retrieve_context(query: str, k: int = K_RETRIEVAL):
+        """Retrieve information to help answer a query."""
+        retrieved_docs = vector_store.similarity_search(query, k=k)
+        return format_docs_alternative(retrieved_docs), retrieved_docs
+
+    agent = create_agent(
+        FakeChatModel(
+            latency_seconds=LLM_LATENCY_SECONDS,
+            tokens_per_second=LLM_TOKENS_PER_SECOND,
+            n_output_tokens=LLM_OUTPUT_TOKENS,
+        ),
+        [retrieve_context],
+        system_prompt=PROMPT_TEMPLATE.split("\n\n")[0],
+    )
+    _, latencies, seconds = timed_calls(
+        lambda question: agent.invoke(
+            {"messages": [{"role": "user", "content": question}]}
+        ),
+        questions,
+    )
+    report("agent", latencies, len(questions), seconds, "questions")
+
+
+def use_langfuse_sink(sink: LangfuseSink):
+    """Point the Langfuse client of the app, and the other backends, at the stand-ins."""
+    os.environ.update(
+        {
+            "LANGFUSE_PUBLIC_KEY": "pk-bench",
+            "LANGFUSE_SECRET_KEY": "sk-bench",
+            "LANGFUSE_BASE_URL": sink.url,
+            "OPENAI_API_KEY": "sk-bench",
+            "QDRANT_URL": "",
+        }
+    )
+    return get_langfuse_client()
+
+
+def main():
+    langfuse_sink = LangfuseSink()
+    langfuse_client = use_langfuse_sink(langfuse_sink)
+    eval_items = make_questions()
+    questions = [item["input"] for item in eval_items]
+    llm = FakeChatModel(
+        latency_seconds=LLM_LATENCY_SECONDS,
+        tokens_per_second=LLM_TOKENS_PER_SECOND,
+        n_output_tokens=LLM_OUTPUT_TOKENS,
+    )
+    print(
+        f"{len(questions)} questions, LLM {LLM_LATENCY_SECONDS * 1000:.0f} ms + "
+        f"{LLM_OUTPUT_TOKENS} tokens at {LLM_TOKENS_PER_SECOND:.0f} tokens/s, embeddings "
+        f"{EMBEDDING_LATENCY_SECONDS * 1000:.0f} ms, judge {JUDGE_LATENCY_SECONDS * 1000:.0f} ms"
+    )
+    print(f"Token counts: {use_offline_encoding(ENCODING_NAME)}")
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vector_store = bench_ingestion(Path(tmp_dir) / "vector_store")
+        rag_conversation = RagConversation(
+            vector_store, llm, retriever=ParallelHybridRetriever(vector_store)
+        )
+        _, latencies, seconds = timed_calls(
+            rag_conversation.retrieve_documents, questions
+        )
+        report("retrieval", latencies, len(questions), seconds, "queries")
+
+        _, latencies, seconds = timed_calls(rag_conversation.get_response, questions)
+        report("get_response", latencies, len(questions), seconds, "questions")
+
+        # The judge scores with the fake scorer into a throwaway cache
+        judge = CachedJudge(
+            FakeGroundednessScorer(latency_seconds=JUDGE_LATENCY_SECONDS),
+            model=JUDGE_MODEL_NAME,
+            metric_version="bench",
+            cache_path=Path(tmp_dir) / "judge_cache.jsonl",
+            requests_per_minute=JUDGE_REQUESTS_PER_MINUTE,
+            usage=UsageMeter(),
+        )
+        langfuse_sink.add_dataset(DATASET_NAME, eval_items)
+        with (
+            mock.patch("utils.metrics.get_judge", return_value=judge),
+            mock.patch("run_evaluation.get_judge", return_value=judge),
+        ):
+            start_time = perf_counter()
+            results = asyncio.run(
+                async_run_evaluation(
+                    dataset_name=DATASET_NAME,
+                    rag_conversation=rag_conversation,
+                    langfuse_client=langfuse_client,
+                    max_concurrency=MAX_CONCURRENCY,
+                )
+            )
+            seconds = perf_counter() - start_time
+        report(
+            "evaluation",
+            [result["rag_time"] + result["judge_time"] for result in results],
+            len(results),
+            seconds,
+            "items",
+        )
+
+        bench_agent(vector_store, questions)
+        vector_store.client.close()
+
+    langfuse_client.flush()
+    sink_stats = langfuse_sink.stats()
+    print(
+        f"Langfuse sink: {sink_stats['spans']} spans ({sink_stats['trace_bytes'] / 1024:.0f} kB), "
+        f"{sink_stats['scores']} scores, {sink_stats['run_items']} dataset run items"
+    )
+    langfuse_sink.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,344 @@
+"""
+Memory, speed and retrieval quality of the quantization settings of the dense vectors.
+
+The chunks and their text-embedding-3-small vectors are read from the FAQ collection of
+vector_store/ (built by index_faq.py), and the questions of items_eval_en.json are
+embedded through the embedding cache, then searched with each setting of `SETTINGS`:
+float32, int8 or binary quantization (see utils/quantization.py), at full size or with
+the vectors cut to fewer Matryoshka dimensions and L2-normalized again, as the
+`dimensions` parameter of the embedding API does. For each setting it reports the
+RAM of the searched vectors per million chunks, the queries/s of the dense leg, the
+share of the exact float32 top k that the dense leg still returns, and the hitrate and
+recall of the dense leg and of the hybrid results (fused with the BM25 leg) with their
+delta to float32 at full size.
+
+The embedded store ignores quantization, so the quantized dense search is reproduced in
+NumPy, as Qdrant runs it: candidates scored on the quantized vectors, `OVERSAMPLING`
+times more than needed, rescored with the float32 vectors. With `QDRANT_URL` set, each
+setting is also loaded into a collection of that server and searched there.
+
+Without the collection or the embedding API, it falls back to the FAQs indexed in a
+temporary store with the hash embeddings of fakes.py, and says so in its output: the
+speed and memory still hold, the retrieval quality then says nothing about
+text-embedding-3-small, and the Matryoshka settings are skipped.
+
+    uv run python 5_Evaluation/benchmarks/bench_quantization.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+qdrant_url = os.environ.get("QDRANT_URL", "")
+os.environ.update(
+    {
+        "LANGFUSE_TRACING_ENABLED": "false",
+        "LANGFUSE_PUBLIC_KEY": "pk-bench",
+        "LANGFUSE_SECRET_KEY": "sk-bench",
+        "QDRANT_URL": "",
+    }
+)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fakes import HashEmbeddings, HashSparseEmbeddings  # noqa: E402
+from index_faq import (  # noqa: E402
+    COLLECTION_NAME,
+    PATH_DATA,
+    PATH_VECTOR_STORE,
+    open_vector_store,
+)
+from ingest_faq import stream_ingest  # noqa: E402
+from qdrant_client import QdrantClient, models  # noqa: E402
+from run_evaluation import K_RETRIEVAL, load_vector_store  # noqa: E402
+from utils.quantization import (  # noqa: E402
+    INT8_QUANTILE,
+    OVERSAMPLING,
+    dense_vector_params,
+    quantization_search_params,
+)
+from utils.retrieval import reciprocal_rank_fusion  # noqa: E402
+from utils.retrieval_metrics import mean_retrieval_metrics  # noqa: E402
+
+PATH_EVAL_DATA = Path(__file__).parent.parent / "data" / "items_eval_en.json"
+BENCH_COLLECTION_NAME = "bench_quantization"
+# (quantization, Matryoshka dimensions), None for float32 and the full 1536 dimensions
+SETTINGS = [
+    (None, None),
+    ("int8", None),
+    ("binary", None),
+    (None, 1024),
+    ("int8", 1024),
+    ("binary", 1024),
+    ("int8", 512),
+]
+N_REPEATS = 20
+MILLION = 1_000_000
+
+
+def truncate(vectors: np.ndarray, dimensions: int | None) -> np.ndarray:
+    """Leading `dimensions` components, L2-normalized again."""
+    if dimensions is None:
+        return vectors
+    vectors = vectors[:, :dimensions]
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.where(norms > 0, norms, 1.0)
+
+
+def bytes_per_vector(size: int, quantization: str | None) -> int:
+    """Bytes of the searched copy of a vector: float32, int8 or a bit per dimension."""
+    if quantization == "int8":
+        return size + 4  # and the correction of the dot product of each vector
+    if quantization == "binary":
+        return (size + 7) // 8
+    return 4 * size
+
+
+class QuantizedSearch:
+    """NumPy version of the rescored quantized search of Qdrant."""
+
+    def __init__(self, vectors: np.ndarray, quantization: str | None):
+        self.vectors = vectors
+        self.quantization = quantization
+        if quantization == "int8":
+            # One range for the whole collection, its extreme values clipped
+            tail = (1 - INT8_QUANTILE) / 2
+            self.low, self.high = np.quantile(vectors, [tail, 1 - tail])
+        self.codes = self.encode(vectors)
+
+    def encode(self, vectors: np.ndarray) -> np.ndarray:
+        if self.quantization == "int8":
+            scale = (self.high - self.low) / 255
+            codes = np.round((np.clip(vectors, self.low, self.high) - self.low) / scale)
+            return (codes.astype(np.uint8) * scale + self.low).astype(np.float32)
+        if self.quantization == "binary":
+            # +1/-1 per bit, so that the dot product ranks like the Hamming distance
+            return np.where(vectors > 0, 1.0, -1.0).astype(np.float32)
+        return vectors
+
+    def search(self, queries: np.ndarray, limit: int) -> np.ndarray:
+        """Indices of the `limit` best vectors of each query, best first."""
+        scores = self.encode(queries) @ self.codes.T
+        if self.quantization is None:
+            n_candidates = limit
+        else:
+            n_candidates = min(
+                int(limit * OVERSAMPLING[self.quantization]), len(self.vectors)
+            )
+        candidates = np.argpartition(-scores, n_candidates - 1, axis=1)[
+            :, :n_candidates
+        ]
+        if self.quantization is not None:
+            # Rescoring of the candidates with the float32 vectors
+            scores = np.einsum("qd,qcd->qc", queries, self.vectors[candidates])
+        else:
+            scores = np.take_along_axis(scores, candidates, axis=1)
+        order = np.argsort(-scores, axis=1, kind="stable")[:, :limit]
+        return np.take_along_axis(candidates, order, axis=1)
+
+
+def server_search(
+    client: QdrantClient,
+    records: list,
+    vectors: np.ndarray,
+    queries: np.ndarray,
+    quantization: str | None,
+    limit: int,
+) -> tuple[list[list], float]:
+    """Search the vectors in a server collection, return the rankings and queries/s."""
+    if client.collection_exists(BENCH_COLLECTION_NAME):
+        client.delete_collection(BENCH_COLLECTION_NAME)
+    client.create_collection(
+        BENCH_COLLECTION_NAME,
+        vectors_config={"dense": dense_vector_params(vectors.shape[1], quantization)},
+    )
+    client.upload_points(
+        BENCH_COLLECTION_NAME,
+        [
+            models.PointStruct(id=record.id, vector={"dense": vector.tolist()})
+            for record, vector in zip(records, vectors)
+        ],
+        wait=True,
+    )
+    requests = [
+        models.QueryRequest(
+            query=query.tolist(),
+            using="dense",
+            limit=limit,
+            params=quantization_search_params(quantization),
+        )
+        for query in queries
+    ]
+    client.query_batch_points(BENCH_COLLECTION_NAME, requests=requests)  # Warm up
+    start_time = perf_counter()
+    for _ in range(N_REPEATS):
+        responses = client.query_batch_points(BENCH_COLLECTION_NAME, requests=requests)
+    qps = N_REPEATS * len(queries) / (perf_counter() - start_time)
+    client.delete_collection(BENCH_COLLECTION_NAME)
+    return [response.points for response in responses], qps
+
+
+def read_collection(
+    vector_store, questions: list[str]
+) -> tuple[list, np.ndarray, list]:
+    """Chunks with their vectors, query vectors and BM25 ranking of the questions."""
+    records, _ = vector_store.client.scroll(
+        vector_store.collection_name,
+        limit=vector_store.client.count(vector_store.collection_name).count,
+        with_payload=True,
+        with_vectors=True,
+    )
+    # The BM25 leg does not depend on the dense settings
+    sparse_rankings = [
+        response.points
+        for response in vector_store.client.query_batch_points(
+            vector_store.collection_name,
+            requests=[
+                models.QueryRequest(
+                    query=models.SparseVector(
+                        indices=vector.indices, values=vector.values
+                    ),
+                    using="sparse",
+                    limit=K_RETRIEVAL,
+                    with_payload=True,
+                )
+                for vector in vector_store.sparse_embeddings.embed_documents(questions)
+            ],
+        )
+    ]
+    query_vectors = np.array(vector_store.embeddings.embed_documents(questions))
+    return records, query_vectors, sparse_rankings
+
+
+def load_real_collection(questions: list[str]) -> tuple[list, np.ndarray, list]:
+    # Checked first: opening a missing embedded store would create an empty one
+    if not (PATH_VECTOR_STORE / "collection" / COLLECTION_NAME).exists():
+        raise FileNotFoundError(f"no {COLLECTION_NAME} in {PATH_VECTOR_STORE}")
+    vector_store = load_vector_store()
+    if not vector_store.client.count(COLLECTION_NAME).count:
+        raise LookupError(f"{COLLECTION_NAME} is empty")
+    return read_collection(vector_store, questions)
+
+
+def load_fake_collection(
+    faq_data: list[dict], questions: list[str]
+) -> tuple[list, np.ndarray, list]:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vector_store = open_vector_store(
+            HashEmbeddings(), HashSparseEmbeddings(), Path(tmp_dir), force_recreate=True
+        )
+        stream_ingest(faq_data, vector_store)
+        collection = read_collection(vector_store, questions)
+        vector_store.client.close()
+    return collection
+
+
+def main():
+    with open(PATH_DATA, "r") as f:
+        faq_data = json.load(f)
+    with open(PATH_EVAL_DATA, "r") as f:
+        eval_data = json.load(f)
+    questions = [item["input"] for item in eval_data]
+    expected = [item["metadata"]["faq_ids"] for item in eval_data]
+
+    settings = SETTINGS
+    try:
+        records, query_vectors, sparse_rankings = load_real_collection(questions)
+        source = f"{COLLECTION_NAME} collection, text-embedding-3-small vectors"
+    except Exception as error:
+        records, query_vectors, sparse_rankings = load_fake_collection(
+            faq_data, questions
+        )
+        source = (
+            f"FAKE hash embeddings, the real collection is unavailable "
+            f"({type(error).__name__}: {error}); the hitrate and recall below say "
+            "nothing about text-embedding-3-small"
+        )
+        # Truncating hash vectors is meaningless
+        settings = [setting for setting in SETTINGS if setting[1] is None]
+
+    faq_ids = {record.id: record.payload["metadata"]["faq_id"] for record in records}
+    dense_vectors = np.array([record.vector["dense"] for record in records])
+    # A collection indexed with EMBEDDING_DIMENSIONS can only be cut shorter
+    settings = [
+        (quantization, dimensions)
+        for quantization, dimensions in settings
+        if dimensions is None or dimensions < dense_vectors.shape[1]
+    ]
+    remote_client = (
+        QdrantClient(url=qdrant_url, prefer_grpc=True) if qdrant_url else None
+    )
+
+    def metrics(dense_rankings: list[list]) -> dict:
+        hybrid = [
+            [point for point, _ in reciprocal_rank_fusion([dense, sparse], [1.0, 1.0])]
+            for dense, sparse in zip(dense_rankings, sparse_rankings)
+        ]
+        return {
+            f"{leg} {name}": value
+            for leg, rankings in (("dense", dense_rankings), ("hybrid", hybrid))
+            for name, value in mean_retrieval_metrics(
+                expected,
+                [[faq_ids[point.id] for point in ranking] for ranking in rankings],
+                ks=[K_RETRIEVAL],
+            ).items()
+            if not name.startswith(("mrr", "ndcg"))
+        }
+
+    print(source)
+    print(
+        f"{len(records)} chunks, {len(questions)} questions, k={K_RETRIEVAL}, "
+        f"oversampling {OVERSAMPLING}"
+        + (
+            f", server {qdrant_url}"
+            if remote_client
+            else ", emulated search (queries/s of the NumPy version)"
+        )
+    )
+    baseline, exact = None, None
+    for quantization, dimensions in settings:
+        vectors = truncate(dense_vectors, dimensions).astype(np.float32)
+        queries = truncate(query_vectors, dimensions).astype(np.float32)
+        search = QuantizedSearch(vectors, quantization)
+        start_time = perf_counter()
+        for _ in range(N_REPEATS):
+            indices = search.search(queries, K_RETRIEVAL)
+        qps = N_REPEATS * len(queries) / (perf_counter() - start_time)
+        rankings = [[records[i] for i in row] for row in indices]
+        if remote_client is not None:
+            rankings, qps = server_search(
+                remote_client, records, vectors, queries, quantization, K_RETRIEVAL
+            )
+
+        exact = exact or [{point.id for point in ranking} for ranking in rankings]
+        overlap = np.mean(
+            [
+                len(top_k & {point.id for point in ranking}) / len(top_k)
+                for top_k, ranking in zip(exact, rankings)
+            ]
+        )
+        values = metrics(rankings)
+        baseline = baseline or values
+        size = vectors.shape[1]
+        ram_mb = bytes_per_vector(size, quantization) * MILLION / 2**20
+        # Quantized collections keep the float32 originals on disk for the rescoring
+        disk_mb = 4 * size * MILLION / 2**20 if quantization else 0.0
+        print(
+            f"{quantization or 'float32':<8} {size:5d} dims  "
+            f"RAM {ram_mb:7.0f} MB/1M chunks  disk {disk_mb:5.0f}  {qps:8.0f} queries/s  "
+            f"exact top {K_RETRIEVAL} {overlap:.3f}  "
+            + "  ".join(
+                f"{name} {value:.3f} ({value - baseline[name]:+.3f})"
+                for name, value in values.items()
+            )
+        )
+    if remote_client is not None:
+        remote_client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,173 @@
+"""
+Latency added and hitrate gained by the cross-encoder rerank stage.
+
+The questions of items_eval_en.json are retrieved from the FAQ collection of
+vector_store/ (built by index_faq.py) by `ParallelHybridRetriever` alone, then through
+`RerankingRetriever` for several numbers of candidates, and once with a latency budget.
+For each setting it reports the hitrate, recall and MRR at K_RETRIEVAL with their delta
+to the plain retrieval, the p50/p95 latency of the rerank stage with a cold cache, and
+its p50 once the pair scores are cached.
+
+Without the collection or the embedding API, the FAQs are indexed in a temporary store
+with the hash embeddings of fakes.py; without sentence-transformers or the model of
+`RERANK_MODEL_NAME`, the word-overlap `FakeCrossEncoder` scores the pairs. Either
+fallback is announced in the output, as its hitrate says nothing about the real
+pipeline.
+
+    uv run python 5_Evaluation/benchmarks/bench_rerank.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+os.environ.update(
+    {
+        "LANGFUSE_TRACING_ENABLED": "false",
+        "LANGFUSE_PUBLIC_KEY": "pk-bench",
+        "LANGFUSE_SECRET_KEY": "sk-bench",
+        "QDRANT_URL": "",
+    }
+)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fakes import FakeCrossEncoder, HashEmbeddings, HashSparseEmbeddings  # noqa: E402
+from index_faq import (  # noqa: E402
+    COLLECTION_NAME,
+    PATH_DATA,
+    PATH_VECTOR_STORE,
+    open_vector_store,
+)
+from ingest_faq import stream_ingest  # noqa: E402
+from run_evaluation import K_RETRIEVAL, load_vector_store  # noqa: E402
+from utils.rerank import (  # noqa: E402
+    RERANK_MODEL_NAME,
+    CrossEncoderReranker,
+    RerankingRetriever,
+)
+from utils.resources import get_langfuse_client  # noqa: E402
+from utils.retrieval import ParallelHybridRetriever  # noqa: E402
+from utils.retrieval_metrics import mean_retrieval_metrics  # noqa: E402
+
+PATH_EVAL_DATA = Path(__file__).parent.parent / "data" / "items_eval_en.json"
+# (candidates, latency budget in seconds)
+SETTINGS = [(10, None), (20, None), (40, None), (40, 0.02)]
+NUM_THREADS = None  # torch threads of the real cross-encoder, None for the default
+
+
+def load_model():
+    try:
+        model = CrossEncoderReranker(num_threads=NUM_THREADS).get_model()
+        return model, RERANK_MODEL_NAME
+    except (ImportError, OSError) as e:
+        # No sentence-transformers install or no access to the model
+        return FakeCrossEncoder(), (
+            f"FAKE word-overlap FakeCrossEncoder, {RERANK_MODEL_NAME} is unavailable "
+            f"({type(e).__name__}: {e})"
+        )
+
+
+def load_real_vector_store():
+    # Checked first: opening a missing embedded store would create an empty one
+    if not (PATH_VECTOR_STORE / "collection" / COLLECTION_NAME).exists():
+        raise FileNotFoundError(f"no {COLLECTION_NAME} in {PATH_VECTOR_STORE}")
+    vector_store = load_vector_store()
+    if not vector_store.client.count(COLLECTION_NAME).count:
+        raise LookupError(f"{COLLECTION_NAME} is empty")
+    # Fails here rather than on the first question without the embedding API
+    vector_store.embeddings.embed_query("How do I post an ad?")
+    return vector_store, f"{COLLECTION_NAME} collection"
+
+
+def run(retriever, questions: list[str]) -> tuple[list[list], list[float]]:
+    """Results of each question, one at a time, and the rerank time of each."""
+    results, rerank_times = [], []
+    for question in questions:
+        results.append(
+            retriever.similarity_search_with_relevance_scores(question, k=K_RETRIEVAL)
+        )
+        rerank_times.append(getattr(retriever, "last_timings", {}).get("rerank", 0.0))
+    return results, rerank_times
+
+
+def main():
+    with open(PATH_DATA, "r") as f:
+        faq_data = json.load(f)
+    with open(PATH_EVAL_DATA, "r") as f:
+        eval_data = json.load(f)
+    questions = [item["input"] for item in eval_data]
+    expected = [item["metadata"]["faq_ids"] for item in eval_data]
+    get_langfuse_client()
+    model, model_name = load_model()
+
+    def metrics(results: list[list]) -> dict:
+        return {
+            name: value
+            for name, value in mean_retrieval_metrics(
+                expected,
+                [[doc.metadata["faq_id"] for doc, _ in docs] for docs in results],
+                ks=[K_RETRIEVAL],
+            ).items()
+            if not name.startswith("ndcg")
+        }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        try:
+            vector_store, store_name = load_real_vector_store()
+        except Exception as error:
+            vector_store = open_vector_store(
+                HashEmbeddings(),
+                HashSparseEmbeddings(),
+                Path(tmp_dir),
+                force_recreate=True,
+            )
+            stream_ingest(faq_data, vector_store)
+            store_name = (
+                f"FAKE hash embeddings, the real collection is unavailable "
+                f"({type(error).__name__}: {error})"
+            )
+        retriever = ParallelHybridRetriever(vector_store)
+
+        baseline = metrics(run(retriever, questions)[0])
+        print(f"{len(questions)} questions, k={K_RETRIEVAL}")
+        print(f"retrieval: {store_name}")
+        print(f"reranker:  {model_name}")
+        if "FAKE" in store_name + model_name:
+            print("The hitrate gains below are NOT those of the real pipeline")
+        print(
+            f"{'no rerank':<28} "
+            + "  ".join(f"{name} {value:.3f}" for name, value in baseline.items())
+        )
+        for candidates, budget_seconds in SETTINGS:
+            reranker = CrossEncoderReranker(
+                model=model, num_threads=NUM_THREADS, budget_seconds=budget_seconds
+            )
+            reranking_retriever = RerankingRetriever(
+                retriever, reranker, candidates=candidates
+            )
+            results, cold_times = run(reranking_retriever, questions)
+            _, cached_times = run(reranking_retriever, questions)
+            values = metrics(results)
+            name = f"rerank {candidates} candidates" + (
+                f", {budget_seconds * 1000:.0f} ms" if budget_seconds else ""
+            )
+            cold_ms = np.array(cold_times) * 1000
+            print(
+                f"{name:<28} "
+                + "  ".join(
+                    f"{metric} {value:.3f} ({value - baseline[metric]:+.3f})"
+                    for metric, value in values.items()
+                )
+                + f"  added p50 {np.percentile(cold_ms, 50):7.2f} ms"
+                f"  p95 {np.percentile(cold_ms, 95):7.2f} ms"
+                f"  cached p50 {np.percentile(cached_times, 50) * 1000:6.3f} ms"
+            )
+        vector_store.client.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Semantic cache of the chat app of 6_Observability, shared by concurrent chat sessions.
+
+Replays Gradio sessions against the chat handler of the notebook: each call rebuilds a
+`CachedRagConversation` from the history of its session, in front of one
+`SemanticCache`. Every session opens with one of a few FAQ questions, then asks a
+follow-up. Checks that the opening question of a new session is answered from the
+cache when another session asked it before, and that the follow-ups bypass the cache,
+then prints the latency of the misses, hits and bypassed calls.
+
+    uv run python 5_Evaluation/benchmarks/bench_semantic_cache.py
+"""
+
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+# Only the cache is measured, the @observe spans are no-ops
+os.environ.update(
+    {
+        "LANGFUSE_TRACING_ENABLED": "false",
+        "LANGFUSE_PUBLIC_KEY": "pk-bench",
+        "LANGFUSE_SECRET_KEY": "sk-bench",
+    }
+)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from fakes import (  # noqa: E402
+    FakeChatModel,
+    HashEmbeddings,
+    HashSparseEmbeddings,
+    use_offline_encoding,
+)
+from index_faq import PATH_DATA, open_vector_store  # noqa: E402
+from ingest_faq import stream_ingest  # noqa: E402
+from run_evaluation import RagConversation  # noqa: E402
+from utils.resources import get_langfuse_client  # noqa: E402
+from utils.semantic_cache import (  # noqa: E402
+    CachedRagConversation,
+    SemanticCache,
+    messages_from_chat_history,
+)
+from utils.tokens import ENCODING_NAME  # noqa: E402
+
+PATH_EVAL_DATA = Path(__file__).parent.parent / "data" / "items_eval_en.json"
+N_FAQS = 60
+N_OPENING_QUESTIONS = 5
+N_SESSIONS = 50
+FOLLOW_UP = "And what if that does not work?"
+LLM_LATENCY_SECONDS = 0.02
+
+
+def chat_handler(vector_store, llm, semantic_cache: SemanticCache):
+    """The `rag_assistant_response` of the notebook."""
+
+    def rag_assistant_response(message, history):
+        cached_rag_conversation = CachedRagConversation(
+            RagConversation(vector_store, llm, messages_from_chat_history(history)),
+            semantic_cache,
+        )
+        for response, docs, scores in cached_rag_conversation.get_response_stream(
+            message
+        ):
+            yield response
+
+    return rag_assistant_response
+
+
+def send(handler, history: list[dict], message: str) -> float:
+    """Send `message` like Gradio, add the turn to the history, return the latency."""
+    start_time = perf_counter()
+    response = ""
+    for response in handler(message, history):
+        pass
+    latency = perf_counter() - start_time
+    # Gradio 6 passes the content as a list of parts
+    history.append({"role": "user", "content": [{"type": "text", "text": message}]})
+    history.append(
+        {"role": "assistant", "content": [{"type": "text", "text": response}]}
+    )
+    return latency
+
+
+def main():
+    print(f"Token counts: {use_offline_encoding(ENCODING_NAME)}")
+    get_langfuse_client()
+    with open(PATH_DATA, "r") as f:
+        faq_data = json.load(f)[:N_FAQS]
+    with open(PATH_EVAL_DATA, "r") as f:
+        opening_questions = [item["input"] for item in json.load(f)][
+            :N_OPENING_QUESTIONS
+        ]
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        embeddings = HashEmbeddings()
+        vector_store = open_vector_store(
+            embeddings, HashSparseEmbeddings(), Path(temp_dir), force_recreate=True
+        )
+        stream_ingest(faq_data, vector_store)
+        semantic_cache = SemanticCache(embeddings)
+        handler = chat_handler(
+            vector_store,
+            FakeChatModel(latency_seconds=LLM_LATENCY_SECONDS),
+            semantic_cache,
+        )
+
+        latencies = {"miss": [], "hit": [], "bypassed": []}
+        asked = set()
+        for i in range(N_SESSIONS):
+            # A new Gradio session starts with an empty history
+            history = []
+            question = opening_questions[i % len(opening_questions)]
+            hits = semantic_cache.hits
+            latency = send(handler, history, question)
+            hit = semantic_cache.hits > hits
+            assert hit == (question in asked), (i, question, hit)
+            latencies["hit" if hit else "miss"].append(latency)
+            asked.add(question)
+
+            lookups = semantic_cache.hits + semantic_cache.misses
+            latencies["bypassed"].append(send(handler, history, FOLLOW_UP))
+            assert semantic_cache.hits + semantic_cache.misses == lookups, i
+            assert len(history) == 4, history
+
+    for name, values in latencies.items():
+        p50, p95 = np.percentile(np.asarray(values) * 1000, [50, 95])
+        print(f"{name:<9} {len(values):3d} calls  p50 {p50:8.2f} ms  p95 {p95:8.2f} ms")
+    print(f"Semantic cache: {semantic_cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Cold start of the RAG pipeline, with and without the background warm-up.
+
+The FAQs are indexed once in a temporary store with the hash embeddings of fakes.py.
+Each run then starts a fresh interpreter that times the import of run_evaluation.py,
+opens the store, builds the retriever and, in the "warm-up" mode, waits for
+`start_warm_up` before serving. It retrieves the questions of items_eval_en.json one at
+a time and reports the time to be ready, the wait for the warm-up, the latency of the
+first question against the p50 of the next ones, and the time the first judged item
+waits for the ragas judge. The startup breakdown of the last warm-up run is printed at
+the end.
+
+    uv run python 5_Evaluation/benchmarks/bench_startup.py
+"""
+
+import json
+import os
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+os.environ.update(
+    {
+        "LANGFUSE_TRACING_ENABLED": "false",
+        "LANGFUSE_PUBLIC_KEY": "pk-bench",
+        "LANGFUSE_SECRET_KEY": "sk-bench",
+        "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY") or "sk-bench",
+        "QDRANT_URL": "",
+    }
+)
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+PATH_EVAL_DATA = Path(__file__).parent.parent / "data" / "items_eval_en.json"
+N_RUNS = 3
+N_QUESTIONS = 20
+MODES = ["cold", "warm-up"]
+
+
+def child(path_to_vector_store: str, mode: str):
+    """One fresh process: import, startup, then the questions; prints its timings."""
+    # Imported here and not at the top: these imports are part of what is measured
+    start_time = perf_counter()
+    import run_evaluation
+
+    import_time = perf_counter() - start_time
+    ragas_imported = "ragas" in sys.modules
+
+    from fakes import FakeChatModel, HashEmbeddings, HashSparseEmbeddings
+    from index_faq import open_vector_store
+    from utils.metrics import get_judge
+    from utils.retrieval import ParallelHybridRetriever
+    from utils.warmup import StartupProfile, start_warm_up
+
+    with open(PATH_EVAL_DATA, "r") as f:
+        questions = [item["input"] for item in json.load(f)][:N_QUESTIONS]
+
+    profile = StartupProfile()
+    profile.observe("imports", import_time)
+    with profile.phase("vector_store"):
+        vector_store = open_vector_store(
+            HashEmbeddings(), HashSparseEmbeddings(), Path(path_to_vector_store)
+        )
+    with profile.phase("clients"):
+        retriever = ParallelHybridRetriever(vector_store)
+    if mode == "warm-up":
+        warm_up = start_warm_up(
+            vector_store,
+            retriever=retriever,
+            llm=FakeChatModel(),
+            judge=True,
+            profile=profile,
+        )
+        with profile.phase("warm_up_wait"):
+            warm_up.result()
+
+    latencies = []
+    for question in questions:
+        start_time = perf_counter()
+        retriever.similarity_search_with_relevance_scores(
+            question, k=run_evaluation.K_RETRIEVAL
+        )
+        latencies.append(perf_counter() - start_time)
+    start_time = perf_counter()
+    get_judge()
+    judge_time = perf_counter() - start_time
+    vector_store.client.close()
+
+    print(
+        json.dumps(
+            {
+                "ready": sum(profile.phases.values())
+                - profile.phases.get("warm_up_wait", 0.0),
+                "wait": profile.phases.get("warm_up_wait", 0.0),
+                "imports": import_time,
+                "ragas_imported": ragas_imported,
+                "first": latencies[0],
+                "next_p50": float(np.percentile(latencies[1:], 50)),
+                "judge": judge_time,
+                "summary": profile.summary(),
+            }
+        )
+    )
+
+
+def main():
+    from fakes import HashEmbeddings, HashSparseEmbeddings
+    from index_faq import PATH_DATA, open_vector_store
+    from ingest_faq import stream_ingest
+    from utils.resources import get_langfuse_client
+
+    with open(PATH_DATA, "r") as f:
+        faq_data = json.load(f)
+    get_langfuse_client()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        vector_store = open_vector_store(
+            HashEmbeddings(), HashSparseEmbeddings(), Path(tmp_dir), force_recreate=True
+        )
+        stream_ingest(faq_data, vector_store)
+        vector_store.client.close()
+
+        print(f"{N_RUNS} runs per mode, {N_QUESTIONS} questions per run")
+        summary = ""
+        for mode in MODES:
+            runs = []
+            for _ in range(N_RUNS):
+                output = subprocess.run(
+                    [sys.executable, __file__, tmp_dir, mode],
+                    check=True,
+                    capture_output=True,
+                    text=True,
+                ).stdout
+                runs.append(json.loads(output.strip().splitlines()[-1]))
+            summary = runs[-1]["summary"]
+
+            def median_ms(key: str) -> float:
+                return np.median([run[key] for run in runs]) * 1000
+
+            print(
+                f"{mode:<8} import {median_ms('imports'):6.0f} ms "
+                f"(ragas imported: {runs[-1]['ragas_imported']})  "
+                f"ready {median_ms('ready'):6.0f} ms + {median_ms('wait'):6.0f} ms "
+                "warm-up wait  "
+                f"first question {median_ms('first'):7.2f} ms  "
+                f"next p50 {median_ms('next_p50'):6.2f} ms  "
+                f"first judge {median_ms('judge'):6.1f} ms"
+            )
+        print(f"Startup breakdown of the last warm-up run:\n{summary}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        child(*sys.argv[1:])
+    else:
+        main()
@@ -0,0 +1,102 @@
+"""
+Load test of the vector store served by a Qdrant server (see serve_vector_store.py).
+
+Runs the hybrid search of the app (dense + BM25 legs fused with RRF) from 1, 2, 4, ...
+reader processes at once, each with its own gRPC connection, and reports the total
+throughput and latency percentiles for each number of readers. The queries reuse
+vectors stored in the collection, so no embedding API call is made.
+
+    uv run python 5_Evaluation/serve_vector_store.py          # in another terminal
+    uv run python 5_Evaluation/benchmarks/bench_vector_store_server.py
+"""
+
+import os
+import sys
+from multiprocessing import Pool
+from pathlib import Path
+from time import perf_counter
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from index_faq import COLLECTION_NAME  # noqa: E402
+from qdrant_client import QdrantClient, models  # noqa: E402
+from serve_vector_store import HTTP_PORT  # noqa: E402
+
+QDRANT_URL = os.environ.get("QDRANT_URL", f"http://localhost:{HTTP_PORT}")
+N_QUERIES = 200
+QUERIES_PER_READER = 500
+K = 4
+
+
+def sample_queries(client: QdrantClient, n_queries: int = N_QUERIES) -> list[tuple]:
+    points, _ = client.scroll(
+        COLLECTION_NAME, limit=n_queries, with_payload=False, with_vectors=True
+    )
+    return [
+        (
+            point.vector["dense"],
+            point.vector["sparse"].indices,
+            point.vector["sparse"].values,
+        )
+        for point in points
+    ]
+
+
+def hybrid_query(client: QdrantClient, dense, sparse_indices, sparse_values):
+    return client.query_points(
+        COLLECTION_NAME,
+        prefetch=[
+            models.Prefetch(query=dense, using="dense", limit=K),
+            models.Prefetch(
+                query=models.SparseVector(indices=sparse_indices, values=sparse_values),
+                using="sparse",
+                limit=K,
+            ),
+        ],
+        query=models.FusionQuery(fusion=models.Fusion.RRF),
+        limit=K,
+    )
+
+
+def reader(args) -> list[float]:
+    """Run the queries from a separate process, return the latency of each one."""
+    queries, n_queries = args
+    client = QdrantClient(url=QDRANT_URL, prefer_grpc=True)
+    hybrid_query(client, *queries[0])  # Connection setup out of the timings
+    latencies = []
+    for i in range(n_queries):
+        start_time = perf_counter()
+        hybrid_query(client, *queries[i % len(queries)])
+        latencies.append(perf_counter() - start_time)
+    client.close()
+    return latencies
+
+
+def main():
+    queries = sample_queries(QdrantClient(url=QDRANT_URL, prefer_grpc=True))
+    n_readers_list = [1]
+    while n_readers_list[-1] * 2 <= os.cpu_count():
+        n_readers_list.append(n_readers_list[-1] * 2)
+
+    print(
+        f"{len(queries)} distinct queries against {QDRANT_URL}, {os.cpu_count()} cores"
+    )
+    base_qps = None
+    for n_readers in n_readers_list:
+        with Pool(n_readers) as pool:
+            start_time = perf_counter()
+            results = pool.map(reader, [(queries, QUERIES_PER_READER)] * n_readers)
+            elapsed = perf_counter() - start_time
+        latencies = np.concatenate(results) * 1000
+        qps = len(latencies) / elapsed
+        base_qps = base_qps or qps
+        print(
+            f"{n_readers:3d} readers {qps:8.0f} queries/s  x{qps / base_qps:.2f}  "
+            f"p50 {np.percentile(latencies, 50):6.2f} ms  p95 {np.percentile(latencies, 95):6.2f} ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,477 @@
+"""
+Deterministic local stand-ins for the OpenAI and Langfuse backends, used by the benchmarks.
+
+- `FakeChatModel`: chat model with a configurable time to first token and token rate,
+  answering with words of its prompt; bound to tools, it calls the first one once.
+- `HashEmbeddings`: 1536-dimensional feature-hashing embeddings, texts sharing words
+  are close, as with `text-embedding-3-small`.
+- `HashSparseEmbeddings`: BM25-like sparse vectors of hashed words, in place of FastEmbed.
+- `FakeGroundednessScorer`: groundedness judge scoring the share of response words
+  found in the contexts.
+- `FakeCrossEncoder`: cross-encoder scoring the share of query words found in the chunk,
+  with a fixed CPU time per pair.
+- `use_offline_encoding`: a 4 characters per token stand-in for a tiktoken encoding
+  whose BPE file cannot be downloaded.
+- `LangfuseSink`: in-process HTTP server answering the Langfuse API calls of the app
+  (OTLP traces, score ingestion, datasets) and counting what it receives.
+"""
+
+import asyncio
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, unquote, urlparse
+from uuid import uuid4
+
+import numpy as np
+import tiktoken
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, ToolMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_qdrant.sparse_embeddings import SparseEmbeddings, SparseVector
+from opentelemetry.proto.collector.trace.v1.trace_service_pb2 import (
+    ExportTraceServiceRequest,
+)
+
+EMBEDDING_SIZE = 1536  # text-embedding-3-small
+SPARSE_SIZE = 1 << 20
+BM25_K1 = 1.2
+NOW = "2025-01-01T00:00:00.000Z"
+
+_WORD = re.compile(r"\w+")
+
+
+def words(text: str) -> list[str]:
+    return _WORD.findall(text.lower())
+
+
+def stable_hash(text: str) -> int:
+    """64-bit hash that, unlike `hash`, is the same in every process."""
+    return int.from_bytes(
+        hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest(), "little"
+    )
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model answering after `latency_seconds`, then at `tokens_per_second`.
+
+    With `prefill_tokens_per_second`, the time to first token also grows with the prompt
+    size, as the prompt processing of a real model does.
+
+    The answer is `n_output_tokens` words drawn from the prompt with a seed derived from
+    it, so the same prompt always gets the same answer. With tools bound, the first call
+    of a conversation requests the first tool with the last user message as `query`, and
+    the answer comes once a tool result is in the messages.
+    """
+
+    latency_seconds: float = 0.05
+    tokens_per_second: float = 1000.0
+    prefill_tokens_per_second: float | None = None
+    n_output_tokens: int = 50
+    tool_names: list[str] = []
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer(self, messages) -> AIMessage:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if self.tool_names and not any(
+            isinstance(message, ToolMessage) for message in messages
+        ):
+            return AIMessage(
+                content="",
+                tool_calls=[
+                    {
+                        "name": self.tool_names[0],
+                        "args": {"query": str(messages[-1].content)},
+                        "id": f"call_{stable_hash(prompt):016x}",
+                    }
+                ],
+                usage_metadata=self._usage(prompt, 1),
+            )
+        vocabulary = words(prompt) or ["answer"]
+        rng = random.Random(stable_hash(prompt))
+        content = " ".join(rng.choices(vocabulary, k=self.n_output_tokens))
+        return AIMessage(
+            content=content,
+            usage_metadata=self._usage(prompt, self.n_output_tokens),
+        )
+
+    @staticmethod
+    def _usage(prompt: str, output_tokens: int) -> dict:
+        input_tokens = len(words(prompt))
+        return {
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        }
+
+    def _first_token_seconds(self, message: AIMessage) -> float:
+        if not self.prefill_tokens_per_second:
+            return self.latency_seconds
+        return (
+            self.latency_seconds
+            + message.usage_metadata["input_tokens"] / self.prefill_tokens_per_second
+        )
+
+    def _generation_seconds(self, message: AIMessage) -> float:
+        return (
+            self._first_token_seconds(message)
+            + message.usage_metadata["output_tokens"] / self.tokens_per_second
+        )
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        message = self._answer(messages)
+        time.sleep(self._generation_seconds(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(
+        self, messages, stop=None, run_manager=None, **kwargs
+    ) -> ChatResult:
+        message = self._answer(messages)
+        await asyncio.sleep(self._generation_seconds(message))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _chunks(self, message: AIMessage) -> list[AIMessageChunk]:
+        if message.tool_calls:
+            return [
+                AIMessageChunk(
+                    content="",
+                    tool_call_chunks=[
+                        {**call, "args": json.dumps(call["args"]), "index": 0}
+                        for call in message.tool_calls
+                    ],
+                    usage_metadata=message.usage_metadata,
+                )
+            ]
+        tokens = message.content.split(" ")
+        return [
+            AIMessageChunk(content=token if i == 0 else f" {token}")
+            for i, token in enumerate(tokens)
+        ]
+
+    def _stream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._answer(messages)
+        time.sleep(self._first_token_seconds(message))
+        for chunk in self._chunks(message):
+            time.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.content, chunk=chunk)
+            yield ChatGenerationChunk(message=chunk)
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        message = self._answer(messages)
+        await asyncio.sleep(self._first_token_seconds(message))
+        for chunk in self._chunks(message):
+            await asyncio.sleep(1 / self.tokens_per_second)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.content, chunk=chunk)
+            yield ChatGenerationChunk(message=chunk)
+
+    def bind_tools(self, tools, **kwargs) -> "FakeChatModel":
+        return self.model_copy(
+            update={"tool_names": [getattr(tool, "name", tool) for tool in tools]}
+        )
+
+
+class HashEmbeddings(Embeddings):
+    """
+    Signed feature hashing of the words of a text, L2-normalized.
+
+    `latency_seconds` is waited once per call, as for one round trip to the API.
+    """
+
+    def __init__(self, size: int = EMBEDDING_SIZE, latency_seconds: float = 0.0):
+        self.size = size
+        self.latency_seconds = latency_seconds
+
+    def _embed(self, text: str) -> list[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for word in words(text):
+            word_hash = stable_hash(word)
+            vector[word_hash % self.size] += 1.0 if word_hash >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        if norm == 0:
+            vector[0], norm = 1.0, 1.0
+        return (vector / norm).tolist()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        time.sleep(self.latency_seconds)
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        await asyncio.sleep(self.latency_seconds)
+        return [self._embed(text) for text in texts]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        return (await self.aembed_documents([text]))[0]
+
+
+class HashSparseEmbeddings(SparseEmbeddings):
+    """Hashed words weighted with the BM25 term frequency saturation."""
+
+    def embed_query(self, text: str) -> SparseVector:
+        counts = Counter(stable_hash(word) % SPARSE_SIZE for word in words(text))
+        indices = sorted(counts)
+        return SparseVector(
+            indices=indices,
+            values=[counts[i] * (BM25_K1 + 1) / (counts[i] + BM25_K1) for i in indices],
+        )
+
+    def embed_documents(self, texts: list[str]) -> list[SparseVector]:
+        return [self.embed_query(text) for text in texts]
+
+
+class FakeEncoding:
+    """Stand-in for a `tiktoken.Encoding` counting one token per 4 characters."""
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def encode(self, text: str, **kwargs) -> list[int]:
+        return [0] * (len(text) // 4)
+
+
+def use_offline_encoding(encoding_name: str) -> str:
+    """
+    Register `FakeEncoding` under `encoding_name` if tiktoken cannot load it (offline).
+
+    Returns:
+        What the token counts of the run are based on, to print with its results
+    """
+    try:
+        tiktoken.get_encoding(encoding_name)
+        return f"tiktoken {encoding_name}"
+    except Exception as error:
+        tiktoken.registry.ENCODINGS[encoding_name] = FakeEncoding(encoding_name)
+        return (
+            f"FAKE 4 characters per token, tiktoken {encoding_name} unavailable "
+            f"({type(error).__name__})"
+        )
+
+
+class FakeGroundednessScorer:
+    """Stand-in for the ragas `ResponseGroundedness` scorer, with a fixed latency."""
+
+    def __init__(self, latency_seconds: float = 0.05):
+        self.latency_seconds = latency_seconds
+
+    async def ascore(self, response: str, retrieved_contexts: list[str]):
+        await asyncio.sleep(self.latency_seconds)
+        response_words = words(response)
+        context_words = set(words(" ".join(retrieved_contexts)))
+        value = (
+            sum(word in context_words for word in response_words) / len(response_words)
+            if response_words
+            else 0.0
+        )
+        return SimpleNamespace(value=value)
+
+
+class FakeCrossEncoder:
+    """
+    Stand-in for a sentence-transformers `CrossEncoder`, scoring (query, text) pairs.
+
+    The score is the share of distinct query words found in the text. Each call waits
+    `seconds_per_batch` per batch of `batch_size` pairs, as for one forward pass.
+    """
+
+    def __init__(self, seconds_per_batch: float = 0.02):
+        self.seconds_per_batch = seconds_per_batch
+
+    def predict(
+        self, pairs, batch_size: int = 32, show_progress_bar=None
+    ) -> np.ndarray:
+        time.sleep(self.seconds_per_batch * -(-len(pairs) // batch_size))
+        scores = []
+        for query, text in pairs:
+            query_words = set(words(query))
+            text_words = set(words(text))
+            scores.append(
+                len(query_words & text_words) / len(query_words) if query_words else 0.0
+            )
+        return np.array(scores, dtype=np.float32)
+
+
+class LangfuseSinkServer(ThreadingHTTPServer):
+    # The default backlog of 5 connections refuses part of the concurrent exports
+    request_queue_size = 128
+    daemon_threads = True
+
+
+class LangfuseSinkHandler(BaseHTTPRequestHandler):
+    # Bound to a sink by `LangfuseSink.__init__`
+    sink: "LangfuseSink" = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: dict):
+        payload = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _body(self) -> bytes:
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        if self.headers.get("Content-Encoding") == "gzip":
+            body = gzip.decompress(body)
+        return body
+
+    def do_POST(self):
+        path = urlparse(self.path).path
+        body = self._body()
+        sink = self.sink
+        if path == "/api/public/otel/v1/traces":
+            request = ExportTraceServiceRequest.FromString(body)
+            span_names = [
+                span.name
+                for resource_spans in request.resource_spans
+                for scope_spans in resource_spans.scope_spans
+                for span in scope_spans.spans
+            ]
+            with sink.lock:
+                sink.span_names.update(span_names)
+                sink.trace_bytes += len(body)
+            return self._send(200, {})
+
+        body = json.loads(body)
+        if path == "/api/public/ingestion":
+            with sink.lock:
+                sink.events.update(event["type"] for event in body["batch"])
+            return self._send(
+                207,
+                {
+                    "successes": [
+                        {"id": event["id"], "status": 201} for event in body["batch"]
+                    ],
+                    "errors": [],
+                },
+            )
+        if path == "/api/public/dataset-run-items":
+            with sink.lock:
+                sink.run_items += 1
+            return self._send(
+                200,
+                {
+                    "id": str(uuid4()),
+                    "datasetRunId": body["runName"],
+                    "datasetRunName": body["runName"],
+                    "datasetItemId": body["datasetItemId"],
+                    "traceId": body.get("traceId") or "",
+                    "createdAt": NOW,
+                    "updatedAt": NOW,
+                },
+            )
+        self._send(404, {"message": path})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        datasets = self.sink.datasets
+        if url.path.startswith("/api/public/v2/datasets/"):
+            name = unquote(url.path.rsplit("/", 1)[1])
+            if name not in datasets:
+                return self._send(404, {"message": name})
+            return self._send(
+                200,
+                {
+                    "id": name,
+                    "name": name,
+                    "projectId": "project",
+                    "createdAt": NOW,
+                    "updatedAt": NOW,
+                },
+            )
+        if url.path == "/api/public/dataset-items":
+            query = parse_qs(url.query)
+            page, limit = int(query["page"][0]), int(query["limit"][0])
+            items = datasets.get(query["datasetName"][0], [])
+            return self._send(
+                200,
+                {
+                    "data": items[(page - 1) * limit : page * limit],
+                    "meta": {
+                        "page": page,
+                        "limit": limit,
+                        "totalItems": len(items),
+                        "totalPages": max(1, -(-len(items) // limit)),
+                    },
+                },
+            )
+        self._send(404, {"message": url.path})
+
+
+class LangfuseSink:
+    """
+    Local Langfuse endpoint, served from a background thread of the current process.
+
+    Example:
+        sink = LangfuseSink()
+        sink.add_dataset("rag-eval-dataset", items)
+        langfuse_client = Langfuse(public_key="pk", secret_key="sk", host=sink.url)
+        ...
+        langfuse_client.flush()
+        print(sink.stats())
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.datasets: dict[str, list[dict]] = {}
+        self.span_names = Counter()
+        self.events = Counter()
+        self.trace_bytes = 0
+        self.run_items = 0
+        handler = type(
+            "BoundLangfuseSinkHandler", (LangfuseSinkHandler,), {"sink": self}
+        )
+        self.server = LangfuseSinkServer(("127.0.0.1", 0), handler)
+        self.url = f"http://127.0.0.1:{self.server.server_port}"
+        self._thread = threading.Thread(
+            target=self.server.serve_forever, name="langfuse-sink", daemon=True
+        )
+        self._thread.start()
+
+    def add_dataset(self, name: str, items: list[dict]):
+        """Serve `items` (dicts with input, expected_output and metadata) as a dataset."""
+        self.datasets[name] = [
+            {
+                "id": f"{name}-{i}",
+                "status": "ACTIVE",
+                "input": item["input"],
+                "expectedOutput": item.get("expected_output"),
+                "metadata": item.get("metadata"),
+                "datasetId": name,
+                "datasetName": name,
+                "createdAt": NOW,
+                "updatedAt": NOW,
+            }
+            for i, item in enumerate(items)
+        ]
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "spans": sum(self.span_names.values()),
+                "trace_bytes": self.trace_bytes,
+                "scores": self.events["score-create"],
+                "run_items": self.run_items,
+            }
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
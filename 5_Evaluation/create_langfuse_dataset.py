@@ -1,24 +1,33 @@
 import json
-import os
+import random
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
-from dotenv import load_dotenv
+import httpx
 from langfuse._client.client import Langfuse
+from langfuse.api.core.api_error import ApiError
+from langfuse.api.resources.commons.types import DatasetItem, DatasetStatus
+from utils.resources import get_langfuse_client
+
+sys.path.insert(0, str(Path(__file__).parent))
 
 this_dir = Path(__file__).parent
 PATH_DATA = this_dir / "data" / "items_eval_en.json"
 DATASET_NAME = "rag-eval-dataset"
 DATASET_DESCRIPTION = "This is a dataset for evaluating the RAG system"
 DATASET_METADATA = {"version": "1.0.0"}
+MAX_WORKERS = 16
+MAX_RETRIES = 5
+BACKOFF_SECONDS = 0.5
+LIST_PAGE_SIZE = 100
 
 
 def create_langfuse_client() -> Langfuse:
-    load_dotenv()
-    return Langfuse(
-        public_key=os.environ["LANGFUSE_PUBLIC_KEY"],
-        secret_key=os.environ["LANGFUSE_SECRET_KEY"],
-        host=os.environ["LANGFUSE_BASE_URL"],
-    )
+    # Shared with every other caller of the process, see utils/resources.py
+    return get_langfuse_client()
 
 
 def create_dataset(
@@ -52,6 +61,194 @@ def populate_dataset(dataset_name: str, data: list, langfuse_client: Langfuse):
     print(f"Dataset populated: {dataset_name}")
 
 
+def item_id(dataset_name: str, example: dict) -> str:
+    """
+    Stable dataset item id derived from the item content.
+
+    The dataset name is part of it since Langfuse item ids are global across datasets.
+    """
+    payload = json.dumps(
+        {
+            "dataset_name": dataset_name,
+            "input": example["input"],
+            "expected_output": example["expected_output"],
+            "metadata": example["metadata"],
+        },
+        sort_keys=True,
+    )
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"langfuse-dataset-item/{payload}"))
+
+
+def existing_items(dataset_name: str, langfuse_client: Langfuse) -> list[DatasetItem]:
+    """Items already in the dataset, archived ones included, listed page by page."""
+    items, page = [], 1
+    while True:
+        response = langfuse_client.api.dataset_items.list(
+            dataset_name=dataset_name, page=page, limit=LIST_PAGE_SIZE
+        )
+        items += response.data
+        if response.meta.total_pages <= page:
+            return items
+        page += 1
+
+
+def existing_item_ids(dataset_name: str, langfuse_client: Langfuse) -> set[str]:
+    """Ids of the active items of the dataset."""
+    return {
+        item.id
+        for item in existing_items(dataset_name, langfuse_client)
+        if item.status == DatasetStatus.ACTIVE
+    }
+
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, ApiError) and (
+        error.status_code is None
+        or error.status_code >= 500
+        or error.status_code in (408, 429)
+    )
+
+
+def upsert_item(
+    dataset_name: str,
+    item: dict,
+    status: DatasetStatus,
+    langfuse_client: Langfuse,
+    max_retries: int = MAX_RETRIES,
+    backoff_seconds: float = BACKOFF_SECONDS,
+) -> int:
+    """
+    Upsert one item (input, expected_output, metadata and id) with the given status,
+    retrying transient errors with backoff.
+
+    Returns:
+        Number of retries it took
+    """
+    for attempt in range(max_retries + 1):
+        try:
+            langfuse_client.create_dataset_item(
+                dataset_name=dataset_name, status=status, **item
+            )
+            return attempt
+        except Exception as error:
+            if attempt == max_retries or not is_retryable(error):
+                raise
+            # Exponential backoff with jitter, so throttled workers do not retry in lockstep
+            time.sleep(backoff_seconds * 2**attempt * (0.5 + random.random()))
+
+
+def upload_item(
+    dataset_name: str,
+    example: dict,
+    langfuse_client: Langfuse,
+    max_retries: int = MAX_RETRIES,
+    backoff_seconds: float = BACKOFF_SECONDS,
+) -> int:
+    """
+    Upsert one item under its content id, active.
+
+    An archived item whose content is back in the source is reactivated.
+    """
+    return upsert_item(
+        dataset_name,
+        {
+            "input": example["input"],
+            "expected_output": example["expected_output"],
+            "metadata": example["metadata"],
+            "id": item_id(dataset_name, example),
+        },
+        DatasetStatus.ACTIVE,
+        langfuse_client,
+        max_retries=max_retries,
+        backoff_seconds=backoff_seconds,
+    )
+
+
+def archive_item(
+    dataset_name: str,
+    item: dict,
+    langfuse_client: Langfuse,
+    max_retries: int = MAX_RETRIES,
+    backoff_seconds: float = BACKOFF_SECONDS,
+) -> int:
+    """Archive an item that no longer matches any source item, keeping its content."""
+    return upsert_item(
+        dataset_name,
+        item,
+        DatasetStatus.ARCHIVED,
+        langfuse_client,
+        max_retries=max_retries,
+        backoff_seconds=backoff_seconds,
+    )
+
+
+def bulk_populate_dataset(
+    dataset_name: str,
+    data: list,
+    langfuse_client: Langfuse,
+    max_workers: int = MAX_WORKERS,
+    max_retries: int = MAX_RETRIES,
+) -> dict:
+    """
+    Upload the items concurrently, skipping those already in the dataset
+
+    Items are keyed by a hash of their content, so a rerun only uploads new or changed
+    items and never duplicates an unchanged one. An edited item gets a new id: active
+    items whose id matches no source item any more are archived.
+
+    Returns:
+        Dictionary with the number of items uploaded, skipped, archived and retried, and
+        the throughput
+    """
+    start_time = time.perf_counter()
+    existing = existing_items(dataset_name, langfuse_client)
+    active = {item.id for item in existing if item.status == DatasetStatus.ACTIVE}
+    # Duplicated examples in the source map to the same id, upload them once
+    source = {}
+    for example in data:
+        source.setdefault(item_id(dataset_name, example), example)
+    to_upload = [example for id_, example in source.items() if id_ not in active]
+    # Upserted with their content, which the upsert would otherwise clear
+    to_archive = [
+        {
+            "input": item.input,
+            "expected_output": item.expected_output,
+            "metadata": item.metadata,
+            "id": item.id,
+        }
+        for item in existing
+        if item.id in active and item.id not in source
+    ]
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        retries = list(
+            executor.map(
+                lambda example: upload_item(
+                    dataset_name, example, langfuse_client, max_retries=max_retries
+                ),
+                to_upload,
+            )
+        )
+        retries += executor.map(
+            lambda item: archive_item(
+                dataset_name, item, langfuse_client, max_retries=max_retries
+            ),
+            to_archive,
+        )
+
+    seconds = time.perf_counter() - start_time
+    return {
+        "uploaded": len(to_upload),
+        "skipped": len(data) - len(to_upload),
+        "archived": len(to_archive),
+        "retries": sum(retries),
+        "seconds": seconds,
+        "items_per_second": len(to_upload) / seconds if seconds else 0.0,
+    }
+
+
 def main():
     langfuse_client = create_langfuse_client()
     # Verify connection
@@ -70,11 +267,17 @@ def main():
     with open(PATH_DATA, "r") as f:
         data = json.load(f)
 
-    populate_dataset(
+    stats = bulk_populate_dataset(
         dataset_name=DATASET_NAME,
         data=data,
         langfuse_client=langfuse_client,
     )
+    print(
+        f"Dataset populated: {DATASET_NAME} ({stats['uploaded']} uploaded, "
+        f"{stats['skipped']} unchanged, {stats['archived']} archived, "
+        f"{stats['retries']} retries, "
+        f"{stats['items_per_second']:.1f} items/sec)"
+    )
 
 
 if __name__ == "__main__":
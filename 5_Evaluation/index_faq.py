@@ -0,0 +1,272 @@
+import json
+import os
+import re
+import sys
+from datetime import datetime
+from pathlib import Path
+from time import time
+from urllib.parse import urlparse
+
+from dotenv import load_dotenv
+from langchain_core.embeddings import Embeddings
+from langchain_qdrant import FastEmbedSparse, QdrantVectorStore, RetrievalMode
+from qdrant_client import models
+from utils.embedding_cache import CachedEmbeddings
+from utils.ingestion import (
+    CHUNK_OVERLAP,
+    CHUNK_SIZE,
+    chunk_id,
+    create_splitter,
+    faq_fingerprint,
+    split_faq,
+)
+from utils.quantization import dense_vector_params
+from utils.resources import get_openai_embeddings, get_qdrant_client
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+this_dir = Path(__file__).parent
+PATH_DATA = this_dir / "data" / "faq_en.json"
+PATH_VECTOR_STORE = this_dir / "vector_store"
+PATH_MANIFEST = PATH_VECTOR_STORE / "faq_manifest.json"
+PATH_EMBEDDING_CACHE = this_dir / "embedding_cache"
+COLLECTION_NAME = "faq_collection"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Matryoshka truncation of text-embedding-3-small (e.g. 1024), None for all 1536
+EMBEDDING_DIMENSIONS = None
+# None, "int8" or "binary" quantization of the dense vectors, see utils/quantization.py
+QUANTIZATION = None
+
+
+def get_dense_embeddings(cache_dir: Path | None = PATH_EMBEDDING_CACHE) -> Embeddings:
+    """
+    Dense embeddings of the FAQ collection, for the chunks and for the queries alike.
+
+    Every caller builds them here so that they all use `EMBEDDING_DIMENSIONS`: a query
+    vector of another size fails the dimension check of the collection.
+
+    Args:
+        cache_dir: Directory of the embedding cache, None to call the API every time
+    """
+    load_dotenv()
+    embeddings = get_openai_embeddings(EMBEDDING_MODEL, dimensions=EMBEDDING_DIMENSIONS)
+    if cache_dir is None:
+        return embeddings
+    return CachedEmbeddings(embeddings, cache_dir=cache_dir)
+
+
+def get_manifest_path(url: str | None = None) -> Path:
+    """
+    Manifest of the collection on the backend in use.
+
+    The embedded store and a Qdrant server (`QDRANT_URL`, or `url`) are indexed
+    separately, so each has its own manifest: `PATH_MANIFEST` for the embedded store, a
+    file named after the server next to it otherwise.
+    """
+    load_dotenv()
+    url = os.environ.get("QDRANT_URL") if url is None else url
+    if not url:
+        return PATH_MANIFEST
+    server = re.sub(r"[^\w.-]+", "_", urlparse(url).netloc or url)
+    return PATH_VECTOR_STORE / f"faq_manifest.{server}.json"
+
+
+def load_manifest(path: Path = PATH_MANIFEST) -> dict:
+    """Load the manifest of indexed FAQs, an empty one if nothing was indexed yet."""
+    if not path.exists():
+        return {"faqs": {}}
+    with open(path, "r") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict, path: Path = PATH_MANIFEST):
+    manifest["indexed_at"] = datetime.now().isoformat(timespec="seconds")
+    tmp_path = path.with_suffix(".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    tmp_path.replace(path)
+
+
+def diff_faqs(faq_data: list[dict], manifest: dict, splitter_config: dict) -> dict:
+    """
+    Compare the source FAQs with the manifest.
+
+    Returns:
+        Dictionary with the `new`, `changed` and `unchanged` FAQs, the `removed` faq ids
+        and the `fingerprints` of every source FAQ
+    """
+    # faq ids are integers in the source but become strings as JSON keys of the manifest
+    indexed = manifest["faqs"]
+    fingerprints = {
+        str(faq["faq_id"]): faq_fingerprint(faq, splitter_config) for faq in faq_data
+    }
+    diff = {"new": [], "changed": [], "unchanged": [], "fingerprints": fingerprints}
+    for faq in faq_data:
+        entry = indexed.get(str(faq["faq_id"]))
+        if entry is None:
+            diff["new"].append(faq)
+        elif entry["hash"] != fingerprints[str(faq["faq_id"])]:
+            diff["changed"].append(faq)
+        else:
+            diff["unchanged"].append(faq)
+    diff["removed"] = [faq_id for faq_id in indexed if faq_id not in fingerprints]
+    return diff
+
+
+def open_vector_store(
+    embeddings,
+    sparse_embeddings,
+    path_to_vector_store: Path = PATH_VECTOR_STORE,
+    force_recreate: bool = False,
+    quantization: str | None = None,
+    collection_name: str = COLLECTION_NAME,
+) -> QdrantVectorStore:
+    """
+    Open the persistent hybrid collection on the shared Qdrant handle, creating it if
+    needed.
+
+    `quantization` only applies to a new collection, see utils/quantization.py.
+    """
+    client = get_qdrant_client(path_to_vector_store)
+    if force_recreate and client.collection_exists(collection_name):
+        client.delete_collection(collection_name)
+    if not client.collection_exists(collection_name):
+        client.create_collection(
+            collection_name=collection_name,
+            vectors_config={
+                "dense": dense_vector_params(
+                    len(embeddings.embed_query("dummy_text")), quantization
+                )
+            },
+            sparse_vectors_config={"sparse": models.SparseVectorParams()},
+        )
+    return QdrantVectorStore(
+        client=client,
+        collection_name=collection_name,
+        embedding=embeddings,
+        sparse_embedding=sparse_embeddings,
+        vector_name="dense",
+        sparse_vector_name="sparse",
+        retrieval_mode=RetrievalMode.HYBRID,
+    )
+
+
+def index_faq(
+    faq_data: list[dict],
+    embeddings,
+    sparse_embeddings,
+    path_to_vector_store: Path = PATH_VECTOR_STORE,
+    path_manifest: Path | None = None,
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    encoding_name: str | None = None,
+    quantization: str | None = QUANTIZATION,
+) -> dict:
+    """
+    Incrementally index the FAQs into the persistent vector store
+
+    Only new or changed FAQs are cleaned, chunked and embedded; chunks of changed and
+    removed FAQs are deleted. Without a manifest the collection is rebuilt from scratch,
+    since its points cannot be matched to the FAQs they come from, and so it is when the
+    size or the quantization of the dense vectors changes. A new quantization reuses the
+    cached embeddings; a new size re-embeds every chunk, the embedding cache being kept
+    per (model, dimensions). `path_manifest` defaults to the manifest of the backend in
+    use, see `get_manifest_path`.
+
+    Returns:
+        Dictionary with the number of FAQs in each diff category and of chunks written
+    """
+    path_to_vector_store.mkdir(parents=True, exist_ok=True)
+    if path_manifest is None:
+        path_manifest = get_manifest_path()
+    splitter_config = {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "encoding_name": encoding_name,
+    }
+    splitter = create_splitter(**splitter_config)
+
+    manifest = load_manifest(path_manifest)
+    vectors_config = {
+        "size": len(embeddings.embed_query("dummy_text")),
+        "quantization": quantization,
+    }
+    # Manifests older than the vector settings describe the default collection
+    force_recreate = (
+        not manifest["faqs"]
+        or manifest.get(
+            "vectors", {"size": vectors_config["size"], "quantization": None}
+        )
+        != vectors_config
+    )
+    if force_recreate:
+        manifest["faqs"] = {}
+        # Tells the readers of the manifest (e.g. the semantic cache) of the rebuild
+        manifest["created_at"] = datetime.now().isoformat()
+    vector_store = open_vector_store(
+        embeddings,
+        sparse_embeddings,
+        path_to_vector_store,
+        force_recreate=force_recreate,
+        quantization=quantization,
+    )
+
+    diff = diff_faqs(faq_data, manifest, splitter_config)
+
+    # Delete the chunks of changed and removed FAQs
+    stale_ids = [
+        point_id
+        for faq_id in diff["removed"] + [str(faq["faq_id"]) for faq in diff["changed"]]
+        for point_id in manifest["faqs"][faq_id]["chunk_ids"]
+    ]
+    if stale_ids:
+        vector_store.delete(ids=stale_ids)
+    for faq_id in diff["removed"]:
+        del manifest["faqs"][faq_id]
+
+    # Upsert the chunks of new and changed FAQs
+    chunks, ids = [], []
+    for faq in diff["new"] + diff["changed"]:
+        faq_chunks = split_faq(faq, splitter)
+        faq_chunk_ids = [chunk_id(faq["faq_id"], i) for i in range(len(faq_chunks))]
+        chunks.extend(faq_chunks)
+        ids.extend(faq_chunk_ids)
+        manifest["faqs"][str(faq["faq_id"])] = {
+            "hash": diff["fingerprints"][str(faq["faq_id"])],
+            "updated_at": faq["updated_at"],
+            "chunk_ids": faq_chunk_ids,
+        }
+    if chunks:
+        vector_store.add_documents(chunks, ids=ids)
+
+    manifest["splitter"] = splitter_config
+    manifest["vectors"] = vectors_config
+    save_manifest(manifest, path_manifest)
+
+    return {
+        "new": len(diff["new"]),
+        "changed": len(diff["changed"]),
+        "removed": len(diff["removed"]),
+        "unchanged": len(diff["unchanged"]),
+        "chunks_written": len(chunks),
+        "chunks_deleted": len(stale_ids),
+    }
+
+
+def main():
+    load_dotenv()
+    embeddings = get_dense_embeddings()
+    sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
+
+    with open(PATH_DATA, "r") as f:
+        faq_data = json.load(f)
+
+    start_time = time()
+    stats = index_faq(faq_data, embeddings, sparse_embeddings)
+    end_time = time()
+    print(f"Index updated: {stats}")
+    print(f"Indexing time: {(end_time - start_time):.2f} seconds")
+
+
+if __name__ == "__main__":
+    main()
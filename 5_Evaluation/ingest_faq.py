@@ -0,0 +1,128 @@
+import sys
+from pathlib import Path
+from time import perf_counter
+
+from dotenv import load_dotenv
+from index_faq import (
+    PATH_DATA,
+    PATH_VECTOR_STORE,
+    QUANTIZATION,
+    get_dense_embeddings,
+    get_manifest_path,
+    open_vector_store,
+)
+from langchain_qdrant import FastEmbedSparse, QdrantVectorStore
+from utils.ingestion import create_splitter, iter_chunks, iter_json_records, take
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+BATCH_SIZE = 64
+MIN_BATCH_SIZE = 8
+MAX_BATCH_SIZE = 512
+TARGET_BATCH_SECONDS = 2.0
+
+
+class AdaptiveBatchSize:
+    """
+    Batch size that reacts to backpressure from the embedding API and the vector store.
+
+    Additive increase while batches finish under the target latency, halved as soon as
+    one is slower, so a throttled backend gets smaller requests instead of piling up.
+    """
+
+    def __init__(
+        self,
+        size: int = BATCH_SIZE,
+        min_size: int = MIN_BATCH_SIZE,
+        max_size: int = MAX_BATCH_SIZE,
+        target_seconds: float = TARGET_BATCH_SECONDS,
+    ):
+        self.size = size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_seconds = target_seconds
+
+    def update(self, batch_seconds: float):
+        if batch_seconds > self.target_seconds:
+            self.size = max(self.min_size, self.size // 2)
+        elif batch_seconds < self.target_seconds / 2:
+            self.size = min(self.max_size, self.size + self.min_size)
+
+
+def stream_ingest(
+    faqs,
+    vector_store: QdrantVectorStore,
+    batch_size: AdaptiveBatchSize = None,
+    splitter=None,
+) -> dict:
+    """
+    Ingest FAQs into the vector store batch by batch
+
+    FAQs are cleaned and chunked lazily; each batch of chunks is embedded (dense and
+    sparse) and upserted in one call, so memory stays bounded by the batch size.
+
+    Returns:
+        Dictionary with the number of FAQs and chunks ingested, the time and the throughput
+    """
+    batch_size = batch_size or AdaptiveBatchSize()
+    splitter = splitter or create_splitter()
+
+    stats = {"faqs": 0, "chunks": 0, "batches": 0}
+
+    def counted(records):
+        for record in records:
+            stats["faqs"] += 1
+            yield record
+
+    chunks = iter_chunks(counted(faqs), splitter)
+    start_time = perf_counter()
+    while batch := take(chunks, batch_size.size):
+        batch_start = perf_counter()
+        documents, ids = zip(*batch)
+        vector_store.add_documents(
+            list(documents), ids=list(ids), batch_size=len(batch)
+        )
+        batch_size.update(perf_counter() - batch_start)
+        stats["chunks"] += len(batch)
+        stats["batches"] += 1
+
+    stats["seconds"] = perf_counter() - start_time
+    stats["docs_per_second"] = (
+        stats["faqs"] / stats["seconds"] if stats["seconds"] else 0.0
+    )
+    stats["chunks_per_second"] = (
+        stats["chunks"] / stats["seconds"] if stats["seconds"] else 0.0
+    )
+    stats["final_batch_size"] = batch_size.size
+    return stats
+
+
+def main(path_data: Path = PATH_DATA):
+    """Rebuild the vector store from a (possibly very large) JSON or JSONL FAQ dump."""
+    load_dotenv()
+    embeddings = get_dense_embeddings()
+    sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
+
+    # The collection is rebuilt from scratch, the incremental indexer manifest no longer applies
+    get_manifest_path().unlink(missing_ok=True)
+    vector_store = open_vector_store(
+        embeddings,
+        sparse_embeddings,
+        PATH_VECTOR_STORE,
+        force_recreate=True,
+        quantization=QUANTIZATION,
+    )
+
+    stats = stream_ingest(iter_json_records(path_data), vector_store)
+    print(
+        f"Ingested {stats['faqs']} FAQs ({stats['chunks']} chunks, {stats['batches']} batches) "
+        f"in {stats['seconds']:.2f} seconds"
+    )
+    print(
+        f"Throughput: {stats['docs_per_second']:.1f} docs/sec, "
+        f"{stats['chunks_per_second']:.1f} chunks/sec (final batch size {stats['final_batch_size']})"
+    )
+
+
+if __name__ == "__main__":
+    main(Path(sys.argv[1]) if len(sys.argv) > 1 else PATH_DATA)
@@ -1,21 +1,33 @@
 import asyncio
+import contextvars
 import json
-import os
 import sys
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
-from time import time
+from time import perf_counter, process_time, time
 from uuid import uuid4
 
 from dotenv import load_dotenv
+from index_faq import COLLECTION_NAME, QUANTIZATION, get_dense_embeddings
 from langchain_core.documents import Document
 from langchain_core.messages.base import BaseMessage
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
 from langchain_qdrant import FastEmbedSparse, QdrantVectorStore, RetrievalMode
-from langfuse import Langfuse, observe
-from qdrant_client import QdrantClient
-from tqdm import tqdm
-from utils.metrics import aresponse_groundedness, hitrate
+from langfuse import Langfuse, get_client, observe
+from tqdm.asyncio import tqdm_asyncio
+from utils.context import CONTEXT_MAX_TOKENS, pack_context
+from utils.instrumentation import PIPELINE_METRICS, start_exporters
+from utils.metrics import aresponse_groundedness, get_judge, hitrate
+from utils.quantization import quantization_search_params
+from utils.rerank import RerankingRetriever
+from utils.resources import (
+    get_async_qdrant_client,
+    get_chat_model,
+    get_langfuse_client,
+    get_qdrant_client,
+)
+from utils.retrieval import ParallelHybridRetriever
+from utils.warmup import StartupProfile, awarm_up_connection, start_warm_up
 
 sys.path.insert(0, str(Path(__file__).parent))
 
@@ -25,6 +37,8 @@ MODEL_NAME = "gpt-5-nano"
 REASONING_EFFORT = "minimal"  # could be   "minimal" | "low" | "medium" | "high"  see [https://platform.openai.com/docs/guides/latest-model]
 TEMPERATURE = 0
 K_RETRIEVAL = 4
+MAX_CONCURRENCY = 8  # number of dataset items evaluated in flight, 1 means sequential
+RERANK = False  # cross-encoder rerank of more candidates, see utils/rerank.py
 
 PROMPT_TEMPLATE = """You are a helpful assistant answering questions about customer care for AI-Bay.
 
@@ -45,12 +59,8 @@ Answer:"""
 
 
 def create_langfuse_client() -> Langfuse:
-    load_dotenv()
-    return Langfuse(
-        public_key=os.environ["LANGFUSE_PUBLIC_KEY"],
-        secret_key=os.environ["LANGFUSE_SECRET_KEY"],
-        host=os.environ["LANGFUSE_BASE_URL"],
-    )
+    # Shared with every other caller of the process, see utils/resources.py
+    return get_langfuse_client()
 
 
 def load_vector_store():
@@ -62,17 +72,15 @@ def load_vector_store():
 
     print(f"Path to vector store: {path_to_vector_store}")
 
-    embeddings = OpenAIEmbeddings(
-        model="text-embedding-3-small",
-    )
+    # Cached on disk so replayed questions skip the embedding API, with the dimensions
+    # of the indexed vectors
+    embeddings = get_dense_embeddings()
 
-    # Remove the lock file if it exists so that we won't have the error: "The collection is already in use"
-    os.remove(path_to_vector_store / ".lock")
-
-    client = QdrantClient(path=path_to_vector_store)
+    # One handle per store and process: every caller shares it instead of fighting over the lock
+    client = get_qdrant_client(path_to_vector_store)
     return QdrantVectorStore(
         client=client,
-        collection_name="faq_collection",
+        collection_name=COLLECTION_NAME,
         embedding=embeddings,
         sparse_embedding=sparse_embeddings,
         vector_name="dense",
@@ -102,57 +110,246 @@ def format_docs_alternative(docs: list[Document]):
 
 
 class RagConversation:
-    def __init__(self, vector_store, llm, history=None):
+    def __init__(
+        self,
+        vector_store,
+        llm,
+        history=None,
+        retriever=None,
+        context_max_tokens=CONTEXT_MAX_TOKENS,
+    ):
         self.vector_store = vector_store
         self.llm = llm
         self.history = history if history else []
+        # Token budget of the documents in the prompt, None for the unpacked format_docs_alternative
+        self.context_max_tokens = context_max_tokens
+        # Optional drop-in for the vector store search, e.g. a ParallelHybridRetriever
+        self.retriever = retriever if retriever else vector_store
 
     def add_message(self, message: BaseMessage):
         self.history.append(message)
 
+    def build_prompt(self, question, docs):
+        """Prompt with the retrieved documents, one per FAQ within the context budget"""
+        with PIPELINE_METRICS.timer("prompt_formatting"):
+            if self.context_max_tokens is None:
+                context_str = format_docs_alternative(docs)
+            else:
+                context_str, context_stats = pack_context(
+                    docs, max_tokens=self.context_max_tokens
+                )
+                PIPELINE_METRICS.observe_tokens("context", context_stats["tokens"])
+                PIPELINE_METRICS.observe_tokens(
+                    "context_saved", context_stats["tokens_saved"]
+                )
+                get_client().update_current_generation(
+                    metadata={"context": context_stats}
+                )
+            return PROMPT_TEMPLATE.format(context=context_str, question=question)
+
     @observe(name="retriever-call", as_type="retriever")
-    def retrieve_documents(self, question, K=K_RETRIEVAL):
-        docs_and_scores = self.vector_store.similarity_search_with_relevance_scores(
-            question, k=K
+    def retrieve_documents(self, question, K=K_RETRIEVAL, prefetched=None):
+        # `prefetched`: the results of this question in a batch search of get_responses
+        if prefetched is not None:
+            return prefetched
+        with PIPELINE_METRICS.timer("retrieval"):
+            return self.retriever.similarity_search_with_relevance_scores(question, k=K)
+
+    @observe(name="batch-retriever-call", as_type="retriever")
+    def batch_retrieve_documents(self, questions, K=K_RETRIEVAL):
+        """Retrieval of all the questions in one batch search, None if unsupported"""
+        batch_search = getattr(
+            self.retriever, "batch_similarity_search_with_relevance_scores", None
         )
-        return docs_and_scores
+        if batch_search is None:
+            return None
+        with PIPELINE_METRICS.timer("batch_retrieval"):
+            return batch_search(questions, k=K)
 
     @observe(name="llm-call", as_type="generation")
     def generate_response(self, question, docs):
-        context_str = format_docs_alternative(docs)
-        prompt = PROMPT_TEMPLATE.format(context=context_str, question=question)
-        response = self.llm.invoke(prompt)
+        prompt = self.build_prompt(question, docs)
+        with PIPELINE_METRICS.timer("llm"):
+            response = self.llm.invoke(prompt)
+        PIPELINE_METRICS.record_tokens(response.usage_metadata)
         return response.content
 
+    @observe(name="llm-call", as_type="generation")
+    def generate_response_stream(self, question, docs):
+        """Yield the response tokens as they arrive, recording the time to first token"""
+        prompt = self.build_prompt(question, docs)
+        start_time = perf_counter()
+        first_token = True
+        usage_metadata = None
+        for chunk in self.llm.stream(prompt):
+            # With stream_usage, the token counts come in a chunk of their own
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            if not chunk.content:
+                continue
+            if first_token:
+                first_token = False
+                time_to_first_token = perf_counter() - start_time
+                PIPELINE_METRICS.observe("llm_first_token", time_to_first_token)
+                get_client().update_current_generation(
+                    completion_start_time=datetime.now(),
+                    metadata={"time_to_first_token": time_to_first_token},
+                )
+            yield chunk.content
+        PIPELINE_METRICS.observe("llm", perf_counter() - start_time)
+        PIPELINE_METRICS.record_tokens(usage_metadata)
+
     @observe
-    def get_response(self, question):
+    def get_response(self, question, prefetched=None):
+        with PIPELINE_METRICS.timer("get_response"):
+            docs_and_scores = self.retrieve_documents(
+                question, K=K_RETRIEVAL, prefetched=prefetched
+            )
+
+            docs = [doc for doc, score in docs_and_scores]
+            scores = [score for doc, score in docs_and_scores]
+
+            response = self.generate_response(question, docs)
+        return response, docs, scores
+
+    def get_responses(
+        self, questions: list[str], max_concurrency: int = MAX_CONCURRENCY
+    ):
+        """
+        Batch version of `get_response`
+
+        The retrieval of all the questions is done up front (one embedding request and one
+        Qdrant batch search when the retriever supports it), then each question goes through
+        the usual `get_response`, concurrently, so its spans are the same as a single call.
+
+        Returns:
+            List of (response, docs, scores), in the order of the questions
+        """
+        # Handed to each call rather than kept on the instance, so that concurrent
+        # batches never see each other's results
+        prefetched = self.batch_retrieve_documents(questions, K=K_RETRIEVAL)
+        if prefetched is None:
+            prefetched = [None] * len(questions)
+
+        with ThreadPoolExecutor(max_workers=max_concurrency) as executor:
+            # Each call runs in a copy of the caller context to keep the trace nesting
+            futures = [
+                executor.submit(
+                    contextvars.copy_context().run,
+                    self.get_response,
+                    question,
+                    docs_and_scores,
+                )
+                for question, docs_and_scores in zip(questions, prefetched)
+            ]
+            return [future.result() for future in futures]
+
+    @observe(transform_to_string=lambda items: items[-1][0] if items else "")
+    def get_response_stream(self, question):
+        """
+        Streaming variant of `get_response`
+
+        Yields:
+            (response_so_far, docs, scores) each time a new token arrives
+        """
         docs_and_scores = self.retrieve_documents(question, K=K_RETRIEVAL)
 
         docs = [doc for doc, score in docs_and_scores]
         scores = [score for doc, score in docs_and_scores]
 
-        response = self.generate_response(question, docs)
+        response = ""
+        for token in self.generate_response_stream(question, docs):
+            response += token
+            yield response, docs, scores
+
+    # Async versions, for the event loops of the evaluation and of Gradio: nothing blocks
+    # the loop, so one process serves many conversations at once. The Langfuse context
+    # lives in each asyncio task, so the spans of concurrent calls never mix.
+    @observe(name="retriever-call", as_type="retriever")
+    async def aretrieve_documents(self, question, K=K_RETRIEVAL):
+        with PIPELINE_METRICS.timer("retrieval"):
+            return await self.retriever.asimilarity_search_with_relevance_scores(
+                question, k=K
+            )
+
+    @observe(name="llm-call", as_type="generation")
+    async def agenerate_response(self, question, docs):
+        prompt = self.build_prompt(question, docs)
+        with PIPELINE_METRICS.timer("llm"):
+            response = await self.llm.ainvoke(prompt)
+        PIPELINE_METRICS.record_tokens(response.usage_metadata)
+        return response.content
+
+    @observe(name="llm-call", as_type="generation")
+    async def agenerate_response_stream(self, question, docs):
+        """Async version of `generate_response_stream`"""
+        prompt = self.build_prompt(question, docs)
+        start_time = perf_counter()
+        first_token = True
+        usage_metadata = None
+        async for chunk in self.llm.astream(prompt):
+            usage_metadata = chunk.usage_metadata or usage_metadata
+            if not chunk.content:
+                continue
+            if first_token:
+                first_token = False
+                time_to_first_token = perf_counter() - start_time
+                PIPELINE_METRICS.observe("llm_first_token", time_to_first_token)
+                get_client().update_current_generation(
+                    completion_start_time=datetime.now(),
+                    metadata={"time_to_first_token": time_to_first_token},
+                )
+            yield chunk.content
+        PIPELINE_METRICS.observe("llm", perf_counter() - start_time)
+        PIPELINE_METRICS.record_tokens(usage_metadata)
+
+    @observe
+    async def aget_response(self, question):
+        with PIPELINE_METRICS.timer("get_response"):
+            docs_and_scores = await self.aretrieve_documents(question, K=K_RETRIEVAL)
+
+            docs = [doc for doc, score in docs_and_scores]
+            scores = [score for doc, score in docs_and_scores]
+
+            response = await self.agenerate_response(question, docs)
         return response, docs, scores
 
+    @observe(transform_to_string=lambda items: items[-1][0] if items else "")
+    async def aget_response_stream(self, question):
+        """
+        Async version of `get_response_stream`, e.g. for an async Gradio handler
 
-async def async_run_evaluation(
-    dataset_name: str = DATASET_NAME,
-    rag_conversation: RagConversation = None,
-    langfuse_client: Langfuse = None,
-):
-    """
-    Run evaluation for a given agent and dataset
+        Yields:
+            (response_so_far, docs, scores) each time a new token arrives
+        """
+        docs_and_scores = await self.aretrieve_documents(question, K=K_RETRIEVAL)
+
+        docs = [doc for doc, score in docs_and_scores]
+        scores = [score for doc, score in docs_and_scores]
+
+        response = ""
+        async for token in self.agenerate_response_stream(question, docs):
+            response += token
+            yield response, docs, scores
+
+
+async def async_evaluate_item(
+    item,
+    run_name: str,
+    run_description: str,
+    rag_conversation: RagConversation,
+    langfuse_client: Langfuse,
+    semaphore: asyncio.Semaphore,
+) -> dict:
     """
+    Evaluate a single dataset item inside its own `item.run()` trace
 
-    timestamp = datetime.now().strftime("%Y-%m-%d")
-    run_name = f"{timestamp}-{str(uuid4())[:4]}-{MODEL_NAME}"
-    run_description = f"Run evaluation for {MODEL_NAME}"
+    Each call runs in its own asyncio task, so the Langfuse context opened by `item.run()`
+    only ever belongs to this item, even when many items are in flight.
 
-    # Load the dataset
-    dataset = langfuse_client.get_dataset(name=dataset_name)
-    # Loop over the dataset items
-    start_time = time()
-    for item in tqdm(dataset.items):
+    Returns:
+        Dictionary with the item scores and the time spent in each stage
+    """
+    async with semaphore:
         # Use the item.run() context manager for automatic trace linking
         with item.run(
             run_name=run_name,
@@ -165,10 +362,15 @@ async def async_run_evaluation(
             },
         ) as root_span:
             # Execute your LLM-app against the dataset item input
+            # aget_response runs in this task, so its spans nest under the item trace
             expected_source_ids = item.metadata["faq_ids"]
-            response, retrieved_docs, similarity_scores = rag_conversation.get_response(
-                item.input
-            )
+            rag_start = perf_counter()
+            (
+                response,
+                retrieved_docs,
+                similarity_scores,
+            ) = await rag_conversation.aget_response(item.input)
+            rag_time = perf_counter() - rag_start
             retrieved_sources_ids = [doc.metadata["faq_id"] for doc in retrieved_docs]
             retrieved_contexts = [doc.page_content for doc in retrieved_docs]
 
@@ -182,9 +384,11 @@ async def async_run_evaluation(
             )
 
             # LLM Generation Score
+            judge_start = perf_counter()
             response_groundedness_score = await aresponse_groundedness(
                 response, retrieved_contexts
             )
+            judge_time = perf_counter() - judge_start
             root_span.score_trace(
                 name="response_groundedness",
                 value=response_groundedness_score,
@@ -211,25 +415,133 @@ async def async_run_evaluation(
                 # optional, useful to add reasoning
             )
 
+    return {
+        "item_id": item.id,
+        "hitrate": hitrate_score,
+        "response_groundedness": response_groundedness_score,
+        "rag_time": rag_time,
+        "judge_time": judge_time,
+    }
+
+
+async def async_run_evaluation(
+    dataset_name: str = DATASET_NAME,
+    rag_conversation: RagConversation = None,
+    langfuse_client: Langfuse = None,
+    max_concurrency: int = MAX_CONCURRENCY,
+    warm_up: Future = None,
+) -> list[dict]:
+    """
+    Run evaluation for a given agent and dataset
+
+    Items are evaluated concurrently, with at most `max_concurrency` of them in flight.
+    `max_concurrency=1` gives the sequential behaviour. Results are returned in dataset order.
+    With the future of `start_warm_up`, the items start once the warm-up is done and the
+    startup breakdown is printed.
+    """
+
+    timestamp = datetime.now().strftime("%Y-%m-%d")
+    run_name = f"{timestamp}-{str(uuid4())[:4]}-{MODEL_NAME}"
+    run_description = f"Run evaluation for {MODEL_NAME}"
+
+    # Load the dataset while the connection of the async OpenAI client opens
+    dataset_start = perf_counter()
+    dataset, connection_time = await asyncio.gather(
+        asyncio.to_thread(langfuse_client.get_dataset, name=dataset_name),
+        awarm_up_connection(rag_conversation.llm),
+    )
+    dataset_time = perf_counter() - dataset_start
+    if warm_up is not None:
+        # So that the first items do not pay for the components still loading
+        startup_profile = await asyncio.wrap_future(warm_up)
+        startup_profile.observe("dataset", dataset_time)
+        startup_profile.observe(
+            "warm_up_wait", perf_counter() - dataset_start - dataset_time
+        )
+        if connection_time is not None:
+            startup_profile.observe(
+                "llm_async_connection", connection_time, background=True
+            )
+        print(f"Startup:\n{startup_profile.summary()}")
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    # Evaluate the dataset items, gather keeps the results in dataset order
+    start_time = time()
+    results = await tqdm_asyncio.gather(
+        *[
+            async_evaluate_item(
+                item,
+                run_name=run_name,
+                run_description=run_description,
+                rag_conversation=rag_conversation,
+                langfuse_client=langfuse_client,
+                semaphore=semaphore,
+            )
+            for item in dataset.items
+        ]
+    )
+
     # Flush the langfuse client to ensure all data is sent to the server at the end of the experiment run
     langfuse_client.flush()
     end_time = time()
     # logger.info(f"Evaluation time: {end_time - start_time} seconds")
-    print(f"Evaluation time: {(end_time - start_time):.2f} seconds")
+    print(
+        f"RAG time (sum over items): {sum(r['rag_time'] for r in results):.2f} seconds"
+    )
+    print(
+        f"Judge time (sum over items): {sum(r['judge_time'] for r in results):.2f} seconds"
+    )
+    print(
+        f"Evaluation time: {(end_time - start_time):.2f} seconds (max_concurrency={max_concurrency})"
+    )
+    print(f"Pipeline stages:\n{PIPELINE_METRICS.summary()}")
+    # Judge cost and latency, apart from the generation; cached scores cost nothing
+    judge_stats = get_judge().stats()
+    print(
+        f"Judge: {judge_stats['scored']} scored, {judge_stats['cached']} from cache, "
+        f"{judge_stats['judge_seconds']:.2f} seconds, {judge_stats['input_tokens']} input "
+        f"+ {judge_stats['output_tokens']} output tokens, ${judge_stats['cost_usd'] or 0:.4f}"
+    )
+    return results
 
 
 if __name__ == "__main__":
-    load_dotenv()
-    vector_store = load_vector_store()
-    llm = ChatOpenAI(
-        model=MODEL_NAME, temperature=TEMPERATURE, reasoning_effort=REASONING_EFFORT
+    startup_profile = StartupProfile()
+    # CPU time of the interpreter so far, nearly all of it spent importing
+    startup_profile.observe("imports", process_time())
+    with startup_profile.phase("exporters"):
+        load_dotenv()
+        metrics_dumper = start_exporters()
+    with startup_profile.phase("vector_store"):
+        vector_store = load_vector_store()
+    with startup_profile.phase("clients"):
+        llm = get_chat_model(
+            MODEL_NAME, temperature=TEMPERATURE, reasoning_effort=REASONING_EFFORT
+        )
+        retriever = ParallelHybridRetriever(
+            vector_store,
+            search_params=quantization_search_params(QUANTIZATION),
+            async_client=get_async_qdrant_client(
+                Path(__file__).parent / "vector_store"
+            ),
+            max_workers=MAX_CONCURRENCY,
+        )
+        if RERANK:
+            retriever = RerankingRetriever(retriever)
+        rag_conversation = RagConversation(vector_store, llm, retriever=retriever)
+        langfuse_client = create_langfuse_client()
+    # Loads the models, the store segments and the judge while the dataset is fetched
+    warm_up = start_warm_up(
+        vector_store, retriever=retriever, llm=llm, judge=True, profile=startup_profile
     )
-    rag_conversation = RagConversation(vector_store, llm)
-    langfuse_client = create_langfuse_client()
     asyncio.run(
         async_run_evaluation(
             dataset_name=DATASET_NAME,
             rag_conversation=rag_conversation,
             langfuse_client=langfuse_client,
+            max_concurrency=MAX_CONCURRENCY,
+            warm_up=warm_up,
         )
     )
+    if metrics_dumper is not None:
+        metrics_dumper.stop()
@@ -0,0 +1,225 @@
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+from index_faq import (
+    COLLECTION_NAME,
+    PATH_MANIFEST,
+    PATH_VECTOR_STORE,
+    QUANTIZATION,
+    get_manifest_path,
+    load_manifest,
+    save_manifest,
+)
+from qdrant_client import QdrantClient, models
+from utils.quantization import dense_vector_params
+from utils.resources import (
+    close_embedded_qdrant_client,
+    get_embedded_qdrant_client,
+    get_remote_qdrant_client,
+)
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+this_dir = Path(__file__).parent
+PATH_SERVER_STORAGE = this_dir / "qdrant_server_storage"
+HTTP_PORT = 6333
+GRPC_PORT = 6334
+QDRANT_IMAGE = "qdrant/qdrant"
+EXPORT_BATCH_SIZE = 256
+
+
+def launch_server(
+    storage_path: Path = PATH_SERVER_STORAGE,
+    http_port: int = HTTP_PORT,
+    grpc_port: int = GRPC_PORT,
+) -> subprocess.Popen:
+    """
+    Start a local Qdrant server in a child process.
+
+    Uses the `qdrant` binary when it is on the PATH, the official Docker image otherwise.
+    """
+    storage_path.mkdir(parents=True, exist_ok=True)
+    if shutil.which("qdrant"):
+        command = ["qdrant"]
+        env = {
+            "QDRANT__STORAGE__STORAGE_PATH": str(storage_path),
+            "QDRANT__SERVICE__HTTP_PORT": str(http_port),
+            "QDRANT__SERVICE__GRPC_PORT": str(grpc_port),
+        }
+    elif shutil.which("docker"):
+        command = [
+            "docker", "run", "--rm",
+            "-p", f"{http_port}:6333",
+            "-p", f"{grpc_port}:6334",
+            "-v", f"{storage_path.resolve()}:/qdrant/storage",
+            QDRANT_IMAGE,
+        ]  # fmt: skip
+        env = {}
+    else:
+        raise RuntimeError(
+            "Neither the qdrant binary nor docker was found, start a Qdrant server yourself"
+        )
+    return subprocess.Popen(command, env={**os.environ, **env})
+
+
+def wait_until_ready(url: str, timeout: float = 60.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"{url}/readyz", timeout=1.0).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        time.sleep(0.5)
+    raise TimeoutError(f"Qdrant server at {url} not ready after {timeout} seconds")
+
+
+def export_collection(
+    source: QdrantClient,
+    target: QdrantClient,
+    collection_name: str = COLLECTION_NAME,
+    batch_size: int = EXPORT_BATCH_SIZE,
+    quantization: str | None = None,
+) -> int:
+    """
+    Copy a collection, vectors and payloads included, from one Qdrant client to another.
+
+    The target collection is recreated with the same dense and sparse vector configuration,
+    and the point ids are kept, so the manifest of index_faq.py stays valid for it. The
+    embedded store drops the quantization of the dense vectors, `quantization` sets it
+    again on the target.
+
+    Returns:
+        Number of points copied
+    """
+    params = source.get_collection(collection_name).config.params
+    vectors_config = params.vectors
+    if quantization is not None:
+        vectors_config = {
+            **vectors_config,
+            "dense": dense_vector_params(vectors_config["dense"].size, quantization),
+        }
+    if target.collection_exists(collection_name):
+        target.delete_collection(collection_name)
+    target.create_collection(
+        collection_name=collection_name,
+        vectors_config=vectors_config,
+        sparse_vectors_config=params.sparse_vectors,
+    )
+
+    n_points, offset = 0, None
+    while True:
+        points, offset = source.scroll(
+            collection_name=collection_name,
+            limit=batch_size,
+            offset=offset,
+            with_payload=True,
+            with_vectors=True,
+        )
+        if points:
+            target.upsert(
+                collection_name=collection_name,
+                points=[
+                    models.PointStruct(
+                        id=point.id, vector=point.vector, payload=point.payload
+                    )
+                    for point in points
+                ],
+            )
+            n_points += len(points)
+        if offset is None:
+            break
+
+    exported = target.count(collection_name, exact=True).count
+    if exported != n_points:
+        raise RuntimeError(f"{exported} points on the server, {n_points} expected")
+    return n_points
+
+
+def seed_server(
+    url: str, path_to_vector_store: Path = PATH_VECTOR_STORE, reseed: bool = False
+) -> int | None:
+    """
+    Export the embedded store to the server at `url` if it has no FAQ collection yet.
+
+    An existing collection is kept, since it may have been indexed on the server since
+    (`index_faq.py` with `QDRANT_URL` set), unless `reseed` replaces it with the
+    embedded store. The manifest of the embedded store then becomes the one of the
+    server, as the point ids are kept. The embedded store is closed once exported, so
+    other processes can open it again.
+
+    Returns:
+        Number of points exported, None when the server collection was kept
+    """
+    target = get_remote_qdrant_client(url)
+    if target.collection_exists(COLLECTION_NAME) and not reseed:
+        return None
+    try:
+        n_points = export_collection(
+            get_embedded_qdrant_client(path_to_vector_store),
+            target,
+            quantization=QUANTIZATION,
+        )
+    finally:
+        close_embedded_qdrant_client(path_to_vector_store)
+
+    server_manifest = get_manifest_path(url)
+    if PATH_MANIFEST.exists():
+        save_manifest(load_manifest(PATH_MANIFEST), server_manifest)
+    else:
+        # Built by ingest_faq.py, the next index_faq.py run rebuilds the collection
+        server_manifest.unlink(missing_ok=True)
+    return n_points
+
+
+def main():
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Serve the FAQ vector store to several processes through a local Qdrant server."
+    )
+    parser.add_argument(
+        "--no-launch", action="store_true", help="Use an already running server"
+    )
+    parser.add_argument(
+        "--reseed",
+        action="store_true",
+        help="Replace the collection of the server with the embedded store",
+    )
+    args = parser.parse_args()
+
+    url = f"http://localhost:{HTTP_PORT}"
+    server = None if args.no_launch else launch_server()
+    try:
+        wait_until_ready(url)
+        n_points = seed_server(url, reseed=args.reseed)
+        if n_points is None:
+            n_points = get_remote_qdrant_client(url).count(COLLECTION_NAME).count
+            print(
+                f"Kept the {n_points} points of {COLLECTION_NAME} on {url}, "
+                "--reseed replaces them with the embedded store"
+            )
+        else:
+            print(f"Exported {n_points} points of {COLLECTION_NAME} to {url}")
+        print(
+            f"Set QDRANT_URL={url} in the .env file so every process connects to the server"
+        )
+        if server is not None:
+            print("Serving, press Ctrl+C to stop")
+            server.wait()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from time import perf_counter
+
+import pandas as pd
+from dotenv import load_dotenv
+from index_faq import get_dense_embeddings
+from langchain_qdrant import FastEmbedSparse
+from qdrant_client import QdrantClient, models
+from utils.ingestion import chunk_id, create_splitter, split_faq
+from utils.retrieval import reciprocal_rank_fusion
+from utils.retrieval_metrics import batch_retrieval_metrics
+
+sys.path.insert(0, str(Path(__file__).parent))
+
+this_dir = Path(__file__).parent
+PATH_DATA = this_dir / "data" / "faq_en.json"
+PATH_EVAL_DATA = this_dir / "data" / "items_eval_en.json"
+COLLECTION_NAME = "sweep"
+
+# Grid of the sweep: (CHUNK_SIZE, CHUNK_OVERLAP), K_RETRIEVAL and (dense, sparse) fusion weights
+CHUNK_CONFIGS = [(200, 50), (300, 70), (500, 100)]
+K_VALUES = [1, 2, 4, 8]
+FUSION_WEIGHTS = [(1.0, 1.0), (1.0, 0.5), (0.5, 1.0)]
+MAX_WORKERS = 4
+
+
+def embed_queries(
+    questions: list[str], embeddings, sparse_embeddings
+) -> tuple[list, list]:
+    """Dense and sparse vectors of the questions, computed once for the whole sweep."""
+    dense_vectors = embeddings.embed_documents(questions)
+    sparse_vectors = [sparse_embeddings.embed_query(question) for question in questions]
+    return dense_vectors, sparse_vectors
+
+
+def build_collection(
+    faq_data: list[dict],
+    chunk_size: int,
+    chunk_overlap: int,
+    embeddings,
+    sparse_embeddings,
+) -> tuple[QdrantClient, int]:
+    """In-memory hybrid collection of the FAQs chunked with the given configuration."""
+    splitter = create_splitter(chunk_size, chunk_overlap)
+    chunks, ids = [], []
+    for faq in faq_data:
+        faq_chunks = split_faq(faq, splitter)
+        chunks.extend(faq_chunks)
+        ids.extend(chunk_id(faq["faq_id"], i) for i in range(len(faq_chunks)))
+    texts = [chunk.page_content for chunk in chunks]
+    dense_vectors = embeddings.embed_documents(texts)
+    sparse_vectors = sparse_embeddings.embed_documents(texts)
+
+    client = QdrantClient(":memory:")
+    client.create_collection(
+        COLLECTION_NAME,
+        vectors_config={
+            "dense": models.VectorParams(
+                size=len(dense_vectors[0]), distance=models.Distance.COSINE
+            )
+        },
+        sparse_vectors_config={"sparse": models.SparseVectorParams()},
+    )
+    client.upload_points(
+        COLLECTION_NAME,
+        points=[
+            models.PointStruct(
+                id=point_id,
+                vector={
+                    "dense": dense_vector,
+                    "sparse": models.SparseVector(
+                        indices=sparse_vector.indices, values=sparse_vector.values
+                    ),
+                },
+                payload={"faq_id": chunk.metadata["faq_id"]},
+            )
+            for point_id, chunk, dense_vector, sparse_vector in zip(
+                ids, chunks, dense_vectors, sparse_vectors
+            )
+        ],
+    )
+    return client, len(chunks)
+
+
+def search_leg(
+    client: QdrantClient, requests: list[models.QueryRequest]
+) -> tuple[list[list], float]:
+    """Rankings of a batch of single-leg searches and the time per query."""
+    start_time = perf_counter()
+    responses = client.query_batch_points(COLLECTION_NAME, requests=requests)
+    seconds_per_query = (perf_counter() - start_time) / len(requests)
+    return [response.points for response in responses], seconds_per_query
+
+
+def faq_ids(points) -> list:
+    return [point.payload["faq_id"] for point in points]
+
+
+def metric_rows(
+    expected: list[list], retrieved: list[list], ks: list[int], **columns
+) -> list[dict]:
+    metrics = batch_retrieval_metrics(expected, retrieved, ks)
+    return [
+        {
+            **columns,
+            "k": k,
+            **{name: float(values[:, j].mean()) for name, values in metrics.items()},
+        }
+        for j, k in enumerate(ks)
+    ]
+
+
+def sweep_chunk_config(
+    chunk_config: tuple[int, int],
+    faq_data: list[dict],
+    query_vectors: tuple[list, list],
+    expected: list[list],
+    embeddings,
+    sparse_embeddings,
+    k_values: list[int] = K_VALUES,
+    fusion_weights: list[tuple[float, float]] = FUSION_WEIGHTS,
+) -> list[dict]:
+    """
+    Evaluate every retrieval mode, k and fusion weight on one chunking configuration.
+
+    Each leg is searched once with the largest k: an exact search returns the same top-k
+    for any smaller k, so the dense, sparse and hybrid results at every k are derived
+    from these two searches.
+    """
+    chunk_size, chunk_overlap = chunk_config
+    start_time = perf_counter()
+    client, n_chunks = build_collection(
+        faq_data, chunk_size, chunk_overlap, embeddings, sparse_embeddings
+    )
+    build_time = perf_counter() - start_time
+
+    dense_vectors, sparse_vectors = query_vectors
+    max_k = max(k_values)
+    dense_rankings, dense_time = search_leg(
+        client,
+        [
+            models.QueryRequest(
+                query=vector, using="dense", limit=max_k, with_payload=True
+            )
+            for vector in dense_vectors
+        ],
+    )
+    sparse_rankings, sparse_time = search_leg(
+        client,
+        [
+            models.QueryRequest(
+                query=models.SparseVector(indices=vector.indices, values=vector.values),
+                using="sparse",
+                limit=max_k,
+                with_payload=True,
+            )
+            for vector in sparse_vectors
+        ],
+    )
+    client.close()
+
+    columns = {
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "n_chunks": n_chunks,
+        "build_s": build_time,
+    }
+    rows = metric_rows(
+        expected,
+        [faq_ids(points) for points in dense_rankings],
+        k_values,
+        **columns,
+        mode="dense",
+        search_ms=dense_time * 1000,
+    )
+    rows += metric_rows(
+        expected,
+        [faq_ids(points) for points in sparse_rankings],
+        k_values,
+        **columns,
+        mode="sparse",
+        search_ms=sparse_time * 1000,
+    )
+    for dense_weight, sparse_weight in fusion_weights:
+        for k in k_values:
+            # Same as the app: each leg contributes its top k, fused with RRF down to k
+            start_time = perf_counter()
+            retrieved = [
+                faq_ids(
+                    point
+                    for point, _ in reciprocal_rank_fusion(
+                        [dense_points[:k], sparse_points[:k]],
+                        weights=[dense_weight, sparse_weight],
+                        limit=k,
+                    )
+                )
+                for dense_points, sparse_points in zip(dense_rankings, sparse_rankings)
+            ]
+            fusion_time = (perf_counter() - start_time) / len(retrieved)
+            rows += metric_rows(
+                expected,
+                retrieved,
+                [k],
+                **columns,
+                mode=f"hybrid {dense_weight:g}/{sparse_weight:g}",
+                search_ms=(dense_time + sparse_time + fusion_time) * 1000,
+            )
+    return rows
+
+
+def sweep_retrieval(
+    faq_data: list[dict],
+    eval_data: list[dict],
+    embeddings,
+    sparse_embeddings,
+    chunk_configs: list[tuple[int, int]] = CHUNK_CONFIGS,
+    k_values: list[int] = K_VALUES,
+    fusion_weights: list[tuple[float, float]] = FUSION_WEIGHTS,
+    max_workers: int = MAX_WORKERS,
+) -> pd.DataFrame:
+    """
+    Retrieval-only grid search, no LLM generation nor judge.
+
+    The questions are embedded once and their vectors reused by every configuration; the
+    chunking configurations are built and searched in parallel, each in its own local
+    in-memory collection.
+
+    Returns:
+        One row per (chunking, mode, k) with hitrate, recall, MRR, nDCG and search latency
+    """
+    questions = [item["input"] for item in eval_data]
+    expected = [item["metadata"]["faq_ids"] for item in eval_data]
+    query_vectors = embed_queries(questions, embeddings, sparse_embeddings)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = executor.map(
+            lambda chunk_config: sweep_chunk_config(
+                chunk_config,
+                faq_data,
+                query_vectors,
+                expected,
+                embeddings,
+                sparse_embeddings,
+                k_values=k_values,
+                fusion_weights=fusion_weights,
+            ),
+            chunk_configs,
+        )
+        rows = [row for config_rows in results for row in config_rows]
+    return pd.DataFrame(rows)
+
+
+def main():
+    load_dotenv()
+    # Chunks and questions are embedded through the disk cache: only new chunks cost API calls
+    embeddings = get_dense_embeddings()
+    sparse_embeddings = FastEmbedSparse(model_name="Qdrant/bm25")
+
+    with open(PATH_DATA, "r") as f:
+        faq_data = json.load(f)
+    with open(PATH_EVAL_DATA, "r") as f:
+        eval_data = json.load(f)
+
+    start_time = perf_counter()
+    grid = sweep_retrieval(faq_data, eval_data, embeddings, sparse_embeddings)
+    end_time = perf_counter()
+    grid = grid.sort_values(["k", "hitrate", "mrr"], ascending=[True, False, False])
+    print(grid.to_string(index=False, float_format="%.3f"))
+    print(
+        f"Sweep time: {(end_time - start_time):.2f} seconds ({len(grid)} configurations)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+import re
+from multiprocessing import Pool
+
+IMAGE_PATTERN = re.compile(r"!\[.*?\]\(.*?\)")
+LINK_PATTERN = re.compile(r"\[(.*?)\]\(.*?\)")
+ASTERISK_PATTERN = re.compile(r"\*")
+
+
+def remove_markdown_links_or_images(text: str):
+    """Remove markdown links and images from text."""
+    text = IMAGE_PATTERN.sub("", text)  # Remove images
+    text = LINK_PATTERN.sub(r"\1", text)  # Keep link text only
+    return text
+
+
+def remove_asterisks(text: str):
+    """Remove asterisks used for markdown emphasis."""
+    return ASTERISK_PATTERN.sub("", text)
+
+
+def clean_text_reference(text: str):
+    """Original cleaning: images, then links, then asterisks, one regex pass each."""
+    text = remove_markdown_links_or_images(text)
+    text = remove_asterisks(text)
+    return text
+
+
+def clean_text(text: str):
+    """
+    Remove markdown images, keep link text only and strip emphasis asterisks.
+
+    Same output as `clean_text_reference`, but most FAQs only need a single
+    `str.replace` pass: the image and link regexes only run when the text contains
+    `![` or `](`. Asterisks are removed before links are unwrapped, unless one sits
+    right after a `]`, where removing it could turn `[a]*(b)` into a link.
+    """
+    if "![" in text:
+        text = IMAGE_PATTERN.sub("", text)
+    if "]*" in text:
+        return LINK_PATTERN.sub(r"\1", text).replace("*", "")
+    text = text.replace("*", "")
+    if "](" in text:
+        text = LINK_PATTERN.sub(r"\1", text)
+    return text
+
+
+def clean_texts(
+    texts: list[str], processes: int = None, chunksize: int = 256
+) -> list[str]:
+    """
+    Clean a batch of texts, in a pool of `processes` worker processes for large corpora.
+
+    With `processes` left to None (or 1), texts are cleaned in the current process, which is
+    faster for anything up to a few hundred thousand short FAQs.
+    """
+    if not processes or processes == 1:
+        return [clean_text(text) for text in texts]
+    with Pool(processes) as pool:
+        return pool.map(clean_text, texts, chunksize=chunksize)
@@ -0,0 +1,89 @@
+from langchain_core.documents import Document
+from utils.ingestion import approx_token_length
+from utils.tokens import ENCODING_NAME, count_tokens
+
+CONTEXT_MAX_TOKENS = 3_000
+SEPARATOR = "\n\n"
+
+
+def format_block(i: int, body: str, faq_id) -> str:
+    """Same layout as `format_docs_alternative`."""
+    return f"Document {i}:\n{body}\nSource: {faq_id}"
+
+
+def _merge_chunks(chunks: list[Document]) -> str:
+    """Distinct retrieved chunks of one FAQ, each once, in retrieval order."""
+    return SEPARATOR.join(dict.fromkeys(chunk.page_content for chunk in chunks))
+
+
+def pack_context(
+    docs: list[Document],
+    scores: list[float] = None,
+    max_tokens: int = CONTEXT_MAX_TOKENS,
+    encoding_name: str | None = ENCODING_NAME,
+) -> tuple[str, dict]:
+    """
+    Build the prompt context from retrieved chunks, one block per FAQ, within a token budget.
+
+    Chunks are grouped by `faq_id`: each FAQ is written once, ranked by the best fused score
+    of its chunks (the retrieval order without `scores`). FAQs are added best first while
+    they fit in `max_tokens`; an FAQ whose full body does not fit is replaced by its
+    retrieved chunks only, and skipped if those do not fit either.
+
+    Args:
+        docs: Retrieved chunks, best first
+        scores: Fused scores of the chunks
+        max_tokens: Token budget of the context
+        encoding_name: tiktoken encoding of the budget, None for the 4 characters per
+            token estimate
+
+    Returns:
+        (context, stats) with stats the number of chunks, distinct FAQs and packed FAQs,
+        the tokens of the packed context and those saved over `format_docs_alternative`
+    """
+    length = (
+        (lambda text: count_tokens(text, encoding_name))
+        if encoding_name
+        else approx_token_length
+    )
+    scores = scores if scores is not None else [-rank for rank in range(len(docs))]
+
+    # Chunks grouped by FAQ, FAQs ordered by their best score (first seen on ties)
+    faqs: dict = {}
+    for doc, score in zip(docs, scores):
+        faq = faqs.setdefault(
+            doc.metadata["faq_id"], {"score": score, "body": doc.metadata["faq_body"]}
+        )
+        faq["score"] = max(faq["score"], score)
+        faq.setdefault("chunks", []).append(doc)
+    ranked = sorted(faqs.items(), key=lambda item: item[1]["score"], reverse=True)
+
+    blocks, n_tokens, n_chunks_only = [], 0, 0
+    separator_tokens = length(SEPARATOR)
+    for faq_id, faq in ranked:
+        # The body is counted without the block header, so its count is cached across requests
+        for chunks_only, body in enumerate((faq["body"], _merge_chunks(faq["chunks"]))):
+            header = format_block(len(blocks) + 1, "", faq_id)
+            block_tokens = (
+                length(body) + length(header) + (separator_tokens if blocks else 0)
+            )
+            if n_tokens + block_tokens <= max_tokens:
+                blocks.append(format_block(len(blocks) + 1, body, faq_id))
+                n_tokens += block_tokens
+                n_chunks_only += chunks_only
+                break
+
+    # What format_docs_alternative would have written: the full FAQ for every chunk
+    unpacked_tokens = sum(
+        length(doc.metadata["faq_body"])
+        + length(format_block(i, "", doc.metadata["faq_id"]))
+        for i, doc in enumerate(docs, 1)
+    ) + separator_tokens * max(len(docs) - 1, 0)
+    return SEPARATOR.join(blocks), {
+        "chunks": len(docs),
+        "faqs": len(faqs),
+        "packed_faqs": len(blocks),
+        "chunks_only": n_chunks_only,
+        "tokens": n_tokens,
+        "tokens_saved": unpacked_tokens - n_tokens,
+    }
@@ -0,0 +1,335 @@
+import atexit
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+from langchain_core.embeddings import Embeddings
+
+DEFAULT_MAX_ENTRIES = 100_000
+# Rows of the vectors file allocated at first, doubled whenever it is full
+INITIAL_ROWS = 1024
+# Log lines replayed on load before the index is rewritten, at least
+COMPACT_MIN_LINES = 10_000
+
+
+def text_hash(text: str) -> str:
+    """Stable hash of a text, used as the cache key."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class _DirectoryLock:
+    """
+    Advisory lock on a file of the cache directory, shared by the processes and by the
+    instances of a process that open the same cache.
+
+    `flock` where available; Windows only has exclusive byte-range locks, so shared
+    holders queue there too.
+    """
+
+    def __init__(self, path: Path):
+        self._file = open(path, "a+b")
+
+    def __call__(self, shared: bool = False) -> "_DirectoryLock":
+        self._shared = shared
+        return self
+
+    def __enter__(self):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_SH if self._shared else fcntl.LOCK_EX)
+        else:
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK gives up after 10 seconds
+                    continue
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _stamp(path: Path) -> tuple | None:
+    """Identity of a file version: `os.replace` gives the new version a new inode."""
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class EmbeddingCache:
+    """
+    Persistent, size-bounded store of embedding vectors for one (model, dimensions) pair.
+
+    Vectors live in a float32 file that grows by doubling up to `max_entries` rows. The
+    index (text hash -> row) is a JSON snapshot plus an append-only log of the rows
+    written since, so a put costs one short append whatever the size of the cache; the
+    snapshot is rewritten once the log outgrows it, and at exit. When the cache is full,
+    the least recently used row is overwritten.
+
+    Several processes (and several instances of a process) can share the directory: a
+    lock file serializes the writers, and every reader and writer first replays the
+    log lines written by the others since its last access, so all of them agree on the
+    row of each text. A row is only ever taken over under the lock, after that replay.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str | Path,
+        model: str,
+        dimensions: int | None = None,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.model = model
+        self.dimensions = dimensions
+        self.max_entries = max_entries
+        self.directory = Path(cache_dir) / f"{model}-{dimensions or 'native'}"
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.index_path = self.directory / "index.json"
+        self.log_path = self.directory / "index.log"
+        self.vectors_path = self.directory / "vectors.f32"
+
+        self._lock = threading.Lock()
+        self._directory_lock = _DirectoryLock(self.directory / "lock")
+        self._clear()
+        self.hits = 0
+        self.misses = 0
+        atexit.register(self.save)
+
+    def _clear(self):
+        self._dim = None
+        self._vectors = None
+        # Least recently used first, as seen by this instance
+        self._slots: OrderedDict[str, int] = OrderedDict()
+        self._texts: dict[int, str] = {}
+        self._index_stamp = None
+        self._log_offset = 0
+        self._log_lines = 0
+
+    def _assign(self, key: str, slot: int):
+        if slot >= self.max_entries:
+            # Written by an instance with a larger max_entries, not visible here
+            return
+        self._slots.pop(self._texts.get(slot), None)
+        self._slots.pop(key, None)
+        self._slots[key] = slot
+        self._texts[slot] = key
+
+    def _sync(self):
+        """Catch up with the snapshot and log written by the others, under the lock."""
+        stamp = _stamp(self.index_path)
+        if stamp != self._index_stamp:
+            self._clear()
+            if stamp is None:
+                return
+            with open(self.index_path, "r") as f:
+                index = json.load(f)
+            self._index_stamp = stamp
+            self._dim = index["dim"]
+            for key, slot in index["slots"]:
+                self._assign(key, slot)
+        if self.log_path.exists() and os.path.getsize(self.log_path) > self._log_offset:
+            with open(self.log_path, "rb") as f:
+                f.seek(self._log_offset)
+                tail = f.read()
+            # A partial last line is an interrupted write, the next writer cuts it off
+            complete = tail[: tail.rfind(b"\n") + 1]
+            for line in complete.decode("ascii").splitlines():
+                key, _, slot = line.partition(" ")
+                self._assign(key, int(slot))
+                self._log_lines += 1
+            self._log_offset += len(complete)
+
+    def _row(self, slot: int) -> np.ndarray:
+        if self._vectors is None or slot >= len(self._vectors):
+            # Grown by this or another instance since it was mapped
+            rows = os.path.getsize(self.vectors_path) // (4 * self._dim)
+            self._vectors = np.memmap(
+                self.vectors_path, dtype=np.float32, mode="r", shape=(rows, self._dim)
+            )
+        return self._vectors[slot]
+
+    def _write_snapshot(self):
+        tmp_path = self.index_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {
+                    "model": self.model,
+                    "dimensions": self.dimensions,
+                    "dim": self._dim,
+                    "slots": list(self._slots.items()),
+                },
+                f,
+            )
+        os.replace(tmp_path, self.index_path)
+        # Only once the snapshot holds them, and with every line of the log replayed
+        with open(self.log_path, "wb"):
+            pass
+        self._index_stamp = _stamp(self.index_path)
+        self._log_offset = 0
+        self._log_lines = 0
+
+    def save(self):
+        """Write the index snapshot and empty the log, if anything was logged."""
+        with self._lock, self._directory_lock():
+            self._sync()
+            if self._log_lines:
+                self._write_snapshot()
+
+    def __len__(self):
+        with self._lock, self._directory_lock(shared=True):
+            self._sync()
+            return len(self._slots)
+
+    def get_many(self, texts: list[str]) -> list[list[float] | None]:
+        """Return the cached vector of each text, or None when it is not cached."""
+        results = []
+        with self._lock, self._directory_lock(shared=True):
+            self._sync()
+            for text in texts:
+                key = text_hash(text)
+                slot = self._slots.get(key)
+                if slot is None:
+                    self.misses += 1
+                    results.append(None)
+                    continue
+                self.hits += 1
+                self._slots.move_to_end(key)
+                results.append(self._row(slot).tolist())
+        return results
+
+    def put_many(self, texts: list[str], vectors: list[list[float]]):
+        """Store vectors, evicting the least recently used ones when the cache is full."""
+        if not texts:
+            return
+        with self._lock, self._directory_lock():
+            self._sync()
+            if self._index_stamp is None:
+                # New cache: the snapshot holds `dim`, the log is replayed on top of it
+                self.vectors_path.unlink(missing_ok=True)
+                self._dim = len(vectors[0])
+                self._write_snapshot()
+            # Cut off a partial line left by an interrupted writer
+            with open(self.log_path, "ab") as f:
+                f.truncate(self._log_offset)
+
+            rows = {}
+            for text, vector in zip(texts, vectors):
+                key = text_hash(text)
+                if key in self._slots:
+                    # Written by another instance meanwhile
+                    self._slots.move_to_end(key)
+                    continue
+                if len(self._slots) < self.max_entries:
+                    slot = len(self._slots)
+                else:
+                    slot = next(iter(self._slots.values()))
+                self._assign(key, slot)
+                rows[slot] = (key, vector)
+            if not rows:
+                return
+
+            row_bytes = self._dim * 4
+            mode = "r+b" if self.vectors_path.exists() else "w+b"
+            with open(self.vectors_path, mode) as f:
+                size = os.fstat(f.fileno()).st_size
+                needed = (max(rows) + 1) * row_bytes
+                if needed > size:
+                    # Extended with zeros, without writing them on most file systems
+                    f.truncate(
+                        min(
+                            self.max_entries * row_bytes,
+                            max(needed, 2 * size, INITIAL_ROWS * row_bytes),
+                        )
+                    )
+                for slot, (_, vector) in rows.items():
+                    f.seek(slot * row_bytes)
+                    f.write(np.asarray(vector, dtype=np.float32).tobytes())
+            # The rows are written before the log lines that point to them
+            lines = "".join(f"{key} {slot}\n" for slot, (key, _) in rows.items())
+            with open(self.log_path, "ab") as f:
+                f.write(lines.encode("ascii"))
+            self._log_offset += len(lines)
+            self._log_lines += len(rows)
+            if self._log_lines > max(COMPACT_MIN_LINES, len(self._slots)):
+                self._write_snapshot()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    LangChain `Embeddings` wrapper that only calls the underlying model for unseen texts.
+
+    Example:
+        embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(model="text-embedding-3-small"), cache_dir="embedding_cache"
+        )
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        cache_dir: str | Path,
+        max_entries: int = DEFAULT_MAX_ENTRIES,
+    ):
+        self.embeddings = embeddings
+        self.cache = EmbeddingCache(
+            cache_dir,
+            model=getattr(embeddings, "model", type(embeddings).__name__),
+            dimensions=getattr(embeddings, "dimensions", None),
+            max_entries=max_entries,
+        )
+
+    def _split(self, texts: list[str]):
+        vectors = self.cache.get_many(texts)
+        # Deduplicate misses so a text repeated in the batch is only embedded once
+        missing = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        return vectors, missing
+
+    @staticmethod
+    def _merge(texts, vectors, missing, new_vectors):
+        computed = dict(zip(missing, new_vectors))
+        return [v if v is not None else computed[t] for t, v in zip(texts, vectors)]
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors, missing = self._split(texts)
+        new_vectors = self.embeddings.embed_documents(missing) if missing else []
+        self.cache.put_many(missing, new_vectors)
+        return self._merge(texts, vectors, missing, new_vectors)
+
+    def embed_query(self, text: str) -> list[float]:
+        (vector,) = self.cache.get_many([text])
+        if vector is None:
+            vector = self.embeddings.embed_query(text)
+            self.cache.put_many([text], [vector])
+        return vector
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        vectors, missing = self._split(texts)
+        new_vectors = await self.embeddings.aembed_documents(missing) if missing else []
+        self.cache.put_many(missing, new_vectors)
+        return self._merge(texts, vectors, missing, new_vectors)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        (vector,) = self.cache.get_many([text])
+        if vector is None:
+            vector = await self.embeddings.aembed_query(text)
+            self.cache.put_many([text], [vector])
+        return vector
@@ -0,0 +1,154 @@
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from langchain_core.messages.base import BaseMessage
+from utils.tokens import ENCODING_NAME, count_tokens
+
+HISTORY_MAX_TOKENS = 1_000
+# When the budget is exceeded, older turns are folded until the verbatim part fits in this share of it
+HISTORY_KEEP_RATIO = 0.5
+SUMMARY_MAX_WORDS = 150
+# Summaries in flight at once, across all the conversations of the process
+SUMMARY_WORKERS = 4
+
+_SUMMARY_EXECUTOR = ThreadPoolExecutor(
+    max_workers=SUMMARY_WORKERS, thread_name_prefix="history-summary"
+)
+
+SUMMARY_PROMPT = """Progressively summarize the conversation between a user and the AI-Bay customer care assistant.
+Keep the facts useful to answer the next questions (user situation, orders, issues, answers already given).
+Answer with the new summary only, in at most {max_words} words.
+
+Current summary:
+{summary}
+
+New lines of conversation:
+{new_lines}
+
+New summary:"""
+
+
+def message_to_line(message: BaseMessage) -> str:
+    return f"{message.type}: {message.content}"
+
+
+class TokenBudgetHistory:
+    """
+    Conversation history bounded by a token budget.
+
+    Recent messages are kept verbatim. Once they exceed `max_tokens`, the oldest ones are
+    folded into a running summary (with `llm`, or simply dropped without it) until the
+    verbatim part fits in `keep_ratio * max_tokens`. The rendered history is cached and
+    only rebuilt when messages are folded.
+
+    The summary is written by `llm` in a background thread, so `append` never waits for
+    it: the messages being folded stay in the history verbatim until it is ready, and it
+    replaces them at the next `append` or `to_string` after that. `wait` blocks until
+    it is applied.
+
+    It behaves like the plain list it replaces for `append`, iteration and `len`.
+    """
+
+    def __init__(
+        self,
+        llm=None,
+        max_tokens: int = HISTORY_MAX_TOKENS,
+        keep_ratio: float = HISTORY_KEEP_RATIO,
+        encoding_name: str = ENCODING_NAME,
+        messages: list[BaseMessage] = None,
+    ):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.keep_ratio = keep_ratio
+        self.encoding_name = encoding_name
+        self.summary = ""
+        self._messages: deque[tuple[BaseMessage, str, int]] = deque()
+        self._tokens = 0
+        self._string = ""
+        # Summary being written in the background, of the first `_n_folding` messages
+        self._folding: Future | None = None
+        self._n_folding = 0
+        for message in messages or []:
+            self.append(message)
+
+    def append(self, message: BaseMessage):
+        self._apply_fold()
+        line = message_to_line(message)
+        n_tokens = count_tokens(line, self.encoding_name)
+        self._messages.append((message, line, n_tokens))
+        self._tokens += n_tokens
+        self._string = f"{self._string}\n{line}" if self._string else line
+        if self._tokens > self.max_tokens and self._folding is None:
+            self._fold()
+
+    def _fold(self):
+        # Fold whole turns: the verbatim part always starts with a user message
+        n_folded, tokens = 0, self._tokens
+        while n_folded < len(self._messages) and (
+            tokens > self.keep_ratio * self.max_tokens
+            or self._messages[n_folded][0].type != "human"
+        ):
+            tokens -= self._messages[n_folded][2]
+            n_folded += 1
+        if not n_folded:
+            return
+        if self.llm is None:
+            self._drop(n_folded)
+            return
+        prompt = SUMMARY_PROMPT.format(
+            max_words=SUMMARY_MAX_WORDS,
+            summary=self.summary or "(empty)",
+            new_lines="\n".join(line for _, line, _ in list(self._messages)[:n_folded]),
+        )
+        self._folding = _SUMMARY_EXECUTOR.submit(self.llm.invoke, prompt)
+        self._n_folding = n_folded
+
+    def _drop(self, n_messages: int):
+        for _ in range(n_messages):
+            self._tokens -= self._messages.popleft()[2]
+        self._string = self._render()
+
+    def _apply_fold(self, wait: bool = False):
+        """Replace the folded messages by the new summary, if it is ready."""
+        if self._folding is None or not (wait or self._folding.done()):
+            return
+        folding, self._folding = self._folding, None
+        try:
+            self.summary = folding.result().content
+        except Exception:
+            # Kept verbatim, the next `append` folds them again
+            return
+        self._drop(self._n_folding)
+        if self._tokens > self.max_tokens:
+            self._fold()
+
+    def wait(self):
+        """Block until the summary being written, if any, replaces its messages."""
+        while self._folding is not None:
+            self._apply_fold(wait=True)
+
+    def _render(self) -> str:
+        lines = [line for _, line, _ in self._messages]
+        if self.summary:
+            lines.insert(0, f"summary of the earlier conversation: {self.summary}")
+        return "\n".join(lines)
+
+    def to_string(self) -> str:
+        self._apply_fold()
+        return self._string
+
+    @property
+    def messages(self) -> list[BaseMessage]:
+        """Messages kept verbatim."""
+        return [message for message, _, _ in self._messages]
+
+    @property
+    def n_tokens(self) -> int:
+        """Tokens of the messages kept verbatim (the summary is not counted)."""
+        return self._tokens
+
+    def __iter__(self):
+        return iter(self.messages)
+
+    def __len__(self):
+        return len(self._messages)
@@ -0,0 +1,151 @@
+import hashlib
+import json
+import uuid
+from collections.abc import Iterable, Iterator
+from itertools import islice
+from pathlib import Path
+
+from langchain_core.documents import Document
+from langchain_text_splitters.markdown import MarkdownTextSplitter
+from utils.cleaning import clean_text
+from utils.tokens import token_length_function
+
+# Chunking configuration
+CHUNK_SIZE = 300
+CHUNK_OVERLAP = 70
+TITLE_KEY = "faq_title"
+
+
+def approx_token_length(text: str) -> int:
+    """Estimate token count (rough approximation: 1 token ≈ 4 chars)."""
+    return len(text) // 4
+
+
+def add_title_to_chunk(chunk: Document, title_key: str = TITLE_KEY):
+    """Prepend FAQ title to chunk for better context."""
+    chunk.page_content = chunk.metadata[title_key] + "\n\n" + chunk.page_content
+
+
+def create_splitter(
+    chunk_size: int = CHUNK_SIZE,
+    chunk_overlap: int = CHUNK_OVERLAP,
+    encoding_name: str | None = None,
+) -> MarkdownTextSplitter:
+    """
+    Markdown splitter measuring chunks in tokens.
+
+    Without `encoding_name` tokens are estimated from the number of characters,
+    otherwise they are counted exactly with the given tiktoken encoding.
+    """
+    return MarkdownTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=(
+            token_length_function(encoding_name)
+            if encoding_name
+            else approx_token_length
+        ),
+    )
+
+
+def faq_to_document(faq: dict) -> Document:
+    """Create a LangChain document from a cleaned FAQ entry."""
+    faq_body = clean_text(faq["faq_body"])
+    return Document(
+        page_content=faq_body,
+        metadata={
+            "faq_id": faq["faq_id"],
+            "faq_body": faq_body,
+            "faq_title": faq["faq_title"],
+            "updated_at": faq["updated_at"],
+        },
+    )
+
+
+def split_faq(faq: dict, splitter: MarkdownTextSplitter) -> list[Document]:
+    """Clean, chunk and title-prefix a single FAQ entry."""
+    chunks = splitter.split_documents([faq_to_document(faq)])
+    for chunk in chunks:
+        add_title_to_chunk(chunk)
+    return chunks
+
+
+def faq_fingerprint(faq: dict, splitter_config: dict) -> str:
+    """
+    Hash of everything that ends up in the FAQ chunks.
+
+    The chunking configuration is part of the hash, so changing it re-indexes every FAQ.
+    """
+    payload = json.dumps(
+        {
+            "faq_title": faq["faq_title"],
+            "faq_body": faq["faq_body"],
+            "updated_at": faq["updated_at"],
+            "splitter": splitter_config,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def chunk_id(faq_id: str, index: int) -> str:
+    """Deterministic Qdrant point id of the `index`-th chunk of a FAQ."""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, f"faq/{faq_id}/chunk/{index}"))
+
+
+def iter_json_records(path: str | Path, read_size: int = 1 << 16) -> Iterator[dict]:
+    """
+    Yield the records of a JSON array or JSONL file without loading the whole file.
+
+    `.jsonl` files are read line by line, other files are expected to hold a JSON array of
+    objects and are decoded object by object from a sliding buffer of `read_size` characters.
+    """
+    path = Path(path)
+    with open(path, "r") as f:
+        if path.suffix == ".jsonl":
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+            return
+
+        decoder = json.JSONDecoder()
+        buffer, position, eof = "", 0, False
+        started = False
+        while True:
+            # Skip whitespace and array punctuation between records
+            while position < len(buffer) and buffer[position] in " \t\r\n,[]":
+                started = started or buffer[position] == "["
+                position += 1
+            if position == len(buffer):
+                if eof:
+                    return
+                buffer, position = f.read(read_size), 0
+                eof = not buffer
+                continue
+            if not started:
+                raise ValueError(f"{path} is not a JSON array")
+            try:
+                record, end = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                # The record is cut by the end of the buffer, read more of the file
+                more = f.read(read_size)
+                if not more:
+                    raise
+                buffer, position = buffer[position:] + more, 0
+                continue
+            yield record
+            position = end
+
+
+def iter_chunks(
+    faqs: Iterable[dict], splitter: MarkdownTextSplitter
+) -> Iterator[tuple[Document, str]]:
+    """Lazily clean, chunk and title-prefix FAQs, yielding each chunk with its point id."""
+    for faq in faqs:
+        for i, chunk in enumerate(split_faq(faq, splitter)):
+            yield chunk, chunk_id(faq["faq_id"], i)
+
+
+def take(iterator: Iterator, n: int) -> list:
+    """Next `n` items of an iterator (fewer at the end)."""
+    return list(islice(iterator, n))
@@ -0,0 +1,347 @@
+"""
+In-process latency and token metrics of the RAG pipeline.
+
+`RagConversation` and `ParallelHybridRetriever` record the duration of each stage (query
+embedding, Qdrant search, prompt formatting, LLM call, ...), the prompt and completion
+tokens of each LLM call and the context tokens packed or saved into fixed-bucket histograms. Recording costs a couple of
+microseconds and no I/O, so it stays on in production; set `RAG_METRICS_ENABLED=false` to
+turn it off. It does not depend on Langfuse: run with `LANGFUSE_TRACING_ENABLED=false` to
+keep only these metrics.
+
+The histograms are read with `PIPELINE_METRICS.snapshot()`, exported in the Prometheus
+text format by `to_prometheus()` (served on `RAG_METRICS_PORT` by `start_exporters`), or
+dumped as JSON every few seconds to `RAG_METRICS_JSON`.
+"""
+
+import json
+import os
+import threading
+from bisect import bisect_left
+from contextlib import nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from time import perf_counter
+
+from dotenv import load_dotenv
+
+# Upper bounds of the buckets, in seconds and in tokens
+SECONDS_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+)
+TOKEN_BUCKETS = (16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+JSON_DUMP_INTERVAL = 10.0
+
+
+class Histogram:
+    """Counts of observations per bucket, as a Prometheus histogram. Not thread-safe."""
+
+    def __init__(self, buckets: tuple):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # The last one is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float | None:
+        """Estimate, interpolated linearly inside the bucket, like `histogram_quantile`."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[i - 1] if i else 0.0
+                return lower + (self.buckets[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.buckets[-1]
+
+    def cumulative_counts(self) -> list[tuple[str, int]]:
+        bounds = [f"{bound:g}" for bound in self.buckets] + ["+Inf"]
+        cumulative, result = 0, []
+        for bound, count in zip(bounds, self.counts):
+            cumulative += count
+            result.append((bound, cumulative))
+        return result
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "buckets": dict(self.cumulative_counts()),
+        }
+
+
+class StageTimer:
+    # A plain class rather than @contextmanager: half the overhead per block
+    __slots__ = ("metrics", "stage", "start_time")
+
+    def __init__(self, metrics: "PipelineMetrics", stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.start_time = perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.metrics.observe(self.stage, perf_counter() - self.start_time)
+
+
+_NULL_TIMER = nullcontext()
+
+
+class _Paused:
+    __slots__ = ("local", "previous")
+
+    def __init__(self, local: threading.local):
+        self.local = local
+
+    def __enter__(self):
+        self.previous = getattr(self.local, "paused", False)
+        self.local.paused = True
+        return self
+
+    def __exit__(self, *exc_info):
+        self.local.paused = self.previous
+
+
+class PipelineMetrics:
+    """
+    Per-stage latency and per-call token histograms, safe to update from any thread.
+
+    Example:
+        with PIPELINE_METRICS.timer("llm"):
+            response = llm.invoke(prompt)
+        PIPELINE_METRICS.record_tokens(response.usage_metadata)
+        print(PIPELINE_METRICS.to_prometheus())
+    """
+
+    def __init__(self, enabled: bool = True, prefix: str = "rag"):
+        self.enabled = enabled
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._stages: dict[str, Histogram] = {}
+        self._tokens: dict[str, Histogram] = {}
+
+    def _recording(self) -> bool:
+        return self.enabled and not getattr(self._local, "paused", False)
+
+    def paused(self) -> _Paused:
+        """
+        Context manager not recording what the current thread does during its block.
+
+        Used for the synthetic warm-up query, so that it does not skew the histograms of
+        the real requests; the other threads keep recording.
+        """
+        return _Paused(self._local)
+
+    def observe(self, stage: str, seconds: float):
+        if not self._recording():
+            return
+        with self._lock:
+            histogram = self._stages.get(stage)
+            if histogram is None:
+                histogram = self._stages[stage] = Histogram(SECONDS_BUCKETS)
+            histogram.observe(seconds)
+
+    def timer(self, stage: str) -> "StageTimer | nullcontext":
+        """Context manager recording the duration of its block under `stage`."""
+        if not self._recording():
+            return _NULL_TIMER
+        return StageTimer(self, stage)
+
+    def observe_tokens(self, kind: str, n_tokens: int):
+        if not self._recording():
+            return
+        with self._lock:
+            histogram = self._tokens.get(kind)
+            if histogram is None:
+                histogram = self._tokens[kind] = Histogram(TOKEN_BUCKETS)
+            histogram.observe(n_tokens)
+
+    def record_tokens(self, usage_metadata: dict | None):
+        """Record the `usage_metadata` of a LangChain message, if the model reported it."""
+        if not usage_metadata or not self._recording():
+            return
+        self.observe_tokens("prompt", usage_metadata.get("input_tokens", 0))
+        self.observe_tokens("completion", usage_metadata.get("output_tokens", 0))
+
+    def reset(self):
+        with self._lock:
+            self._stages.clear()
+            self._tokens.clear()
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "stage_seconds": {
+                    stage: histogram.snapshot()
+                    for stage, histogram in self._stages.items()
+                },
+                "llm_tokens": {
+                    kind: histogram.snapshot()
+                    for kind, histogram in self._tokens.items()
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """All the histograms in the Prometheus text exposition format."""
+        lines = []
+        with self._lock:
+            for name, label, histograms, help_text in (
+                (
+                    "stage_seconds",
+                    "stage",
+                    self._stages,
+                    "Latency of each stage of the RAG pipeline",
+                ),
+                (
+                    "llm_tokens",
+                    "kind",
+                    self._tokens,
+                    "Tokens of each LLM call (prompt, completion) and of its context",
+                ),
+            ):
+                metric = f"{self.prefix}_{name}"
+                lines += [f"# HELP {metric} {help_text}", f"# TYPE {metric} histogram"]
+                for value, histogram in sorted(histograms.items()):
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append(
+                            f'{metric}_bucket{{{label}="{value}",le="{bound}"}} {count}'
+                        )
+                    lines.append(f'{metric}_sum{{{label}="{value}"}} {histogram.sum}')
+                    lines.append(
+                        f'{metric}_count{{{label}="{value}"}} {histogram.count}'
+                    )
+        return "\n".join(lines) + "\n"
+
+    def summary(self) -> str:
+        """One line per stage with its count and latency percentiles, slowest first."""
+        stages = self.snapshot()["stage_seconds"]
+        return "\n".join(
+            f"{stage:<18} {values['count']:6d} calls  p50 {values['p50'] * 1000:8.1f} ms  "
+            f"p95 {values['p95'] * 1000:8.1f} ms  total {values['sum']:8.2f} s"
+            for stage, values in sorted(
+                stages.items(), key=lambda item: item[1]["sum"], reverse=True
+            )
+        )
+
+
+def metrics_enabled() -> bool:
+    """`RAG_METRICS_ENABLED`, from the environment or the `.env` file."""
+    load_dotenv()
+    return os.environ.get("RAG_METRICS_ENABLED", "true").lower() != "false"
+
+
+PIPELINE_METRICS = PipelineMetrics(enabled=metrics_enabled())
+
+
+class JsonDumper:
+    """Background thread writing `metrics.snapshot()` to `path` every `interval` seconds."""
+
+    def __init__(
+        self,
+        path: str | Path,
+        metrics: PipelineMetrics = PIPELINE_METRICS,
+        interval: float = JSON_DUMP_INTERVAL,
+    ):
+        self.path = Path(path)
+        self.metrics = metrics
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="metrics-json-dumper", daemon=True
+        )
+
+    def dump(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Written aside then renamed, so a reader never sees a partial file
+        tmp_path = self.path.with_suffix(self.path.suffix + ".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(self.metrics.snapshot(), f, indent=2)
+        tmp_path.replace(self.path)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.dump()
+
+    def start(self) -> "JsonDumper":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the thread and write the final values."""
+        self._stop.set()
+        self._thread.join()
+        self.dump()
+
+
+def serve_prometheus(
+    port: int, metrics: PipelineMetrics = PIPELINE_METRICS, host: str = "0.0.0.0"
+) -> ThreadingHTTPServer:
+    """Serve `metrics.to_prometheus()` on http://host:port/metrics from a daemon thread."""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            payload = metrics.to_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    threading.Thread(
+        target=server.serve_forever, name="metrics-server", daemon=True
+    ).start()
+    return server
+
+
+def start_exporters(metrics: PipelineMetrics = PIPELINE_METRICS) -> JsonDumper | None:
+    """
+    Start the exporters configured in the environment.
+
+    `RAG_METRICS_PORT` serves the Prometheus endpoint, `RAG_METRICS_JSON` dumps the JSON
+    snapshot every `RAG_METRICS_JSON_INTERVAL` seconds.
+
+    Returns:
+        The JSON dumper, to `stop()` at the end of the run, or None
+    """
+    load_dotenv()
+    port = os.environ.get("RAG_METRICS_PORT")
+    if port:
+        serve_prometheus(int(port), metrics)
+    path = os.environ.get("RAG_METRICS_JSON")
+    if not path:
+        return None
+    interval = float(os.environ.get("RAG_METRICS_JSON_INTERVAL", JSON_DUMP_INTERVAL))
+    return JsonDumper(path, metrics, interval).start()
@@ -0,0 +1,219 @@
+import asyncio
+import hashlib
+import json
+import math
+import threading
+from pathlib import Path
+from time import monotonic, perf_counter
+
+import httpx
+
+REQUESTS_PER_MINUTE = 500
+MAX_CONCURRENCY = 16
+# USD per million (input, output) tokens
+MODEL_PRICES = {
+    "gpt-4.1-nano": (0.10, 0.40),
+    "gpt-4.1-mini": (0.40, 1.60),
+    "gpt-5-nano": (0.05, 0.40),
+}
+
+
+def judge_key(
+    response: str, retrieved_contexts: list[str], model: str, metric_version: str
+) -> str:
+    """Hash of everything a judge score depends on."""
+    payload = json.dumps(
+        {
+            "response": response,
+            "retrieved_contexts": retrieved_contexts,
+            "model": model,
+            "metric_version": metric_version,
+        },
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    """
+    Persistent store of judge scores.
+
+    Scores are appended to a JSONL file as they are computed, so an interrupted run keeps
+    everything judged so far; the whole file is loaded in memory when the cache is opened.
+    """
+
+    def __init__(self, path: str | Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self._scores = {}
+        if self.path.exists():
+            with open(self.path, "r") as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self._scores[record["key"]] = record["score"]
+
+    def __len__(self):
+        return len(self._scores)
+
+    def get(self, key: str) -> float | None:
+        return self._scores.get(key)
+
+    def put(self, key: str, score: float):
+        with self._lock:
+            self._scores[key] = score
+            with open(self.path, "a") as f:
+                f.write(json.dumps({"key": key, "score": score}) + "\n")
+
+
+class RateLimiter:
+    """Space out request starts to stay under `requests_per_minute`."""
+
+    def __init__(self, requests_per_minute: float = REQUESTS_PER_MINUTE):
+        self.interval = 60.0 / requests_per_minute
+        self._next_start = 0.0
+
+    async def wait(self):
+        # Single event loop, nothing can run between reading and updating the next slot
+        now = monotonic()
+        delay = self._next_start - now
+        self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class UsageMeter:
+    """
+    Token usage of the chat completions going through an HTTP client.
+
+    Install `record` as a response event hook of the judge's own client, so judge usage is
+    counted apart from the generation.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    async def record(self, response: httpx.Response):
+        if (
+            not response.url.path.endswith("/chat/completions")
+            or response.status_code != 200
+        ):
+            return
+        await response.aread()
+        usage = response.json().get("usage") or {}
+        self.requests += 1
+        self.input_tokens += usage.get("prompt_tokens", 0)
+        self.output_tokens += usage.get("completion_tokens", 0)
+
+    def cost(self, model: str) -> float | None:
+        if model not in MODEL_PRICES:
+            return None
+        input_price, output_price = MODEL_PRICES[model]
+        return (
+            self.input_tokens * input_price + self.output_tokens * output_price
+        ) / 1e6
+
+
+class CachedJudge:
+    """
+    LLM-judge scoring with a disk cache, a concurrency bound and a rate limit.
+
+    A score is only requested from the judge model when the (response, contexts, judge
+    model, metric version) combination was never scored; identical requests in flight at
+    the same time share one call. Bump `metric_version` when the metric or its prompt
+    changes to invalidate the cached scores.
+
+    Example:
+        judge = CachedJudge(ResponseGroundedness(llm=llm), "gpt-4.1-nano", "groundedness-v1", path)
+        score = await judge.ascore(response, retrieved_contexts)
+        print(judge.stats())
+    """
+
+    def __init__(
+        self,
+        scorer,
+        model: str,
+        metric_version: str,
+        cache_path: str | Path,
+        max_concurrency: int = MAX_CONCURRENCY,
+        requests_per_minute: float = REQUESTS_PER_MINUTE,
+        usage: UsageMeter | None = None,
+    ):
+        self.scorer = scorer
+        self.model = model
+        self.metric_version = metric_version
+        self.cache = ScoreCache(cache_path)
+        self.max_concurrency = max_concurrency
+        self.rate_limiter = RateLimiter(requests_per_minute)
+        self.usage = usage
+        self._semaphore = None
+        self._loop = None
+        self._in_flight: dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.misses = 0
+        self.judge_seconds = 0.0
+
+    async def _score(
+        self, key: str, response: str, retrieved_contexts: list[str]
+    ) -> float:
+        async with self._semaphore:
+            await self.rate_limiter.wait()
+            start_time = perf_counter()
+            result = await self.scorer.ascore(
+                response=response, retrieved_contexts=retrieved_contexts
+            )
+            self.judge_seconds += perf_counter() - start_time
+        # A failed judgement (NaN or None) is scored again next time instead of cached
+        if result.value is not None and not math.isnan(result.value):
+            self.cache.put(key, result.value)
+        return result.value
+
+    async def ascore(self, response: str, retrieved_contexts: list[str]) -> float:
+        # The semaphore belongs to an event loop, a new `asyncio.run` needs a new one
+        if self._loop is not asyncio.get_running_loop():
+            self._loop = asyncio.get_running_loop()
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._in_flight = {}
+
+        key = judge_key(response, retrieved_contexts, self.model, self.metric_version)
+        score = self.cache.get(key)
+        if score is not None:
+            self.hits += 1
+            return score
+        if key in self._in_flight:
+            self.hits += 1
+            return await asyncio.shield(self._in_flight[key])
+
+        self.misses += 1
+        task = asyncio.ensure_future(self._score(key, response, retrieved_contexts))
+        self._in_flight[key] = task
+        try:
+            return await asyncio.shield(task)
+        finally:
+            self._in_flight.pop(key, None)
+
+    async def ascore_many(self, items: list[tuple[str, list[str]]]) -> list[float]:
+        """Score (response, retrieved_contexts) pairs concurrently, in order."""
+        return await asyncio.gather(
+            *[self.ascore(response, contexts) for response, contexts in items]
+        )
+
+    def stats(self) -> dict:
+        stats = {
+            "scored": self.misses,
+            "cached": self.hits,
+            "judge_seconds": round(self.judge_seconds, 3),
+        }
+        if self.usage is not None:
+            stats.update(
+                {
+                    "judge_requests": self.usage.requests,
+                    "input_tokens": self.usage.input_tokens,
+                    "output_tokens": self.usage.output_tokens,
+                    "cost_usd": self.usage.cost(self.model),
+                }
+            )
+        return stats
@@ -1,14 +1,49 @@
 # wrappers
+from functools import cache
+from importlib.metadata import version
+from pathlib import Path
+
+import httpx
 from dotenv import load_dotenv
 from openai import AsyncOpenAI
-from ragas.llms import llm_factory
-from ragas.metrics.collections import ResponseGroundedness
+from utils.judge import CachedJudge, UsageMeter
+from utils.resources import HTTP_LIMITS, HTTP_TIMEOUT, PerLoopAsyncTransport
+
+JUDGE_MODEL_NAME = "gpt-4.1-nano"
+# Part of the judge cache key: change it when the metric or its prompt changes
+GROUNDEDNESS_VERSION = f"response_groundedness-ragas-{version('ragas')}"
+PATH_JUDGE_CACHE = Path(__file__).parent.parent / "judge_cache" / "scores.jsonl"
+
+
+@cache
+def get_judge() -> CachedJudge:
+    """
+    Groundedness judge, built on first use.
 
-load_dotenv()
+    It has its own OpenAI client so that its token usage is metered apart from the generation.
+    Its connections are pooled per event loop, so it serves several `asyncio.run` in turn.
+    """
+    # Imported here: ragas takes a second to import and only the judge needs it
+    from ragas.llms import llm_factory
+    from ragas.metrics.collections import ResponseGroundedness
 
-client = AsyncOpenAI()
-llm = llm_factory("gpt-4.1-nano", client=client)
-scorer = ResponseGroundedness(llm=llm)
+    load_dotenv()
+    usage = UsageMeter()
+    client = AsyncOpenAI(
+        http_client=httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT,
+            transport=PerLoopAsyncTransport(HTTP_LIMITS),
+            event_hooks={"response": [usage.record]},
+        )
+    )
+    scorer = ResponseGroundedness(llm=llm_factory(JUDGE_MODEL_NAME, client=client))
+    return CachedJudge(
+        scorer,
+        model=JUDGE_MODEL_NAME,
+        metric_version=GROUNDEDNESS_VERSION,
+        cache_path=PATH_JUDGE_CACHE,
+        usage=usage,
+    )
 
 
 def hitrate(expected_documents: list[str], output_documents: list[str]) -> float:
@@ -41,8 +76,11 @@ def hitrate(expected_documents: list[str], output_documents: list[str]) -> float
 async def aresponse_groundedness(
     response: str,
     retrieved_contexts: list[str],
-    scorer: ResponseGroundedness = scorer,
+    scorer=None,  # e.g. a ragas ResponseGroundedness, the cached judge by default
 ) -> float:
+    if scorer is None:
+        # Cached, rate-limited default judge
+        return await get_judge().ascore(response, retrieved_contexts)
     result = await scorer.ascore(
         response=response, retrieved_contexts=retrieved_contexts
     )
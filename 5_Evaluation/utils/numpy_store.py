@@ -0,0 +1,528 @@
+"""
+In-process exact hybrid search for small corpora, without Qdrant.
+
+For a few thousand chunks, a search is one matrix product: the Qdrant local mode spends
+far more time on its lock, point objects and payload copies than on the math.
+`NumpyVectorStore` keeps the L2-normalized float32 dense vectors in one contiguous
+matrix and the BM25 sparse vectors as CSR arrays, memory-mapped when loaded from disk.
+Both legs are searched exactly and fused with the same weighted RRF as
+`ParallelHybridRetriever`, so it returns the same chunks as the Qdrant collection it was
+exported from.
+"""
+
+import asyncio
+import json
+import os
+import threading
+from pathlib import Path
+from time import perf_counter
+from uuid import uuid4
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from langchain_qdrant import QdrantVectorStore
+from langchain_qdrant.sparse_embeddings import SparseEmbeddings
+from utils.instrumentation import PIPELINE_METRICS
+from utils.retrieval import DENSE_WEIGHT, RRF_K, SPARSE_WEIGHT
+
+EXPORT_BATCH_SIZE = 256
+
+
+class _Index:
+    """Immutable arrays of the store: a search reads one snapshot, writes swap it."""
+
+    def __init__(
+        self,
+        ids: list[str],
+        texts: list[str],
+        metadatas: list[dict],
+        vectors: np.ndarray,
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        values: np.ndarray,
+    ):
+        self.ids = ids
+        self.texts = texts
+        self.metadatas = metadatas
+        self.vectors = vectors
+        # Sparse vector of document i: indices[indptr[i]:indptr[i + 1]] and its values
+        self.indptr = indptr
+        self.indices = indices
+        self.values = values
+        self._postings = None
+        self._columns = {}
+
+    def postings(self) -> tuple[np.ndarray, ...]:
+        """Inverted sparse vectors: terms, first posting of each, docs and values."""
+        if self._postings is None:
+            order = np.argsort(self.indices, kind="stable")
+            docs = np.repeat(np.arange(len(self.ids)), np.diff(self.indptr))[order]
+            terms, starts = np.unique(self.indices[order], return_index=True)
+            starts = np.append(starts, len(order))
+            self._postings = terms, starts, docs, np.asarray(self.values)[order]
+        return self._postings
+
+    def column(self, key: str) -> np.ndarray:
+        if key not in self._columns:
+            self._columns[key] = np.asarray([m.get(key) for m in self.metadatas])
+        return self._columns[key]
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    LangChain vector store searching a float32 matrix exactly, with an optional BM25
+    leg.
+
+    Filters are dictionaries of metadata values, a list matching any of its values, e.g.
+    `{"faq_id": [3, 12]}`. It also exposes the batch search of
+    `ParallelHybridRetriever`, so it can be the retriever of `RagConversation`.
+
+    Example:
+        store = NumpyVectorStore.from_qdrant(load_vector_store())
+        store.save("numpy_store")
+        store = NumpyVectorStore.load("numpy_store", embeddings, sparse_embeddings)
+        docs_and_scores = store.similarity_search_with_relevance_scores(question, k=4)
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings,
+        sparse_embedding: SparseEmbeddings = None,
+        rrf_k: int = RRF_K,
+        dense_weight: float = DENSE_WEIGHT,
+        sparse_weight: float = SPARSE_WEIGHT,
+        candidates: int = None,
+        idf: bool = False,
+    ):
+        self._embedding = embedding
+        self.sparse_embeddings = sparse_embedding
+        self.rrf_k = rrf_k
+        self.dense_weight = dense_weight
+        self.sparse_weight = sparse_weight
+        self.candidates = candidates
+        # The FAQ collection has no IDF modifier on its sparse vectors: off by default
+        self.idf = idf
+        self._lock = threading.Lock()
+        self._index = _Index(
+            [],
+            [],
+            [],
+            np.zeros((0, 0), dtype=np.float32),
+            np.zeros(1, dtype=np.int64),
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=np.float32),
+        )
+        self.last_timings = {}
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    def __len__(self):
+        return len(self._index.ids)
+
+    @staticmethod
+    def _normalize(vectors) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1.0)
+
+    @staticmethod
+    def _cosine_relevance_score_fn(score: float) -> float:
+        # Same scale as QdrantVectorStore, so the scores of both stores compare
+        return (score + 1.0) / 2.0
+
+    def _select_relevance_score_fn(self):
+        return self._cosine_relevance_score_fn
+
+    def _add_vectors(
+        self,
+        ids: list[str],
+        texts: list[str],
+        metadatas: list[dict],
+        vectors,
+        sparse_vectors: list | None,
+    ):
+        vectors = self._normalize(vectors).reshape(len(ids), -1)
+        if sparse_vectors is None:
+            sparse_vectors = [([], [])] * len(ids)
+        lengths = [len(indices) for indices, _ in sparse_vectors]
+        new_ids = set(ids)
+        with self._lock:
+            index = self._index
+            # Re-added ids replace their previous version
+            keep = np.array([i not in new_ids for i in index.ids], dtype=bool)
+            kept = self._select(index, keep)
+            self._index = _Index(
+                kept.ids + list(ids),
+                kept.texts + list(texts),
+                kept.metadatas + list(metadatas),
+                np.concatenate([kept.vectors, vectors])
+                if len(kept.ids)
+                else np.ascontiguousarray(vectors),
+                np.concatenate(
+                    [kept.indptr, kept.indptr[-1] + np.cumsum(lengths, dtype=np.int64)]
+                ),
+                np.concatenate(
+                    [kept.indices]
+                    + [
+                        np.asarray(indices, dtype=np.int64)
+                        for indices, _ in sparse_vectors
+                    ]
+                ),
+                np.concatenate(
+                    [kept.values]
+                    + [
+                        np.asarray(values, dtype=np.float32)
+                        for _, values in sparse_vectors
+                    ]
+                ),
+            )
+
+    @staticmethod
+    def _select(index: _Index, keep: np.ndarray) -> _Index:
+        if keep.all():
+            return index
+        rows = np.flatnonzero(keep)
+        lengths = np.diff(index.indptr)[rows]
+        positions = np.concatenate(
+            [np.arange(index.indptr[i], index.indptr[i + 1]) for i in rows]
+            or [np.zeros(0, dtype=np.int64)]
+        )
+        return _Index(
+            [index.ids[i] for i in rows],
+            [index.texts[i] for i in rows],
+            [index.metadatas[i] for i in rows],
+            np.asarray(index.vectors)[rows],
+            np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64),
+            np.asarray(index.indices)[positions],
+            np.asarray(index.values)[positions],
+        )
+
+    def add_texts(
+        self, texts, metadatas: list[dict] = None, ids: list[str] = None, **kwargs
+    ) -> list[str]:
+        texts = list(texts)
+        metadatas = list(metadatas) if metadatas is not None else [{}] * len(texts)
+        ids = list(ids) if ids is not None else [str(uuid4()) for _ in texts]
+        vectors = self.embeddings.embed_documents(texts)
+        sparse_vectors = None
+        if self.sparse_embeddings is not None:
+            sparse_vectors = [
+                (vector.indices, vector.values)
+                for vector in self.sparse_embeddings.embed_documents(texts)
+            ]
+        self._add_vectors(ids, texts, metadatas, vectors, sparse_vectors)
+        return ids
+
+    def delete(self, ids: list[str] = None, **kwargs) -> bool:
+        if ids is None:
+            return False
+        ids = set(map(str, ids))
+        with self._lock:
+            keep = np.array([i not in ids for i in self._index.ids], dtype=bool)
+            self._index = self._select(self._index, keep)
+        return True
+
+    def get_by_ids(self, ids) -> list[Document]:
+        index = self._index
+        rows = {doc_id: i for i, doc_id in enumerate(index.ids)}
+        return [
+            Document(
+                id=doc_id, page_content=index.texts[i], metadata=index.metadatas[i]
+            )
+            for doc_id in ids
+            if (i := rows.get(doc_id)) is not None
+        ]
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts,
+        embedding: Embeddings,
+        metadatas: list[dict] = None,
+        ids: list[str] = None,
+        sparse_embedding: SparseEmbeddings = None,
+        **kwargs,
+    ) -> "NumpyVectorStore":
+        store = cls(embedding, sparse_embedding, **kwargs)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        return store
+
+    @classmethod
+    def from_qdrant(
+        cls,
+        vector_store: QdrantVectorStore,
+        batch_size: int = EXPORT_BATCH_SIZE,
+        **kwargs,
+    ) -> "NumpyVectorStore":
+        """Copy the points of a hybrid Qdrant collection, with their stored vectors."""
+        store = cls(vector_store.embeddings, vector_store.sparse_embeddings, **kwargs)
+        offset = None
+        while True:
+            points, offset = vector_store.client.scroll(
+                collection_name=vector_store.collection_name,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=True,
+            )
+            if points:
+                store._add_vectors(
+                    [str(point.id) for point in points],
+                    [
+                        point.payload[vector_store.content_payload_key]
+                        for point in points
+                    ],
+                    [
+                        point.payload.get(vector_store.metadata_payload_key) or {}
+                        for point in points
+                    ],
+                    [point.vector[vector_store.vector_name] for point in points],
+                    [
+                        (
+                            point.vector[vector_store.sparse_vector_name].indices,
+                            point.vector[vector_store.sparse_vector_name].values,
+                        )
+                        if vector_store.sparse_vector_name in point.vector
+                        else ([], [])
+                        for point in points
+                    ],
+                )
+            if offset is None:
+                return store
+
+    def save(self, path: str | Path):
+        """Write the store to a directory, the arrays as .npy files to memory-map."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        index = self._index
+        for name in ("vectors", "indptr", "indices", "values"):
+            np.save(path / f"{name}.npy", np.asarray(getattr(index, name)))
+        # Written aside then renamed, so a reader never sees a partial file
+        tmp_path = path / "documents.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(
+                {"ids": index.ids, "texts": index.texts, "metadatas": index.metadatas},
+                f,
+            )
+        os.replace(tmp_path, path / "documents.json")
+
+    @classmethod
+    def load(
+        cls,
+        path: str | Path,
+        embedding: Embeddings,
+        sparse_embedding: SparseEmbeddings = None,
+        mmap: bool = True,
+        **kwargs,
+    ) -> "NumpyVectorStore":
+        """Open a saved store, its arrays memory-mapped read-only unless not `mmap`."""
+        path = Path(path)
+        store = cls(embedding, sparse_embedding, **kwargs)
+        with open(path / "documents.json", "r") as f:
+            documents = json.load(f)
+        arrays = {
+            name: np.load(path / f"{name}.npy", mmap_mode="r" if mmap else None)
+            for name in ("vectors", "indptr", "indices", "values")
+        }
+        store._index = _Index(
+            documents["ids"], documents["texts"], documents["metadatas"], **arrays
+        )
+        return store
+
+    def _mask(self, index: _Index, filter: dict | None) -> np.ndarray | None:
+        if not filter:
+            return None
+        mask = np.ones(len(index.ids), dtype=bool)
+        for key, value in filter.items():
+            values = value if isinstance(value, (list, tuple, set)) else [value]
+            mask &= np.isin(index.column(key), list(values))
+        return mask
+
+    def _sparse_scores(self, index: _Index, sparse_vectors) -> np.ndarray:
+        scores = np.zeros((len(sparse_vectors), len(index.ids)), dtype=np.float32)
+        terms, starts, docs, values = index.postings()
+        if not len(terms):
+            return scores
+        if self.idf:
+            # Same IDF as the Qdrant modifier
+            n_docs = np.diff(starts)
+            idf = np.log((len(index.ids) - n_docs + 0.5) / (n_docs + 0.5) + 1.0)
+        for row, vector in enumerate(sparse_vectors):
+            query_terms = np.asarray(vector.indices, dtype=np.int64)
+            positions = np.minimum(np.searchsorted(terms, query_terms), len(terms) - 1)
+            found = terms[positions] == query_terms
+            weights = np.asarray(vector.values, dtype=np.float32)[found]
+            if self.idf:
+                weights = weights * idf[positions[found]]
+            for position, weight in zip(positions[found], weights):
+                start, end = starts[position], starts[position + 1]
+                scores[row, docs[start:end]] += weight * values[start:end]
+        return scores
+
+    @staticmethod
+    def _top_k(scores: np.ndarray, k: int, valid: np.ndarray) -> list[np.ndarray]:
+        """Rows of the `k` best valid scores of each query, best first (ties by row)."""
+        scores = np.where(valid, scores, -np.inf)
+        k = min(k, scores.shape[1])
+        if k == 0:
+            return [np.zeros(0, dtype=np.int64) for _ in scores]
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, row_candidates in zip(scores, candidates):
+            row_candidates = np.sort(row_candidates)
+            order = np.argsort(-row[row_candidates], kind="stable")
+            best = row_candidates[order]
+            results.append(best[np.isfinite(row[best])])
+        return results
+
+    def _fuse(self, dense: np.ndarray, sparse: np.ndarray, k: int) -> list[tuple]:
+        # Weighted RRF of utils.retrieval, ties in the order of first sight
+        fused = {}
+        for ranking, weight in (
+            (dense, self.dense_weight),
+            (sparse, self.sparse_weight),
+        ):
+            for rank, row in enumerate(ranking.tolist()):
+                fused[row] = fused.get(row, 0.0) + weight / (self.rrf_k + rank)
+        return sorted(fused.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def _search(
+        self, dense_vectors, sparse_vectors, k: int, filter: dict | None
+    ) -> list[list[tuple[Document, float]]]:
+        index = self._index
+        if not index.ids:
+            return [[] for _ in dense_vectors]
+        mask = self._mask(index, filter)
+        valid = np.ones(len(index.ids), dtype=bool) if mask is None else mask
+        limit = self.candidates or k
+        dense_scores = self._normalize(dense_vectors) @ np.asarray(index.vectors).T
+        dense_rankings = self._top_k(dense_scores, limit, valid)
+        if sparse_vectors is None:
+            fused = [
+                [(row, float(scores[row])) for row in ranking[:k]]
+                for ranking, scores in zip(dense_rankings, dense_scores)
+            ]
+        else:
+            sparse_scores = self._sparse_scores(index, sparse_vectors)
+            # As in Qdrant, the sparse leg only has chunks sharing a term with the query
+            sparse_rankings = self._top_k(
+                sparse_scores, limit, valid & (sparse_scores > 0)
+            )
+            fused = [
+                self._fuse(dense, sparse, k)
+                for dense, sparse in zip(dense_rankings, sparse_rankings)
+            ]
+        return [
+            [
+                (
+                    Document(
+                        id=index.ids[row],
+                        page_content=index.texts[row],
+                        metadata=index.metadatas[row],
+                    ),
+                    score,
+                )
+                for row, score in rows
+            ]
+            for rows in fused
+        ]
+
+    def _embed_sparse(self, queries: list[str]):
+        if self.sparse_embeddings is None:
+            return None
+        # BM25 query vectors differ from document vectors, embed_documents would not do
+        return [self.sparse_embeddings.embed_query(query) for query in queries]
+
+    @staticmethod
+    async def _atimed(coroutine):
+        start_time = perf_counter()
+        result = await coroutine
+        return result, perf_counter() - start_time
+
+    def _record_timings(
+        self, dense_embed_time, sparse_embed_time, search_time, n_queries: int
+    ):
+        self.last_timings = {
+            "dense_embedding": dense_embed_time,
+            "sparse_embedding": sparse_embed_time,
+            "search": search_time,
+            "queries": n_queries,
+        }
+        PIPELINE_METRICS.observe("dense_embedding", dense_embed_time)
+        PIPELINE_METRICS.observe("sparse_embedding", sparse_embed_time)
+        PIPELINE_METRICS.observe("search", search_time)
+
+    def batch_similarity_search_with_score(
+        self, queries: list[str], k: int = 4, filter: dict = None
+    ) -> list[list[tuple[Document, float]]]:
+        """Documents and fused RRF (or cosine, without BM25) scores of the `k` best."""
+        start_time = perf_counter()
+        dense_vectors = (
+            [self.embeddings.embed_query(queries[0])]
+            if len(queries) == 1
+            else self.embeddings.embed_documents(queries)
+        )
+        dense_embed_time = perf_counter() - start_time
+        sparse_start = perf_counter()
+        sparse_vectors = self._embed_sparse(queries)
+        sparse_embed_time = perf_counter() - sparse_start
+
+        search_start = perf_counter()
+        results = self._search(dense_vectors, sparse_vectors, k, filter)
+        self._record_timings(
+            dense_embed_time,
+            sparse_embed_time,
+            perf_counter() - search_start,
+            len(queries),
+        )
+        return results
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter: dict = None, **kwargs
+    ) -> list[tuple[Document, float]]:
+        return self.batch_similarity_search_with_score([query], k=k, filter=filter)[0]
+
+    def similarity_search(
+        self, query: str, k: int = 4, filter: dict = None, **kwargs
+    ) -> list[Document]:
+        return [
+            doc
+            for doc, _ in self.similarity_search_with_score(query, k=k, filter=filter)
+        ]
+
+    def batch_similarity_search_with_relevance_scores(
+        self, queries: list[str], k: int = 4, **kwargs
+    ):
+        """Batch version of `similarity_search_with_relevance_scores`."""
+        return [
+            [
+                (doc, self._cosine_relevance_score_fn(score))
+                for doc, score in docs_and_scores
+            ]
+            for docs_and_scores in self.batch_similarity_search_with_score(
+                queries, k=k, **kwargs
+            )
+        ]
+
+    async def asimilarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, filter: dict = None, **kwargs
+    ):
+        """Async version, BM25 encoding in a thread during the dense embedding."""
+        (
+            (dense_vector, dense_embed_time),
+            (sparse_vectors, sparse_embed_time),
+        ) = await asyncio.gather(
+            self._atimed(self.embeddings.aembed_query(query)),
+            self._atimed(asyncio.to_thread(self._embed_sparse, [query])),
+        )
+
+        search_start = perf_counter()
+        (results,) = self._search([dense_vector], sparse_vectors, k, filter)
+        self._record_timings(
+            dense_embed_time, sparse_embed_time, perf_counter() - search_start, 1
+        )
+        return [(doc, self._cosine_relevance_score_fn(score)) for doc, score in results]
@@ -0,0 +1,70 @@
+"""
+Quantization of the dense vectors of the FAQ collection.
+
+A quantized collection searches a compressed copy of each dense vector kept in RAM, int8
+scalar (4 times smaller than float32) or binary (32 times smaller), while the float32
+originals move to disk. A search scores `oversampling` times more candidates on the
+compressed vectors, then rescores them with the originals, so the top results stay close
+to the exact ranking. Only the dense leg is affected, the sparse BM25 vectors are kept
+as they are.
+
+Quantization is applied by a Qdrant server only: the embedded store accepts the
+configuration but searches the float32 vectors.
+"""
+
+from qdrant_client import models
+
+QUANTIZATIONS = (None, "int8", "binary")
+# Extreme values clipped before int8 scaling, so that outliers do not waste the range
+INT8_QUANTILE = 0.99
+# Candidates scored on the compressed vectors for each result, before rescoring
+OVERSAMPLING = {"int8": 2.0, "binary": 3.0}
+
+
+def quantization_config(quantization: str | None) -> models.QuantizationConfig | None:
+    if quantization is None:
+        return None
+    if quantization == "int8":
+        return models.ScalarQuantization(
+            scalar=models.ScalarQuantizationConfig(
+                type=models.ScalarType.INT8, quantile=INT8_QUANTILE, always_ram=True
+            )
+        )
+    if quantization == "binary":
+        return models.BinaryQuantization(
+            binary=models.BinaryQuantizationConfig(always_ram=True)
+        )
+    raise ValueError(
+        f"Unknown quantization {quantization!r}, expected one of {QUANTIZATIONS}"
+    )
+
+
+def dense_vector_params(
+    size: int, quantization: str | None = None
+) -> models.VectorParams:
+    """
+    Configuration of the dense vectors, quantized or not.
+
+    The float32 originals only stay in RAM without quantization: with it, they are read
+    from disk for the rescoring of the few oversampled candidates.
+    """
+    return models.VectorParams(
+        size=size,
+        distance=models.Distance.COSINE,
+        on_disk=quantization is not None,
+        quantization_config=quantization_config(quantization),
+    )
+
+
+def quantization_search_params(
+    quantization: str | None, oversampling: float = None
+) -> models.SearchParams | None:
+    """Search parameters of the dense leg: oversampled, rescored at full precision."""
+    if quantization is None:
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(
+            rescore=True,
+            oversampling=oversampling or OVERSAMPLING[quantization],
+        )
+    )
@@ -0,0 +1,249 @@
+"""
+Cross-encoder reranking of the retrieved chunks.
+
+The hybrid search ranks chunks by vectors computed separately for the query and the
+chunk; a cross-encoder reads them together and scores their relevance more precisely,
+at the cost of one forward pass per (query, chunk) pair. `RerankingRetriever` retrieves
+`candidates` chunks, scores them with a small cross-encoder on CPU in one batched
+forward pass, and keeps the `k` best. Pair scores are cached by (query hash, chunk id),
+so replayed questions are not scored again; the chunk id includes a hash of its text,
+since point ids are positional and a re-chunked FAQ reuses them for new text.
+"""
+
+import asyncio
+import threading
+from collections import OrderedDict
+from time import perf_counter
+
+from langchain_core.documents import Document
+from langfuse import get_client
+from utils.embedding_cache import text_hash
+from utils.instrumentation import PIPELINE_METRICS
+
+RERANK_MODEL_NAME = "cross-encoder/ms-marco-MiniLM-L-6-v2"
+RERANK_CANDIDATES = 20
+RERANK_BATCH_SIZE = 32
+RERANK_MAX_CACHE_ENTRIES = 100_000
+# Weight of the last batch in the running estimate of the scoring time of a pair
+LATENCY_SMOOTHING = 0.2
+
+
+def chunk_key(doc: Document) -> str:
+    # QdrantVectorStore keeps the point id in the metadata, other stores in `id`
+    point_id = doc.id or doc.metadata.get("_id") or ""
+    return f"{point_id}:{text_hash(doc.page_content)}"
+
+
+class CrossEncoderReranker:
+    """
+    Scores (query, chunk) pairs with a sentence-transformers `CrossEncoder` on CPU.
+
+    The model is loaded on first use. `num_threads` sets the torch threads of the
+    process (None keeps the default). With `budget_seconds`, the chunks scored per query
+    are capped at what the measured time per pair allows in that budget: the best ranked
+    candidates are scored, the others dropped. Thread-safe.
+
+    Example:
+        reranker = CrossEncoderReranker(num_threads=4, budget_seconds=0.2)
+        docs_and_scores = reranker.rerank(question, docs, k=4)
+    """
+
+    def __init__(
+        self,
+        model_name: str = RERANK_MODEL_NAME,
+        model=None,
+        batch_size: int = RERANK_BATCH_SIZE,
+        num_threads: int = None,
+        budget_seconds: float = None,
+        max_cache_entries: int = RERANK_MAX_CACHE_ENTRIES,
+    ):
+        self.model_name = model_name
+        # Anything with the `predict(pairs, batch_size=...)` of CrossEncoder
+        self.model = model
+        self.batch_size = batch_size
+        self.num_threads = num_threads
+        self.budget_seconds = budget_seconds
+        self.max_cache_entries = max_cache_entries
+        self._lock = threading.Lock()
+        self._model_lock = threading.Lock()
+        self._cache: OrderedDict[tuple[str, str], float] = OrderedDict()
+        self.seconds_per_pair = None
+        self.hits = 0
+        self.misses = 0
+
+    def get_model(self):
+        with self._model_lock:
+            if self.model is None:
+                # Imported here: torch and transformers take seconds to import
+                import torch
+                from sentence_transformers import CrossEncoder
+
+                if self.num_threads:
+                    torch.set_num_threads(self.num_threads)
+                self.model = CrossEncoder(self.model_name, device="cpu")
+            return self.model
+
+    def max_candidates(self, k: int) -> int | None:
+        """Chunks to score per query within the budget, None for all of them."""
+        if self.budget_seconds is None or self.seconds_per_pair is None:
+            return None
+        return max(k, int(self.budget_seconds / self.seconds_per_pair))
+
+    def score_pairs(self, pairs: list[tuple[str, Document]]) -> list[float]:
+        """Scores of (query, chunk) pairs, the uncached ones in one forward pass."""
+        keys = [(text_hash(query), chunk_key(doc)) for query, doc in pairs]
+        with self._lock:
+            scores = [self._cache.get(key) for key in keys]
+            # Index of the first occurrence of each uncached pair, so it is scored once
+            missing = {}
+            for i, (key, score) in enumerate(zip(keys, scores)):
+                if score is None:
+                    missing.setdefault(key, i)
+                else:
+                    self._cache.move_to_end(key)
+            self.hits += len(keys) - sum(score is None for score in scores)
+            self.misses += len(missing)
+        if not missing:
+            return scores
+
+        model = self.get_model()
+        start_time = perf_counter()
+        with PIPELINE_METRICS.timer("rerank_model"):
+            new_scores = model.predict(
+                [(pairs[i][0], pairs[i][1].page_content) for i in missing.values()],
+                batch_size=self.batch_size,
+                show_progress_bar=False,
+            )
+        seconds_per_pair = (perf_counter() - start_time) / len(missing)
+
+        new_scores = dict(zip(missing, map(float, new_scores)))
+        with self._lock:
+            self.seconds_per_pair = (
+                seconds_per_pair
+                if self.seconds_per_pair is None
+                else (1 - LATENCY_SMOOTHING) * self.seconds_per_pair
+                + LATENCY_SMOOTHING * seconds_per_pair
+            )
+            self._cache.update(new_scores)
+            while len(self._cache) > self.max_cache_entries:
+                self._cache.popitem(last=False)
+        return [
+            new_scores[key] if score is None else score
+            for key, score in zip(keys, scores)
+        ]
+
+    def rerank_batch(
+        self, queries: list[str], docs_lists: list[list[Document]], k: int
+    ) -> list[list[tuple[Document, float]]]:
+        """The `k` best chunks of each query by cross-encoder score, scored at once."""
+        limit = self.max_candidates(k)
+        docs_lists = [docs[:limit] for docs in docs_lists]
+        scores = self.score_pairs(
+            [(query, doc) for query, docs in zip(queries, docs_lists) for doc in docs]
+        )
+        results, start = [], 0
+        for docs in docs_lists:
+            doc_scores = scores[start : start + len(docs)]
+            start += len(docs)
+            # Stable sort: equal scores keep the retrieval order
+            ranked = sorted(
+                zip(docs, doc_scores), key=lambda item: item[1], reverse=True
+            )
+            results.append(ranked[:k])
+        return results
+
+    def rerank(
+        self, query: str, docs: list[Document], k: int
+    ) -> list[tuple[Document, float]]:
+        return self.rerank_batch([query], [docs], k)[0]
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self._cache),
+            "seconds_per_pair": self.seconds_per_pair,
+        }
+
+
+class RerankingRetriever:
+    """
+    Retriever over-fetching `candidates` chunks from another one and reranking them.
+
+    It exposes the same search methods as `ParallelHybridRetriever`, so it can be the
+    retriever of `RagConversation`; the scores are those of the cross-encoder.
+
+    Example:
+        retriever = RerankingRetriever(ParallelHybridRetriever(vector_store))
+        rag_conversation = RagConversation(vector_store, llm, retriever=retriever)
+    """
+
+    def __init__(
+        self,
+        retriever,
+        reranker: CrossEncoderReranker = None,
+        candidates: int = RERANK_CANDIDATES,
+    ):
+        self.retriever = retriever
+        self.reranker = reranker if reranker is not None else CrossEncoderReranker()
+        self.candidates = candidates
+        self.last_timings = {}
+
+    def _record_timings(
+        self, retrieval_time: float, rerank_time: float, n_queries: int
+    ):
+        timings = {
+            "retrieval": retrieval_time,
+            "rerank": rerank_time,
+            "queries": n_queries,
+        }
+        self.last_timings = timings
+        PIPELINE_METRICS.observe("rerank", rerank_time)
+        get_client().update_current_span(metadata={"rerank": timings})
+
+    def batch_similarity_search_with_relevance_scores(
+        self, queries: list[str], k: int = 4, **kwargs
+    ) -> list[list[tuple[Document, float]]]:
+        start_time = perf_counter()
+        candidates = self.retriever.batch_similarity_search_with_relevance_scores(
+            queries, k=max(k, self.candidates), **kwargs
+        )
+        rerank_start = perf_counter()
+        results = self.reranker.rerank_batch(
+            queries, [[doc for doc, _ in docs] for docs in candidates], k
+        )
+        self._record_timings(
+            rerank_start - start_time, perf_counter() - rerank_start, len(queries)
+        )
+        return results
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs):
+        start_time = perf_counter()
+        candidates = self.retriever.similarity_search_with_relevance_scores(
+            query, k=max(k, self.candidates), **kwargs
+        )
+        rerank_start = perf_counter()
+        results = self.reranker.rerank(query, [doc for doc, _ in candidates], k)
+        self._record_timings(
+            rerank_start - start_time, perf_counter() - rerank_start, 1
+        )
+        return results
+
+    async def asimilarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs
+    ):
+        """Async version, the CPU-bound forward pass runs in a thread."""
+        start_time = perf_counter()
+        candidates = await self.retriever.asimilarity_search_with_relevance_scores(
+            query, k=max(k, self.candidates), **kwargs
+        )
+        rerank_start = perf_counter()
+        results = await asyncio.to_thread(
+            self.reranker.rerank, query, [doc for doc, _ in candidates], k
+        )
+        self._record_timings(
+            rerank_start - start_time, perf_counter() - rerank_start, 1
+        )
+        return results
@@ -0,0 +1,221 @@
+"""
+Process-wide shared clients.
+
+Every script, notebook and helper gets its HTTP clients, OpenAI wrappers, Langfuse client
+and Qdrant handle from here instead of building new ones: connections are pooled and kept
+alive across calls, and a single Qdrant handle per store is shared by every worker of the
+process, so nothing has to remove the store `.lock` file anymore.
+Everything is closed by `shutdown()`, which also runs at interpreter exit.
+
+With `QDRANT_URL` set, the store is served by a Qdrant server instead, so several processes
+can use it at the same time (see serve_vector_store.py).
+"""
+
+import asyncio
+import atexit
+import os
+import threading
+from pathlib import Path
+
+import httpx
+from dotenv import load_dotenv
+from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+from langfuse import Langfuse
+from openai import AsyncOpenAI
+from qdrant_client import AsyncQdrantClient, QdrantClient
+
+HTTP_TIMEOUT = httpx.Timeout(60.0, connect=10.0)
+HTTP_LIMITS = httpx.Limits(
+    max_connections=64, max_keepalive_connections=32, keepalive_expiry=120.0
+)
+
+_lock = threading.RLock()
+_resources = {}
+
+
+def _get_or_create(key, factory):
+    with _lock:
+        if key not in _resources:
+            _resources[key] = factory()
+        return _resources[key]
+
+
+def get_http_client() -> httpx.Client:
+    """Shared keep-alive HTTP client for synchronous calls."""
+    return _get_or_create(
+        "http_client", lambda: httpx.Client(timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
+    )
+
+
+class PerLoopAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    Async transport with one connection pool per event loop.
+
+    The connections of an `httpx.AsyncClient` belong to the loop that opened them:
+    reused from the next `asyncio.run` (sweeps, notebooks, tests), they fail with "Event
+    loop is closed". With this transport the client can be shared by the whole process,
+    each loop getting its own pool, dropped once the loop is closed.
+    """
+
+    def __init__(self, limits: httpx.Limits = HTTP_LIMITS):
+        self.limits = limits
+        self._lock = threading.Lock()
+        self._transports: dict[asyncio.AbstractEventLoop, httpx.AsyncHTTPTransport] = {}
+
+    def _transport(self) -> httpx.AsyncHTTPTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            # Their sockets are released with them, they cannot be closed without a loop
+            for closed in [loop for loop in self._transports if loop.is_closed()]:
+                del self._transports[closed]
+            transport = self._transports.get(loop)
+            if transport is None:
+                transport = self._transports[loop] = httpx.AsyncHTTPTransport(
+                    limits=self.limits
+                )
+            return transport
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._transport().handle_async_request(request)
+
+    async def aclose(self):
+        # Only the pool of the current loop can be closed from it
+        with self._lock:
+            transport = self._transports.pop(asyncio.get_running_loop(), None)
+        if transport is not None:
+            await transport.aclose()
+
+
+def get_async_http_client() -> httpx.AsyncClient:
+    """Shared keep-alive HTTP client for asynchronous calls, from any event loop."""
+    return _get_or_create(
+        "async_http_client",
+        lambda: httpx.AsyncClient(
+            timeout=HTTP_TIMEOUT, transport=PerLoopAsyncTransport(HTTP_LIMITS)
+        ),
+    )
+
+
+def get_async_openai_client() -> AsyncOpenAI:
+    load_dotenv()
+    return _get_or_create(
+        "async_openai", lambda: AsyncOpenAI(http_client=get_async_http_client())
+    )
+
+
+def get_openai_embeddings(
+    model: str = "text-embedding-3-small", **kwargs
+) -> OpenAIEmbeddings:
+    load_dotenv()
+    return _get_or_create(
+        ("openai_embeddings", model, tuple(sorted(kwargs.items()))),
+        lambda: OpenAIEmbeddings(
+            model=model,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            **kwargs,
+        ),
+    )
+
+
+def get_chat_model(model: str, **kwargs) -> ChatOpenAI:
+    load_dotenv()
+    return _get_or_create(
+        ("chat_model", model, tuple(sorted(kwargs.items()))),
+        lambda: ChatOpenAI(
+            model=model,
+            http_client=get_http_client(),
+            http_async_client=get_async_http_client(),
+            **kwargs,
+        ),
+    )
+
+
+def get_langfuse_client() -> Langfuse:
+    """
+    Shared Langfuse client.
+
+    With `LANGFUSE_TRACING_ENABLED=false` nothing is sent and the keys may be left unset.
+    """
+    load_dotenv()
+    return _get_or_create(
+        "langfuse",
+        lambda: Langfuse(
+            public_key=os.environ.get("LANGFUSE_PUBLIC_KEY"),
+            secret_key=os.environ.get("LANGFUSE_SECRET_KEY"),
+            host=os.environ.get("LANGFUSE_BASE_URL"),
+            httpx_client=get_http_client(),
+        ),
+    )
+
+
+def get_embedded_qdrant_client(path: str | Path) -> QdrantClient:
+    """Single embedded Qdrant handle per store path, shared by all the threads of the process."""
+    path = Path(path).resolve()
+    return _get_or_create(("qdrant", str(path)), lambda: QdrantClient(path=str(path)))
+
+
+def close_embedded_qdrant_client(path: str | Path):
+    """Close the shared embedded handle of the store at `path`, releasing its lock."""
+    path = Path(path).resolve()
+    with _lock:
+        client = _resources.pop(("qdrant", str(path)), None)
+    if client is not None:
+        client.close()
+
+
+def get_remote_qdrant_client(url: str) -> QdrantClient:
+    """Client of a Qdrant server (see serve_vector_store.py), over gRPC."""
+    return _get_or_create(
+        ("qdrant", url), lambda: QdrantClient(url=url, prefer_grpc=True)
+    )
+
+
+def get_qdrant_client(path: str | Path) -> QdrantClient:
+    """
+    Qdrant handle of the vector store.
+
+    When `QDRANT_URL` is set, every process connects to that server, where the store at
+    `path` was exported by serve_vector_store.py. Otherwise the embedded store is opened,
+    which only one process at a time can do.
+    """
+    load_dotenv()
+    url = os.environ.get("QDRANT_URL")
+    if url:
+        return get_remote_qdrant_client(url)
+    return get_embedded_qdrant_client(path)
+
+
+def get_async_qdrant_client(path: str | Path) -> AsyncQdrantClient | None:
+    """
+    Async client of the vector store, for the async retrieval methods.
+
+    Only a Qdrant server (`QDRANT_URL`) gets one: the embedded store at `path` already has
+    its single handle per process, which async callers run in a worker thread instead.
+    """
+    load_dotenv()
+    url = os.environ.get("QDRANT_URL")
+    if not url:
+        return None
+    return _get_or_create(
+        ("async_qdrant", url), lambda: AsyncQdrantClient(url=url, prefer_grpc=True)
+    )
+
+
+def shutdown():
+    """Flush Langfuse and close every shared client."""
+    with _lock:
+        resources = dict(_resources)
+        _resources.clear()
+    if "langfuse" in resources:
+        resources["langfuse"].flush()
+        resources["langfuse"].shutdown()
+    for key, resource in resources.items():
+        if isinstance(key, tuple) and key[0] == "qdrant":
+            resource.close()
+    if "http_client" in resources:
+        resources["http_client"].close()
+    # The async clients can only be closed from a running loop, at exit their sockets are simply released
+
+
+atexit.register(shutdown)
@@ -0,0 +1,293 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from time import perf_counter
+
+from langchain_core.documents import Document
+from langchain_qdrant import QdrantVectorStore
+from langfuse import get_client
+from qdrant_client import AsyncQdrantClient, models
+from utils.instrumentation import PIPELINE_METRICS
+
+# Same constant as Qdrant's server-side RRF, so the default fusion gives the same ranking
+RRF_K = 2
+DENSE_WEIGHT = 1.0
+SPARSE_WEIGHT = 1.0
+# Threads of the sparse leg, i.e. concurrent sync searches; they are started on demand
+MAX_WORKERS = 32
+
+
+def reciprocal_rank_fusion(
+    rankings: list[list], weights: list[float], k: int = RRF_K, limit: int = None
+) -> list[tuple]:
+    """
+    Weighted reciprocal rank fusion of several rankings of Qdrant points.
+
+    Each point scores `sum(weight / (k + rank))` over the rankings it appears in (rank
+    starting at 0). Ties keep the order in which points were first seen.
+
+    Returns:
+        List of (point, fused score), best first
+    """
+    scores, points = {}, {}
+    for ranking, weight in zip(rankings, weights):
+        for rank, point in enumerate(ranking):
+            points.setdefault(point.id, point)
+            scores[point.id] = scores.get(point.id, 0.0) + weight / (k + rank)
+    fused = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:limit]
+    return [(points[point_id], score) for point_id, score in fused]
+
+
+class ParallelHybridRetriever:
+    """
+    Hybrid retriever computing the dense and sparse query vectors concurrently.
+
+    The remote dense embedding runs in the calling thread while the local BM25 encoding
+    runs in a thread of a pool of `max_workers`, sized to the number of concurrent
+    callers (e.g. the `max_concurrency` of `get_responses`) so that they do not queue
+    for it. Both searches go to Qdrant in a single batch request, and the rankings are
+    fused locally with a tunable weighted RRF. It exposes
+    `similarity_search_with_relevance_scores` and its async version, so it can replace
+    the vector store in `RagConversation`.
+    """
+
+    def __init__(
+        self,
+        vector_store: QdrantVectorStore,
+        rrf_k: int = RRF_K,
+        dense_weight: float = DENSE_WEIGHT,
+        sparse_weight: float = SPARSE_WEIGHT,
+        candidates: int = None,
+        async_client: AsyncQdrantClient = None,
+        search_params: models.SearchParams = None,
+        max_workers: int = MAX_WORKERS,
+    ):
+        self.vector_store = vector_store
+        # Of the dense leg, see `quantization_search_params`
+        self.search_params = search_params
+        # Used by the async methods, see `get_async_qdrant_client`
+        self.async_client = async_client
+        self.rrf_k = rrf_k
+        self.dense_weight = dense_weight
+        self.sparse_weight = sparse_weight
+        self.candidates = candidates
+        self.executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="hybrid-retriever"
+        )
+        self.last_timings = {}
+
+    @staticmethod
+    def _timed(func, *args):
+        start_time = perf_counter()
+        result = func(*args)
+        return result, perf_counter() - start_time
+
+    def _search_requests(self, dense_vector, sparse_vector, limit: int, filter=None):
+        return [
+            models.QueryRequest(
+                query=dense_vector,
+                using=self.vector_store.vector_name,
+                filter=filter,
+                params=self.search_params,
+                limit=limit,
+                with_payload=True,
+            ),
+            models.QueryRequest(
+                query=models.SparseVector(
+                    indices=sparse_vector.indices, values=sparse_vector.values
+                ),
+                using=self.vector_store.sparse_vector_name,
+                filter=filter,
+                limit=limit,
+                with_payload=True,
+            ),
+        ]
+
+    def _embed_dense(self, queries: list[str]):
+        if len(queries) == 1:
+            return [self.vector_store.embeddings.embed_query(queries[0])]
+        # A single embedding request for the whole batch
+        return self.vector_store.embeddings.embed_documents(queries)
+
+    def _embed_sparse(self, queries: list[str]):
+        # BM25 query vectors differ from document vectors, so embed_documents cannot be used
+        return [
+            self.vector_store.sparse_embeddings.embed_query(query) for query in queries
+        ]
+
+    async def _aembed_dense(self, queries: list[str]):
+        if len(queries) == 1:
+            return [await self.vector_store.embeddings.aembed_query(queries[0])]
+        return await self.vector_store.embeddings.aembed_documents(queries)
+
+    async def _atimed(self, coroutine):
+        start_time = perf_counter()
+        result = await coroutine
+        return result, perf_counter() - start_time
+
+    def _batch_requests(
+        self, dense_vectors, sparse_vectors, k: int, filter=None
+    ) -> list[models.QueryRequest]:
+        # Both legs of every query go to Qdrant in a single batch request
+        return [
+            request
+            for dense_vector, sparse_vector in zip(dense_vectors, sparse_vectors)
+            for request in self._search_requests(
+                dense_vector, sparse_vector, self.candidates or k, filter
+            )
+        ]
+
+    def _fuse(self, responses, k: int) -> list[list[tuple[Document, float]]]:
+        results = []
+        for dense_response, sparse_response in zip(responses[::2], responses[1::2]):
+            fused = reciprocal_rank_fusion(
+                [dense_response.points, sparse_response.points],
+                weights=[self.dense_weight, self.sparse_weight],
+                k=self.rrf_k,
+                limit=k,
+            )
+            results.append(
+                [
+                    (
+                        QdrantVectorStore._document_from_point(
+                            point,
+                            self.vector_store.collection_name,
+                            self.vector_store.content_payload_key,
+                            self.vector_store.metadata_payload_key,
+                        ),
+                        score,
+                    )
+                    for point, score in fused
+                ]
+            )
+        return results
+
+    def _record_timings(
+        self,
+        dense_embed_time: float,
+        sparse_embed_time: float,
+        search_time: float,
+        total_time: float,
+        n_queries: int,
+    ):
+        timings = {
+            "dense_embedding": dense_embed_time,
+            "sparse_embedding": sparse_embed_time,
+            "search": search_time,
+            "total": total_time,
+            "queries": n_queries,
+        }
+        self.last_timings = timings
+        PIPELINE_METRICS.observe("dense_embedding", dense_embed_time)
+        PIPELINE_METRICS.observe("sparse_embedding", sparse_embed_time)
+        PIPELINE_METRICS.observe("search", search_time)
+        get_client().update_current_span(metadata={"latency": timings})
+
+    def batch_similarity_search_with_score(
+        self, queries: list[str], k: int = 4, filter=None
+    ) -> list[list[tuple[Document, float]]]:
+        """Documents and fused RRF scores of the `k` best chunks of each query."""
+        start_time = perf_counter()
+        sparse_future = self.executor.submit(self._timed, self._embed_sparse, queries)
+        dense_vectors, dense_embed_time = self._timed(self._embed_dense, queries)
+        sparse_vectors, sparse_embed_time = sparse_future.result()
+
+        search_start = perf_counter()
+        responses = self.vector_store.client.query_batch_points(
+            collection_name=self.vector_store.collection_name,
+            requests=self._batch_requests(dense_vectors, sparse_vectors, k, filter),
+        )
+        search_time = perf_counter() - search_start
+
+        results = self._fuse(responses, k)
+        self._record_timings(
+            dense_embed_time,
+            sparse_embed_time,
+            search_time,
+            perf_counter() - start_time,
+            len(queries),
+        )
+        return results
+
+    async def abatch_similarity_search_with_score(
+        self, queries: list[str], k: int = 4, filter=None
+    ) -> list[list[tuple[Document, float]]]:
+        """
+        Async version of `batch_similarity_search_with_score`, which never blocks the loop.
+
+        The dense embedding is an async API call, the CPU-bound BM25 encoding runs in a
+        thread meanwhile, and the search goes through `async_client` (or the sync handle
+        in a thread, for the embedded store).
+        """
+        start_time = perf_counter()
+        (
+            (dense_vectors, dense_embed_time),
+            (
+                sparse_vectors,
+                sparse_embed_time,
+            ),
+        ) = await asyncio.gather(
+            self._atimed(self._aembed_dense(queries)),
+            self._atimed(asyncio.to_thread(self._embed_sparse, queries)),
+        )
+
+        search_start = perf_counter()
+        requests = self._batch_requests(dense_vectors, sparse_vectors, k, filter)
+        if self.async_client is not None:
+            responses = await self.async_client.query_batch_points(
+                collection_name=self.vector_store.collection_name, requests=requests
+            )
+        else:
+            responses = await asyncio.to_thread(
+                self.vector_store.client.query_batch_points,
+                collection_name=self.vector_store.collection_name,
+                requests=requests,
+            )
+        search_time = perf_counter() - search_start
+
+        results = self._fuse(responses, k)
+        self._record_timings(
+            dense_embed_time,
+            sparse_embed_time,
+            search_time,
+            perf_counter() - start_time,
+            len(queries),
+        )
+        return results
+
+    def similarity_search_with_score(
+        self, query: str, k: int = 4, filter=None
+    ) -> list[tuple[Document, float]]:
+        """Documents and fused RRF scores of the `k` best chunks."""
+        return self.batch_similarity_search_with_score([query], k=k, filter=filter)[0]
+
+    def similarity_search_with_relevance_scores(self, query: str, k: int = 4, **kwargs):
+        """Same scores as `QdrantVectorStore.similarity_search_with_relevance_scores` in hybrid mode."""
+        relevance_score_fn = self.vector_store._select_relevance_score_fn()
+        return [
+            (doc, relevance_score_fn(score))
+            for doc, score in self.similarity_search_with_score(query, k=k, **kwargs)
+        ]
+
+    def batch_similarity_search_with_relevance_scores(
+        self, queries: list[str], k: int = 4, **kwargs
+    ):
+        """Batch version of `similarity_search_with_relevance_scores`."""
+        relevance_score_fn = self.vector_store._select_relevance_score_fn()
+        return [
+            [(doc, relevance_score_fn(score)) for doc, score in docs_and_scores]
+            for docs_and_scores in self.batch_similarity_search_with_score(
+                queries, k=k, **kwargs
+            )
+        ]
+
+    async def asimilarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs
+    ):
+        """Async version of `similarity_search_with_relevance_scores`."""
+        relevance_score_fn = self.vector_store._select_relevance_score_fn()
+        return [
+            (doc, relevance_score_fn(score))
+            for doc, score in (
+                await self.abatch_similarity_search_with_score([query], k=k, **kwargs)
+            )[0]
+        ]
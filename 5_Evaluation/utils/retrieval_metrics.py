@@ -0,0 +1,134 @@
+from itertools import chain
+
+import numpy as np
+
+
+def _flatten(documents: list[list]) -> tuple[list, np.ndarray]:
+    lengths = np.fromiter(
+        (len(docs or []) for docs in documents), dtype=np.int64, count=len(documents)
+    )
+    return list(chain.from_iterable(docs or [] for docs in documents)), lengths
+
+
+def _pad(codes: np.ndarray, lengths: np.ndarray, value: int) -> np.ndarray:
+    array = np.full(
+        (len(lengths), max(lengths.max(initial=0), 1)), value, dtype=np.int64
+    )
+    rows = np.repeat(np.arange(len(lengths)), lengths)
+    columns = np.arange(len(codes)) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    array[rows, columns] = codes
+    return array
+
+
+def encode_ids(
+    expected_documents: list[list], output_documents: list[list]
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Encode the document ids of a whole run as padded integer arrays.
+
+    Every distinct id gets an integer code. Expected ids are padded with -1 and output ids
+    with -2, so padding never matches. Duplicated expected ids are kept only once, as the
+    set-based `hitrate` does.
+
+    Returns:
+        (expected, output) arrays of shapes (n_items, max_expected) and (n_items, max_output)
+    """
+    expected_ids, expected_lengths = _flatten(expected_documents)
+    output_ids, output_lengths = _flatten(output_documents)
+    all_ids = expected_ids + output_ids
+    if len(set(map(type, all_ids))) <= 1:
+        _, codes = np.unique(np.asarray(all_ids), return_inverse=True)
+    else:
+        # NumPy would cast ids of mixed types to strings, making 1 and "1" the same id
+        vocabulary = {}
+        codes = np.fromiter(
+            (vocabulary.setdefault(doc_id, len(vocabulary)) for doc_id in all_ids),
+            dtype=np.int64,
+            count=len(all_ids),
+        )
+    codes = codes.reshape(-1)
+
+    expected = _pad(codes[: len(expected_ids)], expected_lengths, -1)
+    expected[_seen_before(expected)] = -1
+    output = _pad(codes[len(expected_ids) :], output_lengths, -2)
+    return expected, output
+
+
+def _seen_before(ids: np.ndarray) -> np.ndarray:
+    """Mask of the ids already present at a lower index of their row."""
+    earlier = np.tril(np.ones((ids.shape[1], ids.shape[1]), dtype=bool), k=-1)
+    return ((ids[:, :, None] == ids[:, None, :]) & earlier).any(axis=2)
+
+
+def batch_retrieval_metrics(
+    expected_documents: list[list],
+    output_documents: list[list],
+    ks: list[int] = None,
+) -> dict[str, np.ndarray]:
+    """
+    Compute hitrate@k, recall@k, MRR@k and nDCG@k of a whole run in one vectorized pass.
+
+    Relevance is binary: an output document is relevant if its id is expected. An id that
+    is retrieved several times (e.g. several chunks of the same FAQ) only counts at its
+    first rank. As in `hitrate`, items with no expected and no output documents score 1
+    on every metric, and items with no expected documents but some output score 0.
+
+    Args:
+        expected_documents: Ground truth document ids of each item
+        output_documents: Retrieved document ids of each item, best first
+        ks: Cut-offs, by default 1 up to the longest output
+
+    Returns:
+        Dictionary of metric name to an array of shape (n_items, len(ks))
+        `hitrate[:, j]` equals `hitrate(expected, output[:ks[j]])` for every item.
+    """
+    expected, output = encode_ids(expected_documents, output_documents)
+    n_items, max_output = output.shape
+    ks = np.asarray(ks if ks is not None else range(1, max_output + 1))
+    n_expected = (expected >= 0).sum(axis=1)
+    n_output = (output >= 0).sum(axis=1)
+
+    # relevant[i, r]: the document at rank r is expected and not seen at a better rank
+    relevant = (output[:, :, None] == expected[:, None, :]).any(axis=2)
+    relevant &= ~_seen_before(output)
+
+    # Cumulative values at every rank, then read at each cut-off
+    ranks = np.minimum(ks, max_output) - 1
+    discounts = 1.0 / np.log2(np.arange(max_output) + 2)
+    hits = np.cumsum(relevant, axis=1)[:, ranks]
+    dcg = np.cumsum(relevant * discounts, axis=1)[:, ranks]
+    ideal_discounts = np.concatenate(
+        [[0.0], np.cumsum(1.0 / np.log2(np.arange(ks.max()) + 2))]
+    )
+    idcg = ideal_discounts[np.minimum(n_expected[:, None], ks[None, :])]
+    first_rank = np.where(relevant.any(axis=1), relevant.argmax(axis=1), ks.max())
+    reciprocal_rank = np.where(
+        first_rank[:, None] < ks[None, :], 1.0 / (first_rank[:, None] + 1), 0.0
+    )
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        metrics = {
+            "hitrate": (hits > 0).astype(float),
+            "recall": np.where(
+                n_expected[:, None] > 0, hits / n_expected[:, None], 0.0
+            ),
+            "mrr": reciprocal_rank,
+            "ndcg": np.where(idcg > 0, dcg / idcg, 0.0),
+        }
+    both_empty = (n_expected == 0) & (n_output == 0)
+    for values in metrics.values():
+        values[both_empty] = 1.0
+    return metrics
+
+
+def mean_retrieval_metrics(
+    expected_documents: list[list], output_documents: list[list], ks: list[int] = None
+) -> dict[str, float]:
+    """Averages of `batch_retrieval_metrics` over the items, keyed like `hitrate@4`."""
+    metrics = batch_retrieval_metrics(expected_documents, output_documents, ks)
+    ks = ks if ks is not None else range(1, metrics["hitrate"].shape[1] + 1)
+    return {
+        f"{name}@{k}": float(values[:, j].mean())
+        for name, values in metrics.items()
+        for j, k in enumerate(ks)
+    }
@@ -0,0 +1,348 @@
+import heapq
+import json
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from pathlib import Path
+from time import monotonic, perf_counter
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage
+from langfuse import get_client, observe
+
+SIMILARITY_THRESHOLD = 0.95
+TTL_SECONDS = 24 * 3600
+MAX_ENTRIES = 10_000
+# Rows of the question matrix allocated up front, doubled whenever it is full
+INITIAL_ROWS = 256
+
+
+@dataclass
+class CacheEntry:
+    question: str
+    vector: np.ndarray
+    result: tuple
+    faq_hashes: dict
+    latency: float
+    created_at: float = field(default_factory=monotonic)
+
+
+class SemanticCache:
+    """
+    Cache of RAG answers, looked up by embedding similarity of the question.
+
+    A question hits the cache when its cosine similarity with a cached question is above
+    `threshold`. Entries expire after `ttl_seconds`, the least recently used ones are
+    evicted above `max_entries`, and entries built on FAQs that were re-indexed since
+    (according to the manifest of `index_faq.py`) are dropped. The whole cache is cleared
+    when the collection is rebuilt: the manifest is then deleted (`ingest_faq.py`) or
+    written anew (`index_faq.py`).
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = SIMILARITY_THRESHOLD,
+        ttl_seconds: float = TTL_SECONDS,
+        max_entries: int = MAX_ENTRIES,
+        manifest_path: Path | None = None,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.manifest_path = manifest_path
+
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[int, CacheEntry] = OrderedDict()
+        self._next_key = 0
+        # Normalized question vectors, one row per entry; removed rows are zeroed and
+        # reused, so a lookup is a single product over the rows in use
+        self._matrix = None
+        self._row_keys: list[int | None] = []
+        self._rows: dict[int, int] = {}
+        self._free_rows: list[int] = []
+        # (created_at, key) of every entry, the oldest first, for the TTL expiry
+        self._expiry: list[tuple[float, int]] = []
+        self._manifest_mtime = None
+        self._manifest_created_at = None
+        self._faq_hashes = {}
+        self.hits = 0
+        self.misses = 0
+        self.latency_saved = 0.0
+        self._refresh_manifest()
+
+    def _refresh_manifest(self):
+        """Reload the index manifest if it changed and drop entries of re-indexed FAQs."""
+        if self.manifest_path is None:
+            return
+        if not self.manifest_path.exists():
+            # The collection is being rebuilt from scratch
+            if self._manifest_mtime is not None:
+                self._clear()
+                self._manifest_mtime = self._manifest_created_at = None
+                self._faq_hashes = {}
+            return
+        mtime = self.manifest_path.stat().st_mtime
+        if mtime == self._manifest_mtime:
+            return
+        with open(self.manifest_path, "r") as f:
+            manifest = json.load(f)
+        if (
+            self._manifest_mtime is not None
+            and manifest.get("created_at") != self._manifest_created_at
+        ):
+            self._clear()
+        self._manifest_mtime = mtime
+        self._manifest_created_at = manifest.get("created_at")
+        self._faq_hashes = {
+            faq_id: entry["hash"] for faq_id, entry in manifest["faqs"].items()
+        }
+        stale = [
+            key
+            for key, entry in self._entries.items()
+            if any(
+                self._faq_hashes.get(faq_id) != h
+                for faq_id, h in entry.faq_hashes.items()
+            )
+        ]
+        self._remove(stale)
+
+    def _clear(self):
+        self._remove(list(self._entries))
+
+    def _remove(self, keys):
+        for key in keys:
+            del self._entries[key]
+            row = self._rows.pop(key)
+            # A zero row has a similarity of 0, below any threshold
+            self._matrix[row] = 0.0
+            self._row_keys[row] = None
+            self._free_rows.append(row)
+
+    def _expire(self):
+        """Drop the entries older than the TTL, popped from the oldest."""
+        expired_before = monotonic() - self.ttl_seconds
+        while self._expiry and self._expiry[0][0] < expired_before:
+            _, key = heapq.heappop(self._expiry)
+            if key in self._entries:
+                self._remove([key])
+
+    def _store(self, key: int, vector: np.ndarray):
+        if self._free_rows:
+            row = self._free_rows.pop()
+        else:
+            row = len(self._row_keys)
+            self._row_keys.append(None)
+            if self._matrix is None:
+                self._matrix = np.zeros((INITIAL_ROWS, len(vector)), dtype=np.float32)
+            elif row == len(self._matrix):
+                self._matrix = np.concatenate(
+                    [self._matrix, np.zeros_like(self._matrix)]
+                )
+        self._matrix[row] = vector
+        self._row_keys[row] = key
+        self._rows[key] = row
+
+    @staticmethod
+    def _normalize(vector) -> np.ndarray:
+        vector = np.asarray(vector, dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def invalidate(self, faq_ids):
+        """Drop every cached answer built on one of the given FAQs."""
+        faq_ids = {str(faq_id) for faq_id in faq_ids}
+        with self._lock:
+            self._remove(
+                [
+                    key
+                    for key, entry in self._entries.items()
+                    if faq_ids & entry.faq_hashes.keys()
+                ]
+            )
+
+    def lookup(
+        self, question: str, vector=None
+    ) -> tuple[CacheEntry | None, np.ndarray, float]:
+        """
+        Find the closest cached question.
+
+        Returns:
+            The matching entry (None on a miss), the normalized question vector and the similarity
+        """
+        vector = self._normalize(
+            self.embeddings.embed_query(question) if vector is None else vector
+        )
+        with self._lock:
+            self._refresh_manifest()
+            self._expire()
+            if not self._entries:
+                self.misses += 1
+                return None, vector, 0.0
+
+            similarities = self._matrix[: len(self._row_keys)] @ vector
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity < self.threshold:
+                self.misses += 1
+                return None, vector, similarity
+
+            key = self._row_keys[best]
+            entry = self._entries[key]
+            self._entries.move_to_end(key)
+            self.hits += 1
+            self.latency_saved += entry.latency
+            return entry, vector, similarity
+
+    def add(self, question: str, vector: np.ndarray, result: tuple, latency: float):
+        """Cache the `(response, docs, scores)` result of a question."""
+        _, docs, _ = result
+        with self._lock:
+            faq_hashes = {
+                str(doc.metadata["faq_id"]): self._faq_hashes.get(
+                    str(doc.metadata["faq_id"])
+                )
+                for doc in docs
+            }
+            key = self._next_key
+            self._next_key += 1
+            entry = CacheEntry(question, vector, result, faq_hashes, latency)
+            self._entries[key] = entry
+            self._store(key, vector)
+            heapq.heappush(self._expiry, (entry.created_at, key))
+            if len(self._expiry) > 2 * self.max_entries:
+                # Drop the items of the entries evicted or invalidated in the meantime
+                self._expiry = [(e.created_at, k) for k, e in self._entries.items()]
+                heapq.heapify(self._expiry)
+            while len(self._entries) > self.max_entries:
+                # The least recently used one
+                self._remove([next(iter(self._entries))])
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "latency_saved_seconds": round(self.latency_saved, 3),
+            "entries": len(self._entries),
+        }
+
+
+def messages_from_chat_history(history: list[dict]) -> list[BaseMessage]:
+    """
+    Convert the history of a Gradio chat session to LangChain messages.
+
+    Gradio passes the history as `{"role", "content"}` dicts, the content being a string
+    or a list of parts; only the text parts are kept.
+    """
+    messages = []
+    for message in history:
+        content = message["content"]
+        if not isinstance(content, str):
+            parts = content if isinstance(content, list) else [content]
+            content = "".join(
+                part.get("text", "") if isinstance(part, dict) else str(part)
+                for part in parts
+            )
+        if message["role"] == "user":
+            messages.append(HumanMessage(content=content))
+        elif message["role"] == "assistant":
+            messages.append(AIMessage(content=content))
+    return messages
+
+
+class CachedRagConversation:
+    """
+    Semantic cache in front of `RagConversation.get_response`.
+
+    Only meant for single-turn questions: a cached answer was generated without any
+    history, so the cache is bypassed once the conversation has one. When the
+    conversation records its turns, the ones answered from the cache are recorded too.
+
+    The cache can be shared by several conversations, e.g. one per chat session, so the
+    opening question of a new session is answered from the ones asked before.
+
+    Example:
+        semantic_cache = SemanticCache(embeddings, manifest_path=get_manifest_path())
+        rag_conversation = CachedRagConversation(
+            RagConversation(vector_store, llm, messages_from_chat_history(history)),
+            semantic_cache,
+        )
+        response, docs, scores = rag_conversation.get_response("How do I post an ad?")
+    """
+
+    def __init__(self, rag_conversation, cache: SemanticCache):
+        self.rag_conversation = rag_conversation
+        self.cache = cache
+        # Whether the conversation appends its turns to its history, seen on a miss
+        self._records_turns = False
+
+    def _history_length(self) -> int:
+        return len(getattr(self.rag_conversation, "history", None) or [])
+
+    def _add_turn(self, question: str, response: str):
+        """Record a turn answered from the cache as the conversation records its own."""
+        if self._records_turns:
+            self.rag_conversation.add_message(HumanMessage(content=question))
+            self.rag_conversation.add_message(AIMessage(content=response))
+
+    @observe(name="semantic-cache")
+    def get_response(self, question):
+        if self._history_length():
+            get_client().update_current_span(metadata={"cache_bypassed": "history"})
+            return self.rag_conversation.get_response(question)
+
+        entry, vector, similarity = self.cache.lookup(question)
+        if entry is not None:
+            result = entry.result
+            self._add_turn(question, result[0])
+        else:
+            start_time = perf_counter()
+            result = self.rag_conversation.get_response(question)
+            self._records_turns = self._history_length() > 0
+            self.cache.add(
+                question, vector, result, latency=perf_counter() - start_time
+            )
+
+        self._record(entry, similarity)
+        return result
+
+    @observe(
+        name="semantic-cache",
+        transform_to_string=lambda items: items[-1][0] if items else "",
+    )
+    def get_response_stream(self, question):
+        """Streaming variant of `get_response`, a cache hit yields the whole response at once."""
+        if self._history_length():
+            get_client().update_current_span(metadata={"cache_bypassed": "history"})
+            yield from self.rag_conversation.get_response_stream(question)
+            return
+
+        entry, vector, similarity = self.cache.lookup(question)
+        self._record(entry, similarity)
+        if entry is not None:
+            self._add_turn(question, entry.result[0])
+            yield entry.result
+            return
+
+        start_time = perf_counter()
+        result = None
+        for result in self.rag_conversation.get_response_stream(question):
+            yield result
+        self._records_turns = self._history_length() > 0
+        if result is not None:
+            self.cache.add(
+                question, vector, result, latency=perf_counter() - start_time
+            )
+
+    def _record(self, entry: CacheEntry | None, similarity: float):
+        get_client().update_current_span(
+            metadata={
+                "cache_hit": entry is not None,
+                "similarity": similarity,
+                "cached_question": entry.question if entry is not None else None,
+                "semantic_cache": self.cache.stats(),
+            }
+        )
@@ -0,0 +1,33 @@
+from functools import lru_cache
+
+import tiktoken
+
+# o200k_base is the encoding of the gpt-5 / gpt-4.1 models, cl100k_base the one of text-embedding-3-*
+ENCODING_NAME = "o200k_base"
+TOKEN_CACHE_SIZE = 65_536
+
+
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = ENCODING_NAME) -> tiktoken.Encoding:
+    """Load a tiktoken encoding once per process."""
+    return tiktoken.get_encoding(encoding_name)
+
+
+@lru_cache(maxsize=TOKEN_CACHE_SIZE)
+def count_tokens(text: str, encoding_name: str = ENCODING_NAME) -> int:
+    """
+    Exact number of tokens of a text, memoized.
+
+    The text splitter measures the same splits and merged pieces again and again while it
+    builds chunks, so most calls are cache hits.
+    """
+    return len(get_encoding(encoding_name).encode(text, disallowed_special=()))
+
+
+def token_length_function(encoding_name: str = ENCODING_NAME):
+    """Length function counting `encoding_name` tokens, to plug into a text splitter."""
+
+    def token_length(text: str) -> int:
+        return count_tokens(text, encoding_name)
+
+    return token_length
@@ -0,0 +1,167 @@
+"""
+Cold start of the RAG pipeline: startup-time breakdown and background warm-up.
+
+The first query of a fresh process pays for everything that is loaded on first use: the
+BM25 model of `FastEmbedSparse`, the segments of the embedded Qdrant store, the
+connection to the OpenAI API, the cross-encoder of the rerank stage and, for the
+evaluation, the ragas judge. `start_warm_up` runs a synthetic query through each of them
+in a background thread while the process finishes its startup, so that the first real
+request is as fast as the next ones. `StartupProfile` times each phase of the startup,
+in the foreground and in the warm-up thread, and prints the breakdown.
+"""
+
+import threading
+from concurrent.futures import Future
+from time import perf_counter
+
+from utils.instrumentation import PIPELINE_METRICS, StageTimer
+from utils.metrics import get_judge
+
+WARM_UP_QUERY = "How do I post an ad?"
+
+
+class StartupProfile:
+    """
+    Wall time of each phase of the startup, thread-safe.
+
+    Phases are also recorded in `PIPELINE_METRICS` under `startup_<phase>`.
+
+    Example:
+        profile = StartupProfile()
+        with profile.phase("vector_store"):
+            vector_store = load_vector_store()
+        start_warm_up(vector_store, profile=profile)
+        print(profile.summary())
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Insertion ordered, phase -> seconds
+        self.phases: dict[str, float] = {}
+        self.background: dict[str, float] = {}
+        self.errors: dict[str, str] = {}
+
+    def observe(self, name: str, seconds: float, background: bool = False):
+        with self._lock:
+            phases = self.background if background else self.phases
+            phases[name] = phases.get(name, 0.0) + seconds
+        PIPELINE_METRICS.observe(f"startup_{name}", seconds)
+
+    def phase(self, name: str) -> StageTimer:
+        """Context manager recording the duration of its block as the phase `name`."""
+        return StageTimer(self, name)
+
+    def fail(self, name: str, error: Exception):
+        with self._lock:
+            self.errors[name] = f"{type(error).__name__}: {error}"
+
+    def summary(self) -> str:
+        """One line per phase, the foreground ones first, then those of the warm-up."""
+        with self._lock:
+            phases, background = dict(self.phases), dict(self.background)
+            errors = dict(self.errors)
+        total = sum(phases.values())
+        lines = [
+            f"{name:<26} {seconds * 1000:8.1f} ms  {seconds / (total or 1):6.1%}"
+            for name, seconds in phases.items()
+        ]
+        lines.append(f"{'ready after':<26} {total * 1000:8.1f} ms")
+        lines += [
+            f"{'warm-up ' + name:<26} {seconds * 1000:8.1f} ms  (background)"
+            + (f"  failed: {errors[name]}" if name in errors else "")
+            for name, seconds in background.items()
+        ]
+        return "\n".join(lines)
+
+
+def warm_up(
+    vector_store,
+    retriever=None,
+    llm=None,
+    judge: bool = False,
+    query: str = WARM_UP_QUERY,
+    profile: StartupProfile = None,
+) -> StartupProfile:
+    """
+    Run `query` through every component that loads on first use, one after the other.
+
+    The sparse and dense query embeddings come first so that their load times show up
+    apart from the search; the dense one skips a `CachedEmbeddings` cache, where the
+    query is a hit from the second run on and would not open the connection.
+    `retriever` (the vector store by default) then loads the Qdrant segments and, for a
+    `RerankingRetriever`, the cross-encoder. With `llm`, the
+    keep-alive connection of the synchronous OpenAI client is opened with a free model
+    listing; it is the one of the embeddings too. With `judge`, the ragas judge is
+    built. A component that fails is reported in `profile.errors` and skipped: the
+    first request will load it instead. The query is not recorded in the stage
+    histograms of `PIPELINE_METRICS`, only in the `startup_*` ones.
+    """
+    profile = profile if profile is not None else StartupProfile()
+    retriever = retriever if retriever is not None else vector_store
+    # The embedding model wrapped by `CachedEmbeddings`, to reach the API uncached
+    dense_embeddings = getattr(
+        vector_store.embeddings, "embeddings", vector_store.embeddings
+    )
+    steps = [
+        ("sparse_model", lambda: vector_store.sparse_embeddings.embed_query(query)),
+        ("dense_embedding", lambda: dense_embeddings.embed_query(query)),
+        (
+            "retrieval",
+            lambda: retriever.similarity_search_with_relevance_scores(query, k=1),
+        ),
+    ]
+    if getattr(llm, "root_client", None) is not None:
+        steps.append(("llm_connection", lambda: llm.root_client.models.list()))
+    if judge:
+        steps.append(("judge", get_judge))
+
+    for name, step in steps:
+        start_time = perf_counter()
+        try:
+            with PIPELINE_METRICS.paused():
+                step()
+        except Exception as error:
+            profile.fail(name, error)
+        profile.observe(name, perf_counter() - start_time, background=True)
+    return profile
+
+
+def start_warm_up(vector_store, **kwargs) -> Future:
+    """
+    `warm_up` in a daemon thread, the future resolves to its `StartupProfile`.
+
+    Requests that come in before it is done run alongside it; to keep the first
+    request as fast as the next ones, wait for the future before serving.
+    """
+    future = Future()
+
+    def run():
+        try:
+            future.set_result(warm_up(vector_store, **kwargs))
+        except BaseException as error:
+            future.set_exception(error)
+
+    threading.Thread(target=run, name="rag-warm-up", daemon=True).start()
+    return future
+
+
+async def awarm_up_connection(llm) -> float | None:
+    """
+    Open the keep-alive connection of the async OpenAI client of `llm`.
+
+    It must run in the event loop that serves the requests: the async connections are
+    bound to the loop that opened them, so `warm_up` cannot open them from its thread.
+
+    Returns:
+        The seconds it took, None if `llm` has no async OpenAI client or the call failed
+    """
+    client = getattr(llm, "root_async_client", None)
+    if client is None:
+        return None
+    start_time = perf_counter()
+    try:
+        await client.models.list()
+    except Exception:
+        # Not worth failing the startup for, the first request opens it instead
+        return None
+    return perf_counter() - start_time